@@ -17,11 +17,26 @@ import ctypes
 import numpy as np
 from PIL import Image
 import io
+import re
+import asyncio
+import copy
+import struct
 import time
 import threading
+import queue
+import uuid
+import bisect
+import math
+import contextlib
+from collections import OrderedDict, deque
 import os
 import platform
-from datetime import datetime
+import atexit
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+from datetime import datetime, timezone
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
 
 app = Flask(__name__)
 CORS(app)
@@ -29,6 +44,9 @@ CORS(app)
 # Load ASI Camera library
 asi_lib = None
 
+# Camera backend: 'sdk' loads libASICamera2, 'simulator' uses SimulatedASILibrary (no camera needed)
+ASI_BACKEND = os.environ.get('ASI_CAMERA_BACKEND', 'sdk').lower()
+
 # Detect system architecture and build library paths
 def get_library_paths():
     """Detect system architecture and return appropriate SDK library paths"""
@@ -75,7 +93,7 @@ def get_library_paths():
     
     return paths
 
-lib_paths = get_library_paths()
+lib_paths = get_library_paths() if ASI_BACKEND == 'sdk' else []
 
 print(f"Detected architecture: {platform.machine()}")
 print(f"Trying to load ASI Camera library from {len(lib_paths)} possible paths...")
@@ -91,7 +109,7 @@ for lib_path in lib_paths:
     except Exception as e:
         print(f"Failed to load {lib_path}: {e}")
 
-if asi_lib is None:
+if asi_lib is None and ASI_BACKEND == 'sdk':
     print("ERROR: Could not load ASI Camera library")
     print("Please ensure:")
     print("1. ASI Camera SDK is installed")
@@ -110,6 +128,12 @@ ASI_IMG_RGB24 = 1
 ASI_IMG_RAW16 = 2
 ASI_IMG_Y8 = 3
 
+# Bayer patterns (ASI_CAMERA_INFO.BayerPattern)
+ASI_BAYER_RG = 0
+ASI_BAYER_BG = 1
+ASI_BAYER_GR = 2
+ASI_BAYER_GB = 3
+
 # Control types (IMPORTANT: Order from header file)
 ASI_GAIN = 0
 ASI_EXPOSURE = 1
@@ -127,13 +151,490 @@ ASI_AUTO_TARGET_BRIGHTNESS = 12
 ASI_HARDWARE_BIN = 13
 ASI_HIGH_SPEED_MODE = 14
 
-# Camera state
-camera_state = {
+# Exposure status
+ASI_EXP_IDLE = 0
+ASI_EXP_WORKING = 1
+ASI_EXP_SUCCESS = 2
+ASI_EXP_FAILED = 3
+EXP_STATUS_NAMES = {ASI_EXP_IDLE: "ASI_EXP_IDLE", ASI_EXP_WORKING: "ASI_EXP_WORKING",
+                    ASI_EXP_SUCCESS: "ASI_EXP_SUCCESS", ASI_EXP_FAILED: "ASI_EXP_FAILED"}
+
+# Exposure engine timing: sleep until this long before the expected end of an exposure, then
+# poll finely; long exposures still check for failure at least once per coarse step
+EXPOSURE_POLL_LEAD = 0.02  # seconds
+EXPOSURE_POLL_INTERVAL = 0.002  # seconds
+EXPOSURE_COARSE_STEP = 1.0  # seconds
+EXPOSURE_TIMEOUT_MARGIN = 5.0  # seconds past the expected end before giving up
+
+# Error codes
+ASI_ERROR_INVALID_INDEX = 1
+ASI_ERROR_INVALID_ID = 2
+ASI_ERROR_INVALID_CONTROL_TYPE = 3
+ASI_ERROR_CAMERA_CLOSED = 4
+ASI_ERROR_CAMERA_REMOVED = 5
+ASI_ERROR_INVALID_SIZE = 8
+ASI_ERROR_INVALID_IMGTYPE = 9
+ASI_ERROR_OUTOF_BOUNDARY = 10
+ASI_ERROR_TIMEOUT = 11
+ASI_ERROR_INVALID_SEQUENCE = 12
+ASI_ERROR_BUFFER_TOO_SMALL = 13
+ASI_ERROR_VIDEO_MODE_ACTIVE = 14
+ASI_ERROR_EXPOSURE_IN_PROGRESS = 15
+ASI_ERROR_GENERAL_ERROR = 16
+ASI_ERROR_NAMES = {code: name for name, code in globals().items() if name.startswith('ASI_ERROR_') and isinstance(code, int)}
+
+class ASI_CONTROL_CAPS(ctypes.Structure):
+    """Control description returned by ASIGetControlCaps"""
+    _fields_ = [
+        ("Name", ctypes.c_char * 64),
+        ("Description", ctypes.c_char * 128),
+        ("MaxValue", ctypes.c_long),
+        ("MinValue", ctypes.c_long),
+        ("DefaultValue", ctypes.c_long),
+        ("IsAutoSupported", ctypes.c_int),
+        ("IsWritable", ctypes.c_int),
+        ("ControlType", ctypes.c_int),
+        ("Unused", ctypes.c_char * 32),
+    ]
+
+# Controls that change the sensor readout mode: writing them needs video capture restarted
+STREAM_RESTART_CONTROLS = (ASI_HARDWARE_BIN, ASI_HIGH_SPEED_MODE)
+
+# Read every control back after writing it and log the value the camera reports (debugging only,
+# each read-back is an extra USB round trip)
+CONTROL_READBACK = os.environ.get('ASI_CONTROL_READBACK', '0') == '1'
+
+class SimulatedASILibrary:
+    """Hardware-free stand-in for libASICamera2 with the call surface this service uses
+
+    Renders a synthetic star field with sensor noise at a configurable frame rate and can
+    inject faults (failed exposures, video timeouts, camera removal) and meteor streaks, so the streaming,
+    snapshot and sequence paths can be exercised and load-tested on any Linux box.
+    Pointer arguments are the same ctypes.byref()/buffer objects passed to the real SDK.
+    """
+    FAULTS = ('exp_failed', 'stuck', 'timeout', 'removed', 'meteor')
+    BYTES_PER_PIXEL = {ASI_IMG_RAW8: 1, ASI_IMG_RGB24: 3, ASI_IMG_RAW16: 2, ASI_IMG_Y8: 1}
+    SUPPORTED_BINS = (1, 2, 4)
+    # Control defaults and ranges: control -> (default, min, max)
+    CONTROLS = {
+        ASI_GAIN: (50, 0, 300),
+        ASI_EXPOSURE: (10000, 32, 2000000000),
+        ASI_GAMMA: (50, 1, 100),
+        ASI_WB_R: (52, 1, 99),
+        ASI_WB_B: (95, 1, 99),
+        ASI_BRIGHTNESS: (1, 0, 100),
+        ASI_BANDWIDTHOVERLOAD: (50, 40, 100),
+        ASI_TEMPERATURE: (215, -500, 1000),
+        ASI_FLIP: (0, 0, 3),
+        ASI_AUTO_MAX_GAIN: (150, 0, 300),
+        ASI_AUTO_MAX_EXP: (100000, 1000, 60000000),
+        ASI_AUTO_TARGET_BRIGHTNESS: (100, 50, 160),
+        ASI_HARDWARE_BIN: (0, 0, 1),
+        ASI_HIGH_SPEED_MODE: (0, 0, 1),
+    }
+    # Control name, description, auto supported, writable - as reported by ASIGetControlCaps
+    CONTROL_INFO = {
+        ASI_GAIN: ("Gain", "Gain", True, True),
+        ASI_EXPOSURE: ("Exposure", "Exposure Time(us)", True, True),
+        ASI_GAMMA: ("Gamma", "Gamma", False, True),
+        ASI_WB_R: ("WB_R", "White balance: Red component", True, True),
+        ASI_WB_B: ("WB_B", "White balance: Blue component", True, True),
+        ASI_BRIGHTNESS: ("Offset", "offset", False, True),
+        ASI_BANDWIDTHOVERLOAD: ("BandWidth", "The total data transfer rate percentage", True, True),
+        ASI_TEMPERATURE: ("Temperature", "Sensor temperature(degrees Celsius)", False, False),
+        ASI_FLIP: ("Flip", "Flip: 0->None 1->Horiz 2->Vert 3->Both", False, True),
+        ASI_AUTO_MAX_GAIN: ("AutoExpMaxGain", "Auto exposure maximum gain value", False, True),
+        ASI_AUTO_MAX_EXP: ("AutoExpMaxExpMS", "Auto exposure maximum exposure value(unit ms)", False, True),
+        ASI_AUTO_TARGET_BRIGHTNESS: ("AutoExpTargetBrightness", "Auto exposure target brightness value", False, True),
+        ASI_HARDWARE_BIN: ("HardwareBin", "Is hardware bin2:0->No 1->Yes", False, True),
+        ASI_HIGH_SPEED_MODE: ("HighSpeedMode", "Is high speed mode:0->No 1->Yes", False, True),
+    }
+    
+    def __init__(self, width=1280, height=960, fps=30.0, color=True, num_cameras=1,
+                 num_stars=400, fault_rate=0.0, seed=None):
+        self.max_width = width
+        self.max_height = height
+        self.fps = fps
+        self.color = color
+        self.num_cameras = num_cameras
+        self.fault_rate = fault_rate
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.pending_faults = {fault: 0 for fault in self.FAULTS}
+        self.cameras = {}
+        # Star positions are fractions of the sensor so every ROI/bin shows the same sky
+        self.stars = (self.rng.random(num_stars), self.rng.random(num_stars),
+                      self.rng.pareto(2.0, num_stars).clip(0, 20) / 20 + 0.05,
+                      0.8 + 0.4 * self.rng.random((num_stars, 3)))
+        self.scene_cache = {}
+        self.noise_bank = {}
+    
+    @classmethod
+    def from_environment(cls):
+        """Build a simulator configured by ASI_SIM_* environment variables"""
+        env = os.environ
+        return cls(width=int(env.get('ASI_SIM_WIDTH', 1280)),
+                   height=int(env.get('ASI_SIM_HEIGHT', 960)),
+                   fps=float(env.get('ASI_SIM_FPS', 30)),
+                   color=env.get('ASI_SIM_COLOR', '1') != '0',
+                   num_cameras=int(env.get('ASI_SIM_CAMERAS', 1)),
+                   fault_rate=float(env.get('ASI_SIM_FAULT_RATE', 0)),
+                   seed=int(env['ASI_SIM_SEED']) if 'ASI_SIM_SEED' in env else None)
+    
+    def inject_fault(self, fault, count=1):
+        """Make the next `count` matching calls fail: 'exp_failed', 'timeout' or 'removed'
+        
+        'stuck' makes every exposure fail until the camera is closed and reopened.
+        'meteor' instead draws a moving streak into the next `count` frames.
+        """
+        if fault not in self.pending_faults:
+            raise ValueError(f"Unknown fault '{fault}', expected one of {', '.join(self.FAULTS)}")
+        with self.lock:
+            self.pending_faults[fault] += count
+    
+    def _take_fault(self, fault):
+        with self.lock:
+            if self.pending_faults[fault] > 0:
+                self.pending_faults[fault] -= 1
+                return True
+        return self.fault_rate > 0 and self.rng.random() < self.fault_rate
+    
+    @staticmethod
+    def _deref(ref):
+        """Return the ctypes object behind a ctypes.byref() argument"""
+        return getattr(ref, '_obj', ref)
+    
+    def _camera(self, camera_id):
+        cam = self.cameras.get(camera_id)
+        if cam is None or not cam['open']:
+            return None, ASI_ERROR_CAMERA_CLOSED if 0 <= camera_id < self.num_cameras else ASI_ERROR_INVALID_ID
+        if cam['removed']:
+            return None, ASI_ERROR_CAMERA_REMOVED
+        return cam, ASI_SUCCESS
+    
+    # Camera discovery and lifecycle
+    
+    def ASIGetNumOfConnectedCameras(self):
+        return self.num_cameras
+    
+    def ASIGetCameraProperty(self, info_ref, index):
+        if not 0 <= index < self.num_cameras:
+            return ASI_ERROR_INVALID_INDEX
+        info = self._deref(info_ref)
+        info.Name = f"ZWO ASI Simulator #{index}".encode('utf-8')
+        info.CameraID = index
+        info.MaxWidth = self.max_width
+        info.MaxHeight = self.max_height
+        info.IsColorCam = int(self.color)
+        info.BayerPattern = 0  # RGGB
+        for i, bin_value in enumerate(self.SUPPORTED_BINS):
+            info.SupportedBins[i] = bin_value
+        for i, img_type in enumerate((ASI_IMG_RAW8, ASI_IMG_RGB24, ASI_IMG_RAW16, ASI_IMG_Y8, -1)):
+            info.SupportedVideoFormat[i] = img_type
+        info.PixelSize = 3.75
+        info.IsUSB3Host = 1
+        info.IsUSB3Camera = 1
+        info.ElecPerADU = 1.0
+        info.BitDepth = 12
+        return ASI_SUCCESS
+    
+    def ASIOpenCamera(self, camera_id):
+        if not 0 <= camera_id < self.num_cameras:
+            return ASI_ERROR_INVALID_ID
+        self.cameras[camera_id] = {
+            'open': True, 'removed': False, 'video': False,
+            'width': self.max_width, 'height': self.max_height, 'bin': 1, 'img_type': ASI_IMG_RAW8,
+            'start_x': 0, 'start_y': 0,
+            'controls': {control: [default, False] for control, (default, _, _) in self.CONTROLS.items()},
+            'exp_status': ASI_EXP_IDLE, 'exp_end': 0.0, 'exp_failed': False,
+            'next_frame': 0.0,
+        }
+        return ASI_SUCCESS
+    
+    def ASIInitCamera(self, camera_id):
+        return self._camera(camera_id)[1]
+    
+    def ASICloseCamera(self, camera_id):
+        cam = self.cameras.pop(camera_id, None)
+        return ASI_SUCCESS if cam else ASI_ERROR_INVALID_ID
+    
+    # Format and controls
+    
+    def ASISetROIFormat(self, camera_id, width, height, bin_value, img_type):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        if bin_value not in self.SUPPORTED_BINS or img_type not in self.BYTES_PER_PIXEL:
+            return ASI_ERROR_INVALID_IMGTYPE if bin_value in self.SUPPORTED_BINS else ASI_ERROR_INVALID_SIZE
+        if width % 8 or height % 2 or width * bin_value > self.max_width or height * bin_value > self.max_height:
+            return ASI_ERROR_INVALID_SIZE
+        cam.update(width=width, height=height, bin=bin_value, img_type=img_type,
+                   start_x=(self.max_width // bin_value - width) // 2,
+                   start_y=(self.max_height // bin_value - height) // 2)
+        return ASI_SUCCESS
+    
+    def ASISetStartPos(self, camera_id, start_x, start_y):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        if (start_x < 0 or start_y < 0 or (start_x + cam['width']) * cam['bin'] > self.max_width
+                or (start_y + cam['height']) * cam['bin'] > self.max_height):
+            return ASI_ERROR_OUTOF_BOUNDARY
+        cam['start_x'], cam['start_y'] = start_x, start_y
+        return ASI_SUCCESS
+    
+    def ASIGetNumOfControls(self, camera_id, count_ref):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        self._deref(count_ref).value = len(self.CONTROLS)
+        return ASI_SUCCESS
+    
+    def ASIGetControlCaps(self, camera_id, control_index, caps_ref):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        if not 0 <= control_index < len(self.CONTROLS):
+            return ASI_ERROR_INVALID_CONTROL_TYPE
+        control = list(self.CONTROLS)[control_index]
+        default, min_value, max_value = self.CONTROLS[control]
+        name, description, auto_supported, writable = self.CONTROL_INFO[control]
+        caps = self._deref(caps_ref)
+        caps.Name = name.encode('utf-8')
+        caps.Description = description.encode('utf-8')
+        caps.MaxValue = max_value
+        caps.MinValue = min_value
+        caps.DefaultValue = default
+        caps.IsAutoSupported = int(auto_supported)
+        caps.IsWritable = int(writable)
+        caps.ControlType = control
+        return ASI_SUCCESS
+    
+    def ASISetControlValue(self, camera_id, control, value, auto):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        if control not in self.CONTROLS:
+            return ASI_ERROR_INVALID_CONTROL_TYPE
+        _, min_value, max_value = self.CONTROLS[control]
+        cam['controls'][control] = [max(min_value, min(max_value, int(value))), bool(auto)]
+        return ASI_SUCCESS
+    
+    def ASIGetControlValue(self, camera_id, control, value_ref, auto_ref):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        if control not in self.CONTROLS:
+            return ASI_ERROR_INVALID_CONTROL_TYPE
+        value, auto = cam['controls'][control]
+        if control == ASI_TEMPERATURE:
+            value += int(self.rng.integers(-3, 4))
+        self._deref(value_ref).value = value
+        self._deref(auto_ref).value = int(auto)
+        return ASI_SUCCESS
+    
+    # Video mode
+    
+    def ASIStartVideoCapture(self, camera_id):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        if cam['exp_status'] == ASI_EXP_WORKING:
+            return ASI_ERROR_EXPOSURE_IN_PROGRESS
+        cam['video'] = True
+        cam['next_frame'] = time.monotonic()
+        cam['dropped'] = 0
+        return ASI_SUCCESS
+    
+    def ASIStopVideoCapture(self, camera_id):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        cam['video'] = False
+        return ASI_SUCCESS
+    
+    def ASIGetVideoData(self, camera_id, buffer_ref, buffer_size, wait_ms, drop_frames_ref=None):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        if not cam['video']:
+            return ASI_ERROR_INVALID_SEQUENCE
+        if self._take_fault('removed'):
+            cam['removed'] = True
+            return ASI_ERROR_CAMERA_REMOVED
+        if self._take_fault('timeout'):
+            time.sleep(wait_ms / 1000.0)
+            return ASI_ERROR_TIMEOUT
+        
+        # Frames arrive every max(1/fps, exposure)
+        exposure_s = cam['controls'][ASI_EXPOSURE][0] / 1000000.0
+        now = time.monotonic()
+        delay = cam['next_frame'] - now
+        if delay > wait_ms / 1000.0:
+            time.sleep(wait_ms / 1000.0)
+            return ASI_ERROR_TIMEOUT
+        period = max(1.0 / self.fps, exposure_s)
+        if delay > 0:
+            time.sleep(delay)
+        elif -delay > period:
+            # Frames read out while nobody collected them are dropped, like the SDK's frame buffer overflowing
+            cam['dropped'] += int(-delay / period)
+        cam['next_frame'] = max(cam['next_frame'], now) + period
+        return self._fill(cam, buffer_ref, buffer_size, exposure_s)
+    
+    def ASIGetDroppedFrames(self, camera_id, drop_ref):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        self._deref(drop_ref).value = cam.get('dropped', 0)
+        return ASI_SUCCESS
+    
+    # Still exposures
+    
+    def ASIStartExposure(self, camera_id, is_dark):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        if cam['video']:
+            return ASI_ERROR_VIDEO_MODE_ACTIVE
+        if cam['exp_status'] == ASI_EXP_WORKING:
+            return ASI_ERROR_EXPOSURE_IN_PROGRESS
+        cam['exp_status'] = ASI_EXP_WORKING
+        cam['exp_end'] = time.monotonic() + cam['controls'][ASI_EXPOSURE][0] / 1000000.0
+        if self._take_fault('stuck'):
+            cam['stuck'] = True
+        cam['exp_failed'] = cam.get('stuck', False) or self._take_fault('exp_failed')
+        return ASI_SUCCESS
+    
+    def ASIStopExposure(self, camera_id):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        cam['exp_status'] = ASI_EXP_IDLE
+        return ASI_SUCCESS
+    
+    def ASIGetExpStatus(self, camera_id, status_ref):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        if cam['exp_status'] == ASI_EXP_WORKING and time.monotonic() >= cam['exp_end']:
+            cam['exp_status'] = ASI_EXP_FAILED if cam['exp_failed'] else ASI_EXP_SUCCESS
+        self._deref(status_ref).value = cam['exp_status']
+        return ASI_SUCCESS
+    
+    def ASIGetDataAfterExp(self, camera_id, buffer_ref, buffer_size):
+        cam, error = self._camera(camera_id)
+        if cam is None:
+            return error
+        if cam['exp_status'] != ASI_EXP_SUCCESS:
+            return ASI_ERROR_GENERAL_ERROR
+        cam['exp_status'] = ASI_EXP_IDLE
+        return self._fill(cam, buffer_ref, buffer_size, cam['controls'][ASI_EXPOSURE][0] / 1000000.0)
+    
+    # Frame synthesis
+    
+    def _scene(self, cam):
+        """Noise-free sky for the current ROI/bin as float32 (height, width, 3), cached per geometry"""
+        key = (cam['width'], cam['height'], cam['bin'], cam['start_x'], cam['start_y'])
+        scene = self.scene_cache.get(key)
+        if scene is None:
+            width, height, bin_value = cam['width'], cam['height'], cam['bin']
+            # Faint sky background brightening towards the horizon (bottom of frame)
+            gradient = np.linspace(0.02, 0.06, height, dtype=np.float32)[:, None, None]
+            scene = np.broadcast_to(gradient, (height, width, 3)).copy()
+            xs, ys, flux, tint = self.stars
+            sx = (xs * self.max_width / bin_value - cam['start_x']).astype(int)
+            sy = (ys * self.max_height / bin_value - cam['start_y']).astype(int)
+            # Stamp each star as a small 3x3 PSF
+            for dy, dx, weight in ((0, 0, 1.0), (-1, 0, 0.35), (1, 0, 0.35), (0, -1, 0.35), (0, 1, 0.35),
+                                   (-1, -1, 0.1), (-1, 1, 0.1), (1, -1, 0.1), (1, 1, 0.1)):
+                px, py = sx + dx, sy + dy
+                visible = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+                np.add.at(scene, (py[visible], px[visible]), (flux[visible, None] * tint[visible] * weight).astype(np.float32))
+            if len(self.scene_cache) > 8:
+                self.scene_cache.clear()
+            self.scene_cache[key] = scene
+        return scene
+    
+    def _noise(self, height, width):
+        """Pre-generated read noise, rolled by a random offset so frames differ without new draws"""
+        noise = self.noise_bank.get((height, width))
+        if noise is None:
+            noise = self.rng.normal(0.0, 1.0, (height, width)).astype(np.float32)
+            self.noise_bank = {(height, width): noise}
+        return np.roll(noise, int(self.rng.integers(0, noise.size)))
+    
+    def _draw_meteor(self, cam, frame):
+        """Draw the next segment of a meteor crossing the frame, starting a new one if none is in flight"""
+        height, width = frame.shape[:2]
+        if cam.get('meteor') is None:
+            angle = self.rng.random() * 2 * np.pi
+            cam['meteor'] = [width * (0.3 + 0.4 * self.rng.random()), height * (0.3 + 0.4 * self.rng.random()),
+                             np.cos(angle) * width / 20, np.sin(angle) * width / 20]
+        x, y, dx, dy = cam['meteor']
+        steps = np.linspace(0.0, 1.0, int(np.hypot(dx, dy)) * 2)
+        xs = np.clip((x + dx * steps).astype(int), 0, width - 2)
+        ys = np.clip((y + dy * steps).astype(int), 0, height - 2)
+        for oy in (0, 1):
+            for ox in (0, 1):
+                frame[ys + oy, xs + ox] = 0.9
+        cam['meteor'] = [x + dx, y + dy, dx, dy]
+    
+    def _fill(self, cam, buffer_ref, buffer_size, exposure_s):
+        width, height, img_type = cam['width'], cam['height'], cam['img_type']
+        needed = width * height * self.BYTES_PER_PIXEL[img_type]
+        if buffer_size < needed:
+            return ASI_ERROR_BUFFER_TOO_SMALL
+        gain = cam['controls'][ASI_GAIN][0]
+        signal = exposure_s * 10.0 * 10 ** (gain / 200.0) * cam['bin'] ** 2
+        frame = self._scene(cam) * signal
+        frame += (self._noise(height, width) * (0.004 * 10 ** (gain / 200.0)))[:, :, None]
+        if self._take_fault('meteor'):
+            self._draw_meteor(cam, frame)
+        else:
+            cam['meteor'] = None
+        np.clip(frame, 0.0, 1.0, out=frame)
+        
+        if img_type == ASI_IMG_RGB24 and self.color:
+            data = (frame * 255).astype(np.uint8)
+        elif img_type in (ASI_IMG_RAW8, ASI_IMG_RAW16) and self.color:
+            # RGGB Bayer mosaic
+            mosaic = np.empty((height, width), dtype=np.float32)
+            mosaic[0::2, 0::2] = frame[0::2, 0::2, 0]
+            mosaic[0::2, 1::2] = frame[0::2, 1::2, 1]
+            mosaic[1::2, 0::2] = frame[1::2, 0::2, 1]
+            mosaic[1::2, 1::2] = frame[1::2, 1::2, 2]
+            data = (mosaic * 255).astype(np.uint8) if img_type == ASI_IMG_RAW8 else (mosaic * 65535).astype('<u2')
+        else:
+            mono = frame.mean(axis=2)
+            if img_type == ASI_IMG_RAW16:
+                data = (mono * 65535).astype('<u2')
+            elif img_type == ASI_IMG_RGB24:
+                data = np.repeat((mono * 255).astype(np.uint8)[:, :, None], 3, axis=2)
+            else:
+                data = (mono * 255).astype(np.uint8)
+        
+        target = np.frombuffer(self._deref(buffer_ref), dtype=np.uint8, count=needed)
+        target[:] = data.reshape(-1).view(np.uint8)
+        return ASI_SUCCESS
+
+if ASI_BACKEND == 'simulator':
+    asi_lib = SimulatedASILibrary.from_environment()
+    print(f"Using simulated ASI camera backend ({asi_lib.max_width} x {asi_lib.max_height} @ {asi_lib.fps} FPS)")
+
+# Initial state of each camera (every ASICamera keeps its own copy in .state)
+CAMERA_STATE_DEFAULTS = {
     'connected': False,
     'streaming': False,
     'camera_id': -1,
-    'width': 1280,
-    'height': 960,
+    'width': 1280,  # Current ROI width in binned pixels
+    'height': 960,  # Current ROI height in binned pixels
+    'max_width': 1280,  # Full sensor width
+    'max_height': 960,  # Full sensor height
+    'bin': 1,  # Hardware binning (1 = none, 2 = 2x2, 4 = 4x4)
+    'start_x': None,  # ROI start position in binned pixels (None = centered)
+    'start_y': None,
+    'supported_bins': [1],
     'exposure': 1000000,  # microseconds - for photo capture only
     'video_exposure': 100000,  # microseconds - max exposure for video streaming (controls frame rate)
     'gain': 50,
@@ -142,34 +643,1025 @@ camera_state = {
     'wb_b': 50,  # White balance blue channel (default, range 0-100)
     'wb_auto': False,  # Auto white balance enabled (default: manual)
     'image_format': ASI_IMG_RGB24,  # Default to RGB24
-    'current_frame': None,
+    'video_format': ASI_IMG_RGB24,  # Stream format: RGB24, or RAW8 (1/3 of the USB bandwidth, demosaiced on the Pi)
+    'frame_seq': 0,  # Sequence number of the newest captured video frame (0 = none yet)
+    'frame_time': None,  # Capture time of the newest video frame (time.time())
+    'dropped_frames': 0,  # Frames the SDK dropped since video capture started
     'error': None
 }
 
-# Sequence capture state
-sequence_state = {
+# Initial sequence capture state of each camera (ASICamera.sequence)
+SEQUENCE_STATE_DEFAULTS = {
     'active': False,
     'save_path': None,
     'total_count': 0,
     'current_count': 0,
     'file_format': 'JPEG',  # JPEG, PNG, or TIFF
     'interval': 0,  # Interval between photos in seconds (0 = fast mode, >0 = time-lapse mode)
+    'mode': 'exposure',  # 'exposure' (single exposures) or 'video' (frames from video mode at the photo exposure)
     'thread': None
 }
 
-class ASICamera:
+# Sequences at or below this photo exposure (μs) are captured from video mode by default
+SEQUENCE_VIDEO_MAX_EXPOSURE = 1000000
+
+# MJPEG stream settings
+STREAM_JPEG_QUALITY = 75
+
+# Stream profiles are snapped to these scales (rounding up) and quality steps so clients share encoders,
+# and at most STREAM_MAX_PROFILES profiles per camera encode at once (later ones reuse the nearest)
+STREAM_SCALES = (1.0, 0.5, 0.25, 0.125, 0.0625)
+STREAM_QUALITY_STEP = 5
+STREAM_MAX_PROFILES = 6
+
+def stream_profile_key(scale, quality):
+    """Snap a requested (scale, quality) stream profile to the shared set of profiles"""
+    scale = min(s for s in STREAM_SCALES if s >= scale * 0.95) if scale < 1.0 else 1.0  # Within 5% counts as a match
+    quality = min(100, max(STREAM_QUALITY_STEP, int(round(quality / STREAM_QUALITY_STEP)) * STREAM_QUALITY_STEP))
+    return scale, quality
+
+# Number of preallocated video frame buffers (one being written, one latest, the rest held by readers)
+FRAME_RING_SLOTS = 4
+
+# Histogram buckets (seconds) for pipeline stages and for switching between video and exposure mode
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MODE_SWITCH_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+# How often the capture loop reads the SDK's dropped-frame count (seconds)
+DROPPED_FRAMES_POLL_INTERVAL = 1.0
+
+class MetricsRegistry:
+    """Counters, gauges and histograms kept in memory and rendered as Prometheus text for /metrics
+    
+    Each update is a dict lookup and a few additions under one lock, cheap enough to leave on for
+    every frame. Collectors registered with add_collector refresh computed gauges (frame rates)
+    right before each scrape.
+    """
     def __init__(self):
+        self.lock = threading.Lock()
+        self.families = OrderedDict()  # name -> {'type', 'help', 'buckets', 'values': {labels: value}}
+        self.collectors = []
+    
+    def _family(self, name, metric_type, help_text, buckets=None):
+        self.families[name] = {'type': metric_type, 'help': help_text, 'buckets': buckets, 'values': {}}
+    
+    def counter(self, name, help_text):
+        self._family(name, 'counter', help_text)
+    
+    def gauge(self, name, help_text):
+        self._family(name, 'gauge', help_text)
+    
+    def histogram(self, name, help_text, buckets):
+        self._family(name, 'histogram', help_text, tuple(buckets))
+    
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+    
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.families[name]['values']
+            values[key] = values.get(key, 0) + amount
+    
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.families[name]['values'][tuple(sorted(labels.items()))] = value
+    
+    def clear(self, name):
+        """Forget every labelled value of a metric (collectors use it to drop departed clients)"""
+        with self.lock:
+            self.families[name]['values'].clear()
+    
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families[name]
+            entry = family['values'].get(key)
+            if entry is None:
+                # Per-bucket counts (made cumulative when rendered), sum, count
+                entry = family['values'][key] = [[0] * len(family['buckets']), 0.0, 0]
+            index = bisect.bisect_left(family['buckets'], value)
+            if index < len(family['buckets']):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+    
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Observe how long the with-block takes"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+    
+    @staticmethod
+    def _labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(pairs, escaped)) + '}'
+    
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"[Metrics] Collector failed: {e}")
+        lines = []
+        with self.lock:
+            for name, family in self.families.items():
+                lines.append(f"# HELP {name} {family['help']}")
+                lines.append(f"# TYPE {name} {family['type']}")
+                for key, value in family['values'].items():
+                    if family['type'] != 'histogram':
+                        lines.append(f"{name}{self._labels(key)} {value:g}")
+                        continue
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(family['buckets'], counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{self._labels(key, [('le', f'{bound:g}')])} {cumulative}")
+                    lines.append(f"{name}_bucket{self._labels(key, [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{self._labels(key)} {total:.6f}")
+                    lines.append(f"{name}_count{self._labels(key)} {count}")
+        return '\n'.join(lines) + '\n'
+
+class RateMeter:
+    """Events per second over the last `window` events (frame rates)"""
+    def __init__(self, window=32, stale_after=2.0):
+        self.times = deque(maxlen=window)
+        self.stale_after = stale_after
+    
+    def tick(self, now=None):
+        self.times.append(time.monotonic() if now is None else now)
+    
+    def rate(self):
+        times = self.times
+        if len(times) < 2 or time.monotonic() - times[-1] > self.stale_after:
+            return 0.0
+        return (len(times) - 1) / max(times[-1] - times[0], 1e-6)
+
+metrics = MetricsRegistry()
+metrics.histogram('camera_stage_seconds', 'Time spent per frame in each pipeline stage '
+                  '(capture = ASIGetVideoData, readout = ASIGetDataAfterExp, convert = demosaic/scale, '
+                  'encode = image encoding, send = socket write to a stream client)', STAGE_BUCKETS)
+metrics.counter('camera_frames_captured_total', 'Video frames captured from the SDK')
+metrics.gauge('camera_capture_fps', 'Video frames captured per second (last 32 frames)')
+metrics.counter('camera_frames_delivered_total', 'MJPEG frames written to stream clients')
+metrics.gauge('camera_stream_clients', 'Connected MJPEG stream clients')
+metrics.gauge('camera_client_fps', 'MJPEG frames per second delivered to each connected stream client')
+metrics.counter('camera_encoder_skipped_frames_total', 'Captured frames not encoded for a stream profile because every encoder was busy')
+metrics.counter('camera_dropped_frames_total', 'Frames the SDK dropped during video capture (ASIGetDroppedFrames)')
+metrics.counter('camera_errors_total', 'Failed SDK calls by function and ASI error code')
+metrics.counter('camera_recoveries_total', 'Supervisor recovery attempts by result')
+metrics.histogram('camera_recovery_seconds', 'Time from fault detection to a recovered camera',
+                  (1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+metrics.histogram('camera_mode_switch_seconds', 'Time to switch the camera between video and exposure mode',
+                  MODE_SWITCH_BUCKETS)
+metrics.histogram('camera_exposure_overrun_seconds', 'Time from the expected end of a snapshot exposure until '
+                  'ASIGetExpStatus reported it finished', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+def count_asi_error(camera, call, code):
+    """Count a failed SDK call in camera_errors_total"""
+    metrics.inc('camera_errors_total', camera=camera.index, call=call, code=code,
+                error=ASI_ERROR_NAMES.get(code, f"UNKNOWN_{code}"))
+    if code in (ASI_ERROR_CAMERA_REMOVED, ASI_ERROR_CAMERA_CLOSED):
+        # The camera is gone (USB glitch) - the supervisor reopens it
+        camera.health['fatal_error'] = code
+
+class FrameSlot:
+    """One preallocated frame buffer in the capture ring"""
+    def __init__(self, ring, index, size):
+        self.ring = ring
+        self.index = index
+        self.buffer = (ctypes.c_ubyte * size)()
+        self.data = np.frombuffer(self.buffer, dtype=np.uint8)  # Zero-copy view of the SDK buffer
+        self.array = None  # Shaped view of data, set when the frame is published
+        self.seq = 0
+        self.timestamp = None
+        self.bayer = None  # Bayer pattern for RAW8 colour frames, None for RGB24/mono
+        self.refs = 0
+    
+    def release(self):
+        """Drop a reader reference taken with FrameRing.wait()"""
+        self.ring.release(self)
+
+class FrameBus:
+    """Latest-value channel: publishers post sequence-numbered items, consumers block until a newer one
+
+    Consumers wake once per published item (or on timeout/interrupt) instead of polling,
+    and always receive the newest item, so a slow consumer skips items rather than queueing them.
+    """
+    def __init__(self, start_seq=0):
+        self.lock = threading.Lock()
+        self.published = threading.Condition(self.lock)
+        self.seq = start_seq
+        self.item = None
+        self.epoch = 0  # Bumped by interrupt() to wake every waiter
+    
+    def publish(self, seq, item):
+        with self.lock:
+            self.seq = seq
+            self.item = item
+            self.published.notify_all()
+    
+    def interrupt(self):
+        """Wake all waiters without publishing (e.g. when the stream stops)"""
+        with self.lock:
+            self.epoch += 1
+            self.published.notify_all()
+    
+    def _take(self, item):
+        """Hook called with the lock held when a waiter receives an item"""
+        return item
+    
+    def _wait_newer(self, after_seq, timeout):
+        epoch = self.epoch
+        self.published.wait_for(lambda: (self.seq > after_seq and self.item is not None) or self.epoch != epoch, timeout)
+        return self.seq > after_seq and self.item is not None
+    
+    def wait(self, after_seq=0, timeout=None):
+        """Block until an item newer than after_seq exists; return (seq, item) or None"""
+        with self.lock:
+            if not self._wait_newer(after_seq, timeout):
+                return None
+            return self.seq, self._take(self.item)
+
+class FrameRing(FrameBus):
+    """Fixed pool of frame buffers reused round-robin by the capture loop
+
+    The SDK writes into a slot nobody is reading, and readers hold a reference on the
+    slot they use, so a published frame is never overwritten while it is being encoded.
+    Published slots are announced on the FrameBus; wait() returns a slot with a reference held.
+    """
+    def __init__(self, num_slots, size, start_seq=0):
+        super().__init__(start_seq)
+        self.size = size
+        self.slot_free = threading.Condition(self.lock)
+        self.slots = [FrameSlot(self, i, size) for i in range(num_slots)]
+        self.next_index = 0
+    
+    def _find_free_slot(self):
+        num_slots = len(self.slots)
+        for offset in range(num_slots):
+            slot = self.slots[(self.next_index + offset) % num_slots]
+            if slot.refs == 0 and slot is not self.item:
+                return slot
+        return None
+    
+    def acquire_write(self, timeout=None):
+        """Return a free slot for the SDK to fill, waiting up to timeout for a reader to release one"""
+        with self.lock:
+            if not self.slot_free.wait_for(lambda: self._find_free_slot() is not None, timeout):
+                return None
+            slot = self._find_free_slot()
+            self.next_index = (slot.index + 1) % len(self.slots)
+            slot.refs = 1  # Held by the writer until published or discarded
+            return slot
+    
+    def publish(self, slot, shape, timestamp, bayer=None):
+        """Make a filled slot the latest frame, wake waiting readers and return its sequence number"""
+        with self.lock:
+            previous = self.item
+            slot.seq = self.seq + 1
+            slot.timestamp = timestamp
+            slot.array = slot.data.reshape(shape)
+            slot.bayer = bayer
+            slot.refs -= 1
+            self.seq = slot.seq
+            self.item = slot
+            self.published.notify_all()
+            if previous is not None and previous.refs == 0:
+                self.slot_free.notify()
+            return slot.seq
+    
+    def discard(self, slot):
+        """Return a slot the SDK failed to fill"""
+        with self.lock:
+            slot.refs -= 1
+            self.slot_free.notify()
+    
+    def _take(self, slot):
+        slot.refs += 1
+        return slot
+    
+    def release(self, slot):
+        with self.lock:
+            slot.refs -= 1
+            if slot.refs == 0 and slot is not self.item:
+                self.slot_free.notify()
+
+# Number of image encoder worker processes (0 = encode in the calling thread)
+ENCODER_PROCESSES = int(os.environ.get('ENCODER_PROCESSES', os.cpu_count() or 1))
+
+# How often a caller waiting on the encoder pool checks that no worker process has died (seconds)
+ENCODER_CHECK_INTERVAL = 1.0
+
+# Stream encoder stops when no client has asked for a frame for this long (seconds)
+BROADCASTER_IDLE_TIMEOUT = 5.0
+
+# Row/column of the red photosite in each 2x2 Bayer cell (blue is on the opposite corner)
+BAYER_RED_OFFSET = {ASI_BAYER_RG: (0, 0), ASI_BAYER_BG: (1, 1), ASI_BAYER_GR: (0, 1), ASI_BAYER_GB: (1, 0)}
+
+def demosaic_superpixel(raw, pattern):
+    """Half-resolution demosaic: each 2x2 Bayer cell becomes one RGB pixel (greens averaged)"""
+    ry, rx = BAYER_RED_OFFSET[pattern]
+    by, bx = 1 - ry, 1 - rx
+    height, width = (raw.shape[0] // 2) * 2, (raw.shape[1] // 2) * 2
+    raw = raw[:height, :width]
+    wide = np.uint16 if raw.dtype == np.uint8 else np.uint32
+    rgb = np.empty((height // 2, width // 2, 3), dtype=raw.dtype)
+    rgb[:, :, 0] = raw[ry::2, rx::2]
+    rgb[:, :, 1] = (raw[ry::2, bx::2].astype(wide) + raw[by::2, rx::2]) >> 1
+    rgb[:, :, 2] = raw[by::2, bx::2]
+    return rgb
+
+def demosaic_bilinear(raw, pattern):
+    """Full-resolution bilinear demosaic of a RAW8/RAW16 Bayer frame, vectorized over the whole frame"""
+    ry, rx = BAYER_RED_OFFSET[pattern]
+    by, bx = 1 - ry, 1 - rx
+    wide = np.uint16 if raw.dtype == np.uint8 else np.uint32
+    padded = np.pad(raw, 1, mode='reflect').astype(wide)
+    north, south = padded[:-2, 1:-1], padded[2:, 1:-1]
+    west, east = padded[1:-1, :-2], padded[1:-1, 2:]
+    # Neighbour averages: orthogonal (the greens around R/B), diagonal (R around B and vice versa),
+    # and the horizontal/vertical pairs around each green
+    cross = (north + south + west + east) >> 2
+    diag = (padded[:-2, :-2] + padded[:-2, 2:] + padded[2:, :-2] + padded[2:, 2:]) >> 2
+    horizontal = (west + east) >> 1
+    vertical = (north + south) >> 1
+    
+    rgb = np.empty(raw.shape + (3,), dtype=raw.dtype)
+    for (y, x), channels in (
+        ((ry, rx), (raw, cross, diag)),  # Red sites
+        ((by, bx), (diag, cross, raw)),  # Blue sites
+        ((ry, bx), (horizontal, raw, vertical)),  # Green sites on red rows
+        ((by, rx), (vertical, raw, horizontal)),  # Green sites on blue rows
+    ):
+        for channel, source in enumerate(channels):
+            rgb[y::2, x::2, channel] = source[y::2, x::2]
+    return rgb
+
+class AutoStretch:
+    """Histogram-based 16-bit to 8-bit display stretch using a cached 65536-entry lookup table
+
+    Black and white points come from percentiles of a subsampled histogram and are rounded
+    to `step` ADU, so the table is only rebuilt when the stretch actually changes - consecutive
+    frames of the same sky reuse it and each preview is a single table lookup per pixel.
+    """
+    def __init__(self, low_percentile=0.1, high_percentile=99.9, gamma=2.2, step=64):
+        self.low_percentile = low_percentile
+        self.high_percentile = high_percentile
+        self.gamma = gamma
+        self.step = step
+        self.lock = threading.Lock()
+        self.params = None
+        self.lut = None
+    
+    def parameters(self, array):
+        """Return (black, white) points for a uint16 array"""
+        sample = array[::4, ::4]
+        cdf = np.cumsum(np.bincount(sample.ravel(), minlength=65536))
+        total = cdf[-1]
+        black = int(np.searchsorted(cdf, total * self.low_percentile / 100.0))
+        white = int(np.searchsorted(cdf, total * self.high_percentile / 100.0))
+        black = (black // self.step) * self.step
+        white = min(65535, max(-(-white // self.step) * self.step, black + self.step))
+        return black, white
+    
+    def lookup_table(self, black, white):
+        """Return the uint8 lookup table for (black, white), rebuilding it only if they changed"""
+        with self.lock:
+            if self.params != (black, white):
+                levels = np.clip((np.arange(65536, dtype=np.float32) - black) / (white - black), 0.0, 1.0)
+                self.lut = (np.power(levels, 1.0 / self.gamma) * 255.0 + 0.5).astype(np.uint8)
+                self.params = (black, white)
+            return self.lut
+    
+    def apply(self, array, params=None):
+        """Stretch a uint16 array (any shape) to uint8"""
+        return self.lookup_table(*(params or self.parameters(array)))[array]
+
+display_stretch = AutoStretch()
+
+def display_preview(img):
+    """8-bit display version of a 16-bit ('I;16') image: auto-stretched, and demosaiced if it is raw colour"""
+    array = np.asarray(img)
+    params = display_stretch.parameters(array)
+    bayer = img.info.get('bayer')
+    if bayer is not None:
+        return Image.fromarray(display_stretch.apply(demosaic_bilinear(array, bayer), params), 'RGB')
+    return Image.fromarray(display_stretch.apply(array, params), 'L')
+
+def scale_image(img, scale):
+    """Downscale a PIL image by scale (<= 1), using a fast box reduce for integer factors"""
+    if scale >= 1.0:
+        return img
+    factor = 1.0 / scale
+    if abs(factor - round(factor)) < 1e-6:
+        return img.reduce(int(round(factor)))
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+def _encode_in_process(image, fmt, path, options, scale=1.0, bayer=None, timings=None):
+    """Encode a PIL image or NumPy array in this process; return bytes, or write to path and return None
+
+    With a bayer pattern the array is a raw colour frame and is demosaiced first, using the
+    half-resolution superpixel path when the output is downscaled by 2 or more anyway.
+    A timings dict receives the 'convert' and 'encode' durations in seconds.
+    """
+    started = time.perf_counter()
+    if bayer is not None:
+        if scale <= 0.5:
+            image = demosaic_superpixel(image, bayer)
+            scale *= 2
+        else:
+            image = demosaic_bilinear(image, bayer)
+    img = Image.fromarray(image) if isinstance(image, np.ndarray) else image
+    img = scale_image(img, scale)
+    converted = time.perf_counter()
+    if path:
+        img.save(path, fmt, **options)
+        data = None
+    else:
+        img_io = io.BytesIO()
+        img.save(img_io, fmt, **options)
+        data = img_io.getvalue()
+    if timings is not None:
+        timings['convert'] = converted - started
+        timings['encode'] = time.perf_counter() - converted
+    return data
+
+def observe_encode_timings(timings):
+    """Record the convert/encode stage durations reported by _encode_in_process"""
+    for stage, seconds in timings.items():
+        metrics.observe('camera_stage_seconds', seconds, stage=stage)
+
+# Shared memory blocks attached by this encoder worker process, by name
+_worker_blocks = {}
+
+def _encoder_worker_encode(block_name, shape, dtype, fmt, path, options, scale, bayer):
+    """Encoder pool worker: encode an image staged in a shared memory block; return (result, stage timings)"""
+    shm = _worker_blocks.get(block_name)
+    if shm is None:
+        # The parent replaces blocks rarely; drop stale attachments instead of tracking them
+        if len(_worker_blocks) >= 16:
+            for stale in _worker_blocks.values():
+                stale.close()
+            _worker_blocks.clear()
+        shm = shared_memory.SharedMemory(name=block_name)
+        # The parent owns the block; stop this worker's resource tracker from unlinking it on exit
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        _worker_blocks[block_name] = shm
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    timings = {}
+    try:
+        return _encode_in_process(array, fmt, path, options, scale, bayer, timings), timings
+    finally:
+        del array
+
+class EncoderPool:
+    """Worker processes that encode images staged in shared memory
+
+    Pixel data is copied once into a reusable shared memory block and only the block
+    name, shape and encoder options are sent to the worker, so encoding spreads over
+    every core without pickling frames or contending for the GIL.
+    """
+    def __init__(self, processes):
+        self.processes = processes
+        # Fork before any capture threads exist (see start_encoder_pool)
+        self.pool = multiprocessing.get_context('fork').Pool(processes)
+        self.lock = threading.Lock()
+        self.free_blocks = []
+        self.busy_blocks = set()  # Blocks staged for a task that has not finished yet
+        self.worker_pids = {worker.pid for worker in self.pool._pool}
+        self.broken = False
+    
+    def workers_lost(self):
+        """Check that every original worker is alive; if one died, shut the pool down and return True
+
+        A dead worker's task never completes, and a worker killed while waiting for work dies
+        holding the task queue lock, so the pool cannot be trusted again. It is not restarted
+        (forking now would copy the locks of running threads); encoding continues in-process.
+        """
+        if self.broken:
+            return True
+        workers = list(self.pool._pool)
+        if all(worker.exitcode is None for worker in workers) and {worker.pid for worker in workers} == self.worker_pids:
+            return False
+        with self.lock:
+            if self.broken:
+                return True
+            self.broken = True
+        print("[Encoder] An encoder process died - stopping the pool, encoding in-process from now on")
+        # Kill the remaining workers first so no abandoned task can still write its file. A worker
+        # killed while waiting for work leaves the task queue's read lock held, which would hang
+        # terminate(); with every worker gone, nobody can legitimately hold it any more.
+        for worker in list(self.pool._pool):
+            worker.kill()
+            worker.join()
+        self.pool._inqueue._rlock.acquire(False)
+        self.pool._inqueue._rlock.release()
+        try:
+            self.pool.terminate()
+        except Exception as e:
+            # A worker killed mid-read can leave a partial task in the queue; the pool is stopped regardless
+            print(f"[Encoder] Error while stopping the pool: {e}")
+        with self.lock:
+            for block in self.free_blocks + list(self.busy_blocks):
+                block.close()
+                block.unlink()
+            self.free_blocks = []
+            self.busy_blocks.clear()
+        return True
+    
+    def _checkout(self, size):
+        with self.lock:
+            for i, block in enumerate(self.free_blocks):
+                if block.size >= size:
+                    block = self.free_blocks.pop(i)
+                    self.busy_blocks.add(block)
+                    return block
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        with self.lock:
+            self.busy_blocks.add(block)
+        return block
+    
+    def _checkin(self, block):
+        with self.lock:
+            if block not in self.busy_blocks:
+                return  # Already unlinked when the pool was shut down
+            self.busy_blocks.discard(block)
+            self.free_blocks.append(block)
+            # Keep about two spare blocks per worker; drop the oldest beyond that
+            if len(self.free_blocks) > self.processes * 2:
+                stale = self.free_blocks.pop(0)
+                stale.close()
+                stale.unlink()
+    
+    def submit(self, image, fmt='JPEG', path=None, callback=None, error_callback=None, scale=1.0, bayer=None,
+               **options):
+        """Stage a PIL image or NumPy array in shared memory and start encoding it; returns an AsyncResult
+
+        A bayer pattern demosaics a raw frame and a scale below 1 downscales it, both in the worker.
+        The AsyncResult's value is (bytes or None, stage timings); callback receives just the bytes.
+        """
+        array = np.ascontiguousarray(image)
+        block = self._checkout(array.nbytes)
+        staged = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        staged[...] = array
+        del staged
+        
+        def done(result):
+            self._checkin(block)
+            observe_encode_timings(result[1])
+            if callback:
+                callback(result[0])
+        
+        def failed(error):
+            self._checkin(block)
+            if error_callback:
+                error_callback(error)
+        
+        try:
+            return self.pool.apply_async(_encoder_worker_encode,
+                                         (block.name, array.shape, array.dtype.str, fmt, path, options, scale, bayer),
+                                         callback=done, error_callback=failed)
+        except ValueError:
+            self._checkin(block)  # The pool was shut down after a worker died
+            raise
+    
+    def close(self):
+        self.pool.terminate()
+        with self.lock:
+            for block in self.free_blocks + list(self.busy_blocks):
+                block.close()
+                block.unlink()
+            self.free_blocks = []
+            self.busy_blocks.clear()
+
+encoder_pool = None
+
+def encoder_pool_running():
+    """True while image encoding can go to the encoder worker processes"""
+    return encoder_pool is not None and not encoder_pool.broken
+
+def start_encoder_pool():
+    """Start the encoder worker processes - call before any threads are started"""
+    global encoder_pool
+    if ENCODER_PROCESSES < 1 or platform.system() != 'Linux':
+        print("Image encoding runs in-process (encoder pool disabled)")
+        return
+    encoder_pool = EncoderPool(ENCODER_PROCESSES)
+    atexit.register(encoder_pool.close)
+    print(f"Started {ENCODER_PROCESSES} image encoder processes")
+
+def encode_image(image, fmt='JPEG', path=None, scale=1.0, bayer=None, **options):
+    """Encode a PIL image or NumPy array (on the encoder pool when running); return bytes or write to path
+
+    16-bit images are written at full depth to PNG/TIFF and auto-stretched for JPEG.
+    """
+    if fmt == 'JPEG' and isinstance(image, Image.Image) and image.mode == 'I;16':
+        image = display_preview(image)
+    if encoder_pool_running():
+        try:
+            result = encoder_pool.submit(image, fmt, path, scale=scale, bayer=bayer, **options)
+        except ValueError:
+            result = None
+        # Slow encodes (full-frame PNG/TIFF on a Pi) are fine; only a dead worker abandons the wait
+        while result is not None and not encoder_pool.workers_lost():
+            try:
+                return result.get(ENCODER_CHECK_INTERVAL)[0]
+            except multiprocessing.TimeoutError:
+                pass
+        print(f"[Encoder] Encoding {fmt} in-process after losing the encoder pool")
+    timings = {}
+    data = _encode_in_process(image, fmt, path, options, scale, bayer, timings)
+    observe_encode_timings(timings)
+    return data
+
+def encode_jpeg(image, quality, scale=1.0, bayer=None):
+    """Encode a PIL image or NumPy array (raw Bayer if bayer is given) to JPEG bytes, optionally downscaled"""
+    return encode_image(image, 'JPEG', scale=scale, bayer=bayer, quality=quality)
+
+class MJPEGBroadcaster:
+    """Encodes each captured frame once per stream profile and publishes the JPEG bytes to its clients
+
+    A dispatcher thread takes new frames from the capture ring and encodes them, with up
+    to one frame in flight per encoder process so encoding overlaps across cores. Encoded
+    frames are published on a FrameBus with their capture sequence number; clients always
+    receive the newest one, and frames arriving while every encoder is busy are dropped
+    instead of queueing work. The dispatcher runs only while clients are asking for frames.
+    """
+    def __init__(self, source, scale=1.0, quality=STREAM_JPEG_QUALITY):
+        self.source = source
+        self.scale = scale
+        self.quality = quality
+        self.encoded = FrameBus()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.last_demand = 0.0
+        self.in_flight = None
+    
+    def _demand(self):
+        """Note that a client wants frames and start the dispatcher if it is not running"""
+        with self.lock:
+            self.last_demand = time.monotonic()
+            if self.thread is None:
+                max_in_flight = encoder_pool.processes if encoder_pool_running() else 1
+                self.in_flight = threading.BoundedSemaphore(max_in_flight)
+                self.thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+                self.thread.start()
+    
+    def _publish(self, seq, jpeg):
+        with self.lock:
+            # Encodes can finish out of order - never publish an older frame over a newer one
+            if seq > self.encoded.seq:
+                self.encoded.publish(seq, jpeg)
+    
+    def _dispatch_loop(self):
+        in_flight = self.in_flight
+        pending = set()  # seqs of encodes running on the pool
+        pending_lock = threading.Lock()
+        last_seq = 0
+        
+        def settle(seq):
+            """Return the encoder permit of a finished or lost encode, exactly once"""
+            with pending_lock:
+                held = seq in pending
+                pending.discard(seq)
+            if held:
+                in_flight.release()
+        
+        while True:
+            with self.lock:
+                if time.monotonic() - self.last_demand > BROADCASTER_IDLE_TIMEOUT:
+                    self.thread = None
+                    return
+            
+            frame = self.source.wait_frame(last_seq, timeout=0.5)
+            if frame is None:
+                if not self.source.streaming:
+                    # Pass the stream stop on to clients blocked in wait()
+                    self.encoded.interrupt()
+                continue
+            last_seq, slot = frame
+            if not in_flight.acquire(blocking=False):
+                # Encodes lost with a dead worker never call back - reclaim their permits
+                lost = []
+                if encoder_pool is not None and encoder_pool.workers_lost():
+                    with pending_lock:
+                        lost = list(pending)
+                    for seq in lost:
+                        settle(seq)
+                if not (lost and in_flight.acquire(blocking=False)):
+                    # Every encoder is busy - drop this frame rather than queue work
+                    slot.release()
+                    metrics.inc('camera_encoder_skipped_frames_total', camera=self.source.index)
+                    continue
+            use_pool = encoder_pool_running()
+            try:
+                if use_pool:
+                    seq = slot.seq
+                    with pending_lock:
+                        pending.add(seq)
+                    try:
+                        # The slot is only held while its pixels are staged in shared memory
+                        encoder_pool.submit(slot.array, 'JPEG',
+                                            callback=lambda jpeg, seq=seq: (self._publish(seq, jpeg), settle(seq)),
+                                            error_callback=lambda error, seq=seq: settle(seq),
+                                            scale=self.scale, bayer=slot.bayer, quality=self.quality)
+                    finally:
+                        slot.release()
+                else:
+                    try:
+                        jpeg = encode_jpeg(slot.array, self.quality, self.scale, slot.bayer)
+                    finally:
+                        slot.release()
+                    self._publish(last_seq, jpeg)
+                    in_flight.release()
+            except Exception as e:
+                if use_pool:
+                    settle(last_seq)
+                else:
+                    in_flight.release()
+                print(f"[Stream] Error encoding frame {last_seq}: {e}")
+    
+    def get_latest(self, after_seq=0):
+        """Return (seq, jpeg_bytes) for the newest encoded frame, or None if nothing newer than after_seq"""
+        self._demand()
+        with self.encoded.lock:
+            if self.encoded.item is None or self.encoded.seq <= after_seq:
+                return None
+            return self.encoded.seq, self.encoded.item
+    
+    def wait(self, after_seq=0, timeout=None):
+        """Block until a frame newer than after_seq is encoded and return (seq, jpeg), or None on timeout"""
+        self._demand()
+        return self.encoded.wait(after_seq, timeout)
+
+# Fault recovery supervisor: checks every SUPERVISOR_INTERVAL (s); a stream with no frame for
+# SUPERVISOR_STALL_TIMEOUT (s) past the exposure, this many consecutive video errors or failed
+# exposures, a dead capture thread or a removed camera trigger a reset/reconnect, retried with
+# exponential backoff between SUPERVISOR_BACKOFF_MIN and SUPERVISOR_BACKOFF_MAX seconds
+SUPERVISOR_ENABLED = os.environ.get('CAMERA_SUPERVISOR', '1') != '0'
+SUPERVISOR_INTERVAL = 1.0
+SUPERVISOR_STALL_TIMEOUT = 5.0
+SUPERVISOR_MAX_VIDEO_ERRORS = 10
+SUPERVISOR_MAX_EXPOSURE_FAILURES = 2
+SUPERVISOR_BACKOFF_MIN = 1.0
+SUPERVISOR_BACKOFF_MAX = 30.0
+
+# Pause after a failed ASIGetVideoData (other than a timeout) before trying again (s)
+VIDEO_ERROR_RETRY_DELAY = 0.05
+
+# camera_state keys reapplied in one batch after a reset or reconnect
+RESTORE_STATE_KEYS = ('gain', 'gamma', 'exposure', 'video_exposure', 'wb_r', 'wb_b', 'wb_auto',
+                      'image_format', 'video_format', 'width', 'height', 'bin', 'start_x', 'start_y')
+
+class CameraSupervisor:
+    """Watches a camera's capture thread and SDK error patterns and recovers it in the background
+    
+    Recovery resets the camera (close and reopen), falling back to a full reconnect, restores the
+    settings in one batch and resumes the stream if it is wanted. Failed attempts are retried with
+    bounded exponential backoff until the camera comes back or is disconnected through the API.
+    """
+    def __init__(self, camera):
+        self.camera = camera
+        self.lock = threading.Lock()
+        self.thread = None
+        self.paused = False  # Set by disconnect() so a deliberately closed camera is left alone
+        self.recovering = False
+        self.recoveries = 0
+        self.failed_attempts = 0
+        self.last_fault = None
+        self.last_recovery = None  # {'fault', 'time', 'seconds', 'attempts'}
+    
+    def start(self):
+        self.paused = False
+        if not SUPERVISOR_ENABLED:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, daemon=True)
+                self.thread.start()
+    
+    def check(self):
+        """Return a description of the camera's fault, or None if it looks healthy"""
+        cam = self.camera
+        if self.paused or not cam.state['connected']:
+            return None
+        health = cam.health
+        if health['fatal_error'] is not None:
+            return f"SDK error {ASI_ERROR_NAMES.get(health['fatal_error'], health['fatal_error'])}"
+        if health['exposure_failures'] >= SUPERVISOR_MAX_EXPOSURE_FAILURES:
+            return f"{health['exposure_failures']} consecutive failed exposures"
+        if cam.streaming:
+            if cam.capture_thread is None or not cam.capture_thread.is_alive():
+                return "capture thread stopped"
+            if health['video_errors'] >= SUPERVISOR_MAX_VIDEO_ERRORS:
+                return f"{health['video_errors']} consecutive video errors"
+            last_frame = max(cam.state['frame_time'] or 0.0, cam.stream_started)
+            stall_timeout = cam.video_exposure() / 1000000.0 * 2 + SUPERVISOR_STALL_TIMEOUT
+            if time.time() - last_frame > stall_timeout:
+                return f"no frame for {time.time() - last_frame:.0f} s"
+        return None
+    
+    def status(self):
+        return {
+            'enabled': SUPERVISOR_ENABLED and not self.paused,
+            'recovering': self.recovering,
+            'fault': self.last_fault,
+            'failed_attempts': self.failed_attempts,
+            'recoveries': self.recoveries,
+            'last_recovery': self.last_recovery,
+            'health': dict(self.camera.health)
+        }
+    
+    def _loop(self):
+        cam = self.camera
+        while True:
+            time.sleep(SUPERVISOR_INTERVAL)
+            fault = self.check()
+            if fault is None:
+                continue
+            
+            print(f"[Supervisor {cam.index}] Fault detected: {fault} - recovering camera")
+            self.recovering = True
+            self.last_fault = fault
+            started = time.monotonic()
+            backoff = SUPERVISOR_BACKOFF_MIN
+            self.failed_attempts = 0
+            # Taken once: a failed attempt may reset the ROI
+            saved = {key: cam.state[key] for key in RESTORE_STATE_KEYS}
+            try:
+                while not self.paused:
+                    cam.state['error'] = f"Recovering from fault: {fault}"
+                    status_sampler.notify()
+                    if cam.recover(saved):
+                        break
+                    self.failed_attempts += 1
+                    metrics.inc('camera_recoveries_total', camera=cam.index, result='failed')
+                    print(f"[Supervisor {cam.index}] Recovery attempt {self.failed_attempts} failed, retrying in {backoff:.0f} s")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, SUPERVISOR_BACKOFF_MAX)
+                else:
+                    print(f"[Supervisor {cam.index}] Camera disconnected, recovery abandoned")
+                    continue
+                
+                seconds = time.monotonic() - started
+                self.recoveries += 1
+                self.last_recovery = {'fault': fault, 'time': datetime.now().isoformat(),
+                                      'seconds': round(seconds, 2), 'attempts': self.failed_attempts + 1}
+                metrics.inc('camera_recoveries_total', camera=cam.index, result='recovered')
+                metrics.observe('camera_recovery_seconds', seconds, camera=cam.index)
+                print(f"[Supervisor {cam.index}] Camera recovered in {seconds:.1f} s")
+            except Exception as e:
+                print(f"[Supervisor {cam.index}] Error during recovery: {e}")
+            finally:
+                self.recovering = False
+                status_sampler.notify()
+
+class ASICamera:
+    def __init__(self, index=0):
+        self.index = index  # SDK camera index (0 .. ASIGetNumOfConnectedCameras() - 1)
+        self.state = copy.deepcopy(CAMERA_STATE_DEFAULTS)
         self.camera_id = -1
         self.is_open = False
         self.streaming = False
-        self.frame_buffer = None
+        self.stream_wanted = False  # The stream should run; kept while a photo session or recovery stops it
+        self.stream_paused = False  # A photo session has the stream stopped and restarts it itself
+        self.frame_ring = None
         self.capture_thread = None
         self.is_color_cam = False  # Store whether camera is color camera
+        self.bayer_pattern = ASI_BAYER_RG  # Colour filter layout, used to demosaic RAW frames
+        self.name = None
+        self.controls = {}  # Control type -> capabilities, enumerated once at connect (see load_control_caps)
+        self.exposure_timing = {}  # Timing of the last snapshot exposure (see _wait_for_exposure)
+        self.stream_exposure = None  # Override the video exposure/format settings while a sequence
+        self.stream_format = None    # captures straight from video mode
+        
+        # Per-camera services: sequence capture, exposure jobs, meteor detection, recording, stream profiles
+        self.sequence = copy.deepcopy(SEQUENCE_STATE_DEFAULTS)
+        self.sequence_writer = DiskWriter(f'Sequence Writer {index}')
+        self.photo_lock = threading.Lock()  # Serializes photo sessions so they never fight over the camera
+        self.exposure_jobs = ExposureJobQueue(self)
+        self.meteor_detector = MeteorDetector(self)
+        self.recorder = StreamRecorder(self)
+        self.settings = SettingsTransaction(self)
+        self.broadcasters = {}  # (scale, quality) -> MJPEGBroadcaster shared by every client on that profile
+        self.capture_rate = RateMeter()
+        self.stream_started = 0.0  # time.time() of the last start_stream
+        # Fault signals watched by the supervisor
+        self.health = {'video_errors': 0, 'exposure_failures': 0, 'fatal_error': None}
+        self.exposure_lock = threading.Lock()  # Held for each still exposure; recovery waits for it
+        self.recovery_lock = threading.RLock()  # Held by recovery and by photo sessions around their stream stop/restart
+        self.supervisor = CameraSupervisor(self)
+        self.stream_clients = {}  # client id -> {'profile', 'remote', 'rate'} for connected MJPEG clients
+        self.broadcasters_lock = threading.Lock()
+    
+    def stream_broadcaster(self, scale=1.0, quality=STREAM_JPEG_QUALITY):
+        """Return the shared broadcaster for a stream profile, creating it on first use
         
+        The profile is snapped with stream_profile_key; once STREAM_MAX_PROFILES profiles are
+        encoding, a new one gets the nearest running broadcaster instead of another encoder.
+        """
+        key = stream_profile_key(scale, quality)
+        with self.broadcasters_lock:
+            broadcaster = self.broadcasters.get(key)
+            if broadcaster is None:
+                active = [b for b in self.broadcasters.values() if b.thread is not None]
+                if len(active) >= STREAM_MAX_PROFILES:
+                    return min(active, key=lambda b: (abs(math.log2(b.scale / key[0])), abs(b.quality - key[1])))
+                # Forget profiles nobody is watching before adding another
+                for idle_key in [k for k, b in self.broadcasters.items() if b.thread is None]:
+                    if len(self.broadcasters) < 16:
+                        break
+                    del self.broadcasters[idle_key]
+                broadcaster = MJPEGBroadcaster(self, scale=key[0], quality=key[1])
+                self.broadcasters[key] = broadcaster
+            return broadcaster
+    
+    def video_exposure(self):
+        """Exposure (μs) the video stream runs at"""
+        return self.stream_exposure if self.stream_exposure is not None else self.state['video_exposure']
+    
+    def video_format(self):
+        """Image type the video stream captures in"""
+        return self.stream_format if self.stream_format is not None else self.state['video_format']
+    
+    def set_stream_override(self, exposure=None, img_format=None):
+        """Run the video stream at a different exposure/format (None restores the settings), restarting it once"""
+        if (exposure, img_format) == (self.stream_exposure, self.stream_format):
+            return
+        was_streaming = self.streaming
+        if was_streaming:
+            self.stop_stream(pause=True)
+        self.stream_exposure = exposure
+        self.stream_format = img_format
+        if was_streaming:
+            self.start_stream()
+    
+    def load_control_caps(self):
+        """Enumerate the camera's controls once and keep their ranges, defaults and writability"""
+        count = ctypes.c_int(0)
+        result = asi_lib.ASIGetNumOfControls(self.camera_id, ctypes.byref(count))
+        controls = {}
+        if result != ASI_SUCCESS:
+            print(f"[Controls] Failed to get number of controls: {result}")
+        for control_index in range(count.value):
+            caps = ASI_CONTROL_CAPS()
+            result = asi_lib.ASIGetControlCaps(self.camera_id, control_index, ctypes.byref(caps))
+            if result != ASI_SUCCESS:
+                print(f"[Controls] Failed to get caps of control {control_index}: {result}")
+                continue
+            controls[caps.ControlType] = {
+                'id': caps.ControlType,
+                'name': caps.Name.decode('utf-8', 'replace'),
+                'description': caps.Description.decode('utf-8', 'replace'),
+                'min': caps.MinValue,
+                'max': caps.MaxValue,
+                'default': caps.DefaultValue,
+                'auto_supported': bool(caps.IsAutoSupported),
+                'writable': bool(caps.IsWritable),
+                'live': bool(caps.IsWritable) and caps.ControlType not in STREAM_RESTART_CONTROLS
+            }
+        self.controls = controls
+        print(f"[Controls] {len(controls)} controls: {', '.join(c['name'] for c in controls.values())}")
+        return controls
+    
+    def clamp_control(self, control, value):
+        """Clamp a value to the control's range from the caps table (unchanged if the control is unknown)"""
+        caps = self.controls.get(control)
+        if caps is None:
+            return value
+        return max(caps['min'], min(caps['max'], value))
+    
+    def control_live(self, control):
+        """Whether the SDK accepts writes to this control while video capture runs"""
+        caps = self.controls.get(control)
+        return caps is None or caps['live']
+    
+    def set_control(self, control, value, auto=ASI_FALSE):
+        """Write a control value; with ASI_CONTROL_READBACK=1 also read it back and log what the camera reports"""
+        result = asi_lib.ASISetControlValue(self.camera_id, control, value, auto)
+        if result != ASI_SUCCESS:
+            count_asi_error(self, 'ASISetControlValue', result)
+        if CONTROL_READBACK:
+            actual = ctypes.c_long(0)
+            actual_auto = ctypes.c_int(0)
+            asi_lib.ASIGetControlValue(self.camera_id, control, ctypes.byref(actual), ctypes.byref(actual_auto))
+            name = self.controls.get(control, {}).get('name', control)
+            print(f"[Controls] Set {name} to {value} (auto: {auto}, result: {result}) → actual: {actual.value} (auto: {actual_auto.value})")
+        return result
+    
     def connect(self):
-        """Connect to the first available ASI camera"""
+        """Connect to the ASI camera at this object's SDK index"""
         if asi_lib is None:
-            camera_state['error'] = "ASI library not loaded"
+            self.state['error'] = "ASI library not loaded"
             return False
             
         try:
@@ -177,8 +1669,8 @@ class ASICamera:
             num_cameras = asi_lib.ASIGetNumOfConnectedCameras()
             print(f"Found {num_cameras} camera(s)")
             
-            if num_cameras == 0:
-                camera_state['error'] = "No cameras found"
+            if num_cameras <= self.index:
+                self.state['error'] = "No cameras found" if num_cameras == 0 else f"Camera {self.index} not found"
                 return False
             
             # Get camera info
@@ -204,112 +1696,115 @@ class ASICamera:
                 ]
             
             camera_info = ASI_CAMERA_INFO()
-            result = asi_lib.ASIGetCameraProperty(ctypes.byref(camera_info), 0)
+            result = asi_lib.ASIGetCameraProperty(ctypes.byref(camera_info), self.index)
             
             if result != ASI_SUCCESS:
-                camera_state['error'] = f"Failed to get camera properties: {result}"
+                self.state['error'] = f"Failed to get camera properties: {result}"
                 return False
             
             self.camera_id = camera_info.CameraID
             self.is_color_cam = bool(camera_info.IsColorCam)  # Store color camera status
-            camera_state['camera_id'] = self.camera_id
-            camera_state['width'] = camera_info.MaxWidth
-            camera_state['height'] = camera_info.MaxHeight
+            self.bayer_pattern = camera_info.BayerPattern
+            self.state['camera_id'] = self.camera_id
+            self.state['max_width'] = camera_info.MaxWidth
+            self.state['max_height'] = camera_info.MaxHeight
+            self.state['supported_bins'] = [b for b in camera_info.SupportedBins if b > 0] or [1]
+            # Start at full frame, no binning
+            self.state['width'] = camera_info.MaxWidth
+            self.state['height'] = camera_info.MaxHeight
+            self.state['bin'] = 1
+            self.state['start_x'] = None
+            self.state['start_y'] = None
             
-            print(f"Camera: {camera_info.Name.decode('utf-8')}")
+            self.name = camera_info.Name.decode('utf-8')
+            print(f"Camera: {self.name}")
             print(f"Resolution: {camera_info.MaxWidth} x {camera_info.MaxHeight}")
             print(f"Color: {'Yes' if camera_info.IsColorCam else 'No'}")
             
             # Open camera
             result = asi_lib.ASIOpenCamera(self.camera_id)
             if result != ASI_SUCCESS:
-                camera_state['error'] = f"Failed to open camera: {result}"
+                self.state['error'] = f"Failed to open camera: {result}"
                 return False
             
             # Initialize camera
             result = asi_lib.ASIInitCamera(self.camera_id)
             if result != ASI_SUCCESS:
-                camera_state['error'] = f"Failed to initialize camera: {result}"
+                self.state['error'] = f"Failed to initialize camera: {result}"
                 asi_lib.ASICloseCamera(self.camera_id)
                 return False
             
             self.is_open = True
+            self.load_control_caps()
             
             # Set ROI format (full frame, use current format setting)
-            result = asi_lib.ASISetROIFormat(
-                self.camera_id,
-                camera_info.MaxWidth,
-                camera_info.MaxHeight,
-                1,  # bin
-                camera_state['image_format']
-            )
+            result = self.set_roi_format(self.state['image_format'])
             
             if result != ASI_SUCCESS:
                 print(f"Warning: Failed to set ROI format: {result}")
             
             # Disable auto gain and auto exposure first (they might lock the values)
-            asi_lib.ASISetControlValue(self.camera_id, ASI_GAIN, 0, ASI_TRUE)  # Turn OFF auto gain
-            asi_lib.ASISetControlValue(self.camera_id, ASI_EXPOSURE, 0, ASI_TRUE)  # Turn OFF auto exposure
+            self.set_control(ASI_GAIN, 0, ASI_TRUE)  # Turn OFF auto gain
+            self.set_control(ASI_EXPOSURE, 0, ASI_TRUE)  # Turn OFF auto exposure
             time.sleep(0.1)
             
             # Set bandwidth
-            asi_lib.ASISetControlValue(self.camera_id, ASI_BANDWIDTHOVERLOAD, 40, ASI_FALSE)
+            self.set_control(ASI_BANDWIDTHOVERLOAD, 40, ASI_FALSE)
             
             # Set initial gain
-            result_gain = asi_lib.ASISetControlValue(self.camera_id, ASI_GAIN, camera_state['gain'], ASI_FALSE)
+            result_gain = self.set_control(ASI_GAIN, self.state['gain'], ASI_FALSE)
             
             # Set initial gamma
-            result_gamma = asi_lib.ASISetControlValue(self.camera_id, ASI_GAMMA, camera_state['gamma'], ASI_FALSE)
+            result_gamma = self.set_control(ASI_GAMMA, self.state['gamma'], ASI_FALSE)
             
             # Set initial white balance (only for color cameras)
             if camera_info.IsColorCam:
-                wb_auto = camera_state.get('wb_auto', False)
+                wb_auto = self.state.get('wb_auto', False)
                 if wb_auto:
                     # Set auto white balance
-                    result_wb_r = asi_lib.ASISetControlValue(self.camera_id, ASI_WB_R, 0, ASI_TRUE)
-                    result_wb_b = asi_lib.ASISetControlValue(self.camera_id, ASI_WB_B, 0, ASI_TRUE)
+                    result_wb_r = self.set_control(ASI_WB_R, 0, ASI_TRUE)
+                    result_wb_b = self.set_control(ASI_WB_B, 0, ASI_TRUE)
                 else:
                     # Set manual white balance
-                    result_wb_r = asi_lib.ASISetControlValue(self.camera_id, ASI_WB_R, camera_state['wb_r'], ASI_FALSE)
-                    result_wb_b = asi_lib.ASISetControlValue(self.camera_id, ASI_WB_B, camera_state['wb_b'], ASI_FALSE)
+                    result_wb_r = self.set_control(ASI_WB_R, self.state['wb_r'], ASI_FALSE)
+                    result_wb_b = self.set_control(ASI_WB_B, self.state['wb_b'], ASI_FALSE)
             else:
                 result_wb_r = None
                 result_wb_b = None
             
-            # Verify settings
-            actual_gain = ctypes.c_long(0)
-            auto_gain = ctypes.c_int(0)
-            asi_lib.ASIGetControlValue(self.camera_id, ASI_GAIN, ctypes.byref(actual_gain), ctypes.byref(auto_gain))
-            
             print(f"Initial settings:")
-            print(f"  Gain: {camera_state['gain']} → actual: {actual_gain.value} (result: {result_gain})")
-            print(f"  Gamma: {camera_state['gamma']} (result: {result_gamma})")
-            print(f"  Exposure (for photo): {camera_state['exposure']} μs ({camera_state['exposure']/1000000:.3f} s)")
+            print(f"  Gain: {self.state['gain']} (result: {result_gain})")
+            print(f"  Gamma: {self.state['gamma']} (result: {result_gamma})")
+            print(f"  Exposure (for photo): {self.state['exposure']} μs ({self.state['exposure']/1000000:.3f} s)")
             if camera_info.IsColorCam:
-                wb_auto = camera_state.get('wb_auto', False)
+                wb_auto = self.state.get('wb_auto', False)
                 if wb_auto:
                     print(f"  White Balance: Auto (R result: {result_wb_r}, B result: {result_wb_b})")
                 else:
-                    print(f"  White Balance R: {camera_state['wb_r']} (result: {result_wb_r})")
-                    print(f"  White Balance B: {camera_state['wb_b']} (result: {result_wb_b})")
+                    print(f"  White Balance R: {self.state['wb_r']} (result: {result_wb_r})")
+                    print(f"  White Balance B: {self.state['wb_b']} (result: {result_wb_b})")
             
-            camera_state['connected'] = True
-            camera_state['error'] = None
+            self.state['connected'] = True
+            self.state['error'] = None
+            self.supervisor.start()
+            status_sampler.notify()
             return True
             
         except Exception as e:
-            camera_state['error'] = str(e)
+            self.state['error'] = str(e)
             print(f"Error connecting to camera: {e}")
             return False
     
     def disconnect(self):
         """Disconnect from camera"""
+        self.supervisor.paused = True
         self.stop_stream()
         if self.is_open and self.camera_id >= 0:
             asi_lib.ASICloseCamera(self.camera_id)
             self.is_open = False
-        camera_state['connected'] = False
-        camera_state['streaming'] = False
+        self.state['connected'] = False
+        self.state['streaming'] = False
+        status_sampler.notify()
     
     def reset_camera(self):
         """Reset camera by closing and reopening - use when camera is stuck in FAILED state"""
@@ -318,11 +1813,6 @@ class ASICamera:
         
         print("[reset_camera] Attempting to reset camera...")
         camera_id = self.camera_id
-        width = camera_state['width']
-        height = camera_state['height']
-        gain = camera_state['gain']
-        exposure = camera_state['exposure']
-        image_format = camera_state['image_format']
         
         try:
             # Close camera
@@ -349,22 +1839,16 @@ class ASICamera:
             
             # Restore settings
             print("[reset_camera] Restoring camera settings...")
-            asi_lib.ASISetROIFormat(camera_id, width, height, 1, image_format)
-            time.sleep(0.3)
-            asi_lib.ASISetControlValue(camera_id, ASI_GAIN, gain, ASI_FALSE)
-            asi_lib.ASISetControlValue(camera_id, ASI_EXPOSURE, exposure, ASI_FALSE)
-            asi_lib.ASISetControlValue(camera_id, ASI_BANDWIDTHOVERLOAD, 40, ASI_FALSE)
-            time.sleep(0.3)
+            self.apply_state()
             
             # Check status
             status = ctypes.c_int(0)
             asi_lib.ASIGetExpStatus(camera_id, ctypes.byref(status))
-            if status.value == 0:
+            if status.value == ASI_EXP_IDLE:
                 print("[reset_camera] Camera successfully reset to IDLE state")
                 return True
             else:
-                status_names = {0: "ASI_EXP_IDLE", 1: "ASI_EXP_WORKING", 2: "ASI_EXP_SUCCESS", 3: "ASI_EXP_FAILED"}
-                status_name = status_names.get(status.value, f"UNKNOWN_{status.value}")
+                status_name = EXP_STATUS_NAMES.get(status.value, f"UNKNOWN_{status.value}")
                 print(f"[reset_camera] Camera reset but still in state {status.value} ({status_name})")
                 return False
                 
@@ -374,6 +1858,137 @@ class ASICamera:
             traceback.print_exc()
             return False
     
+    def apply_state(self):
+        """Write the ROI, format and every control from camera_state to the camera in one pass"""
+        result = self.set_roi_format(self.state['image_format'])
+        if result != ASI_SUCCESS:
+            print(f"[apply_state] Failed to restore ROI {self.state['width']} x {self.state['height']} "
+                  f"bin {self.state['bin']}: {result}")
+        self.set_control(ASI_BANDWIDTHOVERLOAD, 40)
+        self.set_control(ASI_GAIN, self.state['gain'])
+        self.set_control(ASI_GAMMA, self.state['gamma'])
+        self.set_control(ASI_EXPOSURE, self.state['exposure'])
+        if self.is_color_cam:
+            if self.state.get('wb_auto', False):
+                self.set_control(ASI_WB_R, 0, ASI_TRUE)
+                self.set_control(ASI_WB_B, 0, ASI_TRUE)
+            else:
+                self.set_control(ASI_WB_R, self.state['wb_r'])
+                self.set_control(ASI_WB_B, self.state['wb_b'])
+    
+    def recover(self, saved):
+        """Bring the camera back after a fault: reset it, or reconnect if that fails, restore the
+        saved settings in one batch and resume the stream if it is wanted. Returns True on success."""
+        # Photo sessions never stop or restart the stream halfway through a recovery
+        with self.recovery_lock:
+            # Wait for an exposure in progress to end so it is never cut off by the reset
+            with self.exposure_lock:
+                self.stop_stream(pause=True)
+                ok = self.reset_camera()
+                if not ok:
+                    # Reopen from scratch: after a USB re-enumeration the camera may have a new ID
+                    print("[recover] Reset failed, reconnecting...")
+                    if self.camera_id >= 0:
+                        asi_lib.ASICloseCamera(self.camera_id)
+                    self.is_open = False
+                    ok = self.connect()
+                    if ok:
+                        # connect() starts from full frame - put the saved ROI and settings back at once
+                        self.state.update(saved)
+                        self.apply_state()
+                if not ok:
+                    self.state['connected'] = False
+                    return False
+            
+            self.health.update(video_errors=0, exposure_failures=0, fatal_error=None)
+            self.state['connected'] = True
+            self.state['error'] = None
+            # A paused photo session restarts the stream itself when it ends
+            if self.stream_wanted and not self.stream_paused:
+                # Restores the video format and controls
+                return self.start_stream()
+            return True
+    
+    def wait_for_recovery(self, timeout):
+        """Block until a recovery in progress has finished; return False if it is still running after timeout"""
+        if not self.recovery_lock.acquire(timeout=timeout):
+            return False
+        self.recovery_lock.release()
+        return True
+    
+    def pause_stream(self):
+        """Stop the stream for a photo session, keeping stream_wanted; returns whether the stream is wanted
+        
+        Call with recovery_lock held and end the session with resume_stream.
+        """
+        self.stream_paused = True
+        if self.streaming:
+            self.stop_stream(pause=True)
+        return self.stream_wanted
+    
+    def resume_stream(self):
+        """End a photo session's pause: restart the stream if it is wanted and not already running"""
+        with self.recovery_lock:
+            self.stream_paused = False
+            if self.stream_wanted and self.is_open and not self.streaming:
+                return self.start_stream()
+        return True
+    
+    def set_roi_format(self, img_type):
+        """Apply the current ROI size, binning and start position with the given image type"""
+        result = asi_lib.ASISetROIFormat(self.camera_id, self.state['width'], self.state['height'],
+                                         self.state['bin'], img_type)
+        # ASISetROIFormat centers the ROI; move it only if a start position was requested
+        if result == ASI_SUCCESS and self.state['start_x'] is not None:
+            result = asi_lib.ASISetStartPos(self.camera_id, self.state['start_x'], self.state['start_y'])
+        return result
+    
+    def set_roi(self, width=None, height=None, bin_value=1, start_x=None, start_y=None):
+        """Change the sub-frame ROI and hardware binning, restarting the stream if it is running
+        
+        width/height/start are in binned pixels; omitted width/height select the full binned
+        sensor and omitted start positions center the ROI. The SDK needs width to be a multiple
+        of 8 and height a multiple of 2, so sizes are rounded down. Returns None on success or an
+        error message.
+        """
+        if bin_value not in self.state['supported_bins']:
+            return f"Unsupported bin {bin_value}, camera supports {self.state['supported_bins']}"
+        full_width = self.state['max_width'] // bin_value
+        full_height = self.state['max_height'] // bin_value
+        width = (min(width or full_width, full_width) // 8) * 8
+        height = (min(height or full_height, full_height) // 2) * 2
+        if width < 8 or height < 2:
+            return f"ROI too small: {width} x {height}"
+        if (start_x is None) != (start_y is None):
+            return "Specify both x and y, or neither to center the ROI"
+        if start_x is not None and (start_x < 0 or start_y < 0 or start_x + width > full_width or start_y + height > full_height):
+            return f"ROI {width} x {height} at ({start_x}, {start_y}) is outside the {full_width} x {full_height} sensor"
+        
+        was_streaming = self.streaming
+        if was_streaming:
+            self.stop_stream(pause=True)
+        
+        previous = {key: self.state[key] for key in ('width', 'height', 'bin', 'start_x', 'start_y')}
+        self.state.update(width=width, height=height, bin=bin_value, start_x=start_x, start_y=start_y)
+        error = None
+        if self.is_open:
+            # Prefer true hardware binning where the sensor supports it
+            if ASI_HARDWARE_BIN in self.controls:
+                self.set_control(ASI_HARDWARE_BIN, 1 if bin_value > 1 else 0)
+            result = self.set_roi_format(self.video_format())
+            if result != ASI_SUCCESS:
+                error = f"Failed to set ROI: {result}"
+                self.state.update(previous)
+                self.set_roi_format(self.video_format())
+        
+        print(f"[set_roi] ROI {self.state['width']} x {self.state['height']} bin {self.state['bin']} "
+              f"at ({self.state['start_x']}, {self.state['start_y']}){' - ' + error if error else ''}")
+        
+        # The frame ring is reallocated for the new size when the stream starts
+        if was_streaming:
+            self.start_stream()
+        return error
+    
     def start_stream(self):
         """Start video streaming"""
         if not self.is_open:
@@ -381,83 +1996,96 @@ class ASICamera:
         
         # Enable auto exposure for video mode, but limit max exposure time
         # This allows the camera to adjust exposure automatically while respecting the max limit
-        video_exposure = camera_state['video_exposure']  # microseconds
-        gain = camera_state['gain']
+        video_exposure = self.video_exposure()  # microseconds
+        gain = self.state['gain']
         
         # Set gain first (must be set before starting video capture)
-        result_gain = asi_lib.ASISetControlValue(self.camera_id, ASI_GAIN, gain, ASI_FALSE)
+        result_gain = self.set_control(ASI_GAIN, gain, ASI_FALSE)
         
         # Set gamma
-        gamma = camera_state.get('gamma', 50)
-        result_gamma = asi_lib.ASISetControlValue(self.camera_id, ASI_GAMMA, gamma, ASI_FALSE)
+        gamma = self.state.get('gamma', 50)
+        result_gamma = self.set_control(ASI_GAMMA, gamma, ASI_FALSE)
         
         # Set white balance (only for color cameras)
         if self.is_color_cam:
-            wb_auto = camera_state.get('wb_auto', False)
+            wb_auto = self.state.get('wb_auto', False)
             if wb_auto:
                 # Set auto white balance
-                result_wb_r = asi_lib.ASISetControlValue(self.camera_id, ASI_WB_R, 0, ASI_TRUE)
-                result_wb_b = asi_lib.ASISetControlValue(self.camera_id, ASI_WB_B, 0, ASI_TRUE)
+                result_wb_r = self.set_control(ASI_WB_R, 0, ASI_TRUE)
+                result_wb_b = self.set_control(ASI_WB_B, 0, ASI_TRUE)
             else:
                 # Set manual white balance
-                wb_r = camera_state.get('wb_r', 50)
-                wb_b = camera_state.get('wb_b', 50)
-                result_wb_r = asi_lib.ASISetControlValue(self.camera_id, ASI_WB_R, wb_r, ASI_FALSE)
-                result_wb_b = asi_lib.ASISetControlValue(self.camera_id, ASI_WB_B, wb_b, ASI_FALSE)
+                wb_r = self.state.get('wb_r', 50)
+                wb_b = self.state.get('wb_b', 50)
+                result_wb_r = self.set_control(ASI_WB_R, wb_r, ASI_FALSE)
+                result_wb_b = self.set_control(ASI_WB_B, wb_b, ASI_FALSE)
         else:
             result_wb_r = None
             result_wb_b = None
         
         # Set manual exposure for video mode (we're in manual mode, so ASI_AUTO_MAX_EXP is not needed)
-        result_manual = asi_lib.ASISetControlValue(self.camera_id, ASI_EXPOSURE, video_exposure, ASI_FALSE)
+        result_manual = self.set_control(ASI_EXPOSURE, video_exposure, ASI_FALSE)
         
         # Try auto exposure for video mode (may not work well with gain on Linux)
         # Commented out for now - using manual exposure instead
-        # result_auto = asi_lib.ASISetControlValue(self.camera_id, ASI_EXPOSURE, 0, ASI_TRUE)
-        
-        # Verify gain was set
-        actual_gain = ctypes.c_long(0)
-        auto_gain = ctypes.c_int(0)
-        asi_lib.ASIGetControlValue(self.camera_id, ASI_GAIN, ctypes.byref(actual_gain), ctypes.byref(auto_gain))
+        # result_auto = self.set_control(ASI_EXPOSURE, 0, ASI_TRUE)
         
-        # Verify exposure was set
-        actual_exp = ctypes.c_long(0)
-        auto_exp = ctypes.c_int(0)
-        asi_lib.ASIGetControlValue(self.camera_id, ASI_EXPOSURE, ctypes.byref(actual_exp), ctypes.byref(auto_exp))
-        
-        print(f"[start_stream] Set gain to {gain} (result: {result_gain}, actual: {actual_gain.value})")
+        print(f"[start_stream] Set gain to {gain} (result: {result_gain})")
         print(f"[start_stream] Set gamma to {gamma} (result: {result_gamma})")
         if self.is_color_cam:
-            wb_auto = camera_state.get('wb_auto', False)
+            wb_auto = self.state.get('wb_auto', False)
             if wb_auto:
                 print(f"[start_stream] Set auto white balance (R result: {result_wb_r}, B result: {result_wb_b})")
             else:
-                wb_r = camera_state.get('wb_r', 50)
-                wb_b = camera_state.get('wb_b', 50)
+                wb_r = self.state.get('wb_r', 50)
+                wb_b = self.state.get('wb_b', 50)
                 print(f"[start_stream] Set manual white balance R: {wb_r} (result: {result_wb_r}), B: {wb_b} (result: {result_wb_b})")
         print(f"[start_stream] Set video exposure to {video_exposure} μs ({video_exposure/1000:.1f} ms)")
-        print(f"[start_stream] Manual exposure result: {result_manual}, actual: {actual_exp.value} μs, auto: {auto_exp.value}")
+        print(f"[start_stream] Manual exposure result: {result_manual}")
+        
+        # Select the stream format (RGB24, or RAW8 to cut USB bandwidth to a third)
+        video_format = self.video_format()
+        result_format = self.set_roi_format(video_format)
+        if result_format != ASI_SUCCESS:
+            print(f"[start_stream] Warning: Failed to set video format {video_format}: {result_format}")
         
         print(f"[start_stream] Starting video capture")
         
         result = asi_lib.ASIStartVideoCapture(self.camera_id)
         if result != ASI_SUCCESS:
-            camera_state['error'] = f"Failed to start video capture: {result}"
+            count_asi_error(self, 'ASIStartVideoCapture', result)
+            self.state['error'] = f"Failed to start video capture: {result}"
             return False
         
+        self._prepare_frame_ring()
+        self.state['dropped_frames'] = 0  # The SDK's count restarts with video capture
+        self.stream_started = time.time()
+        self.health['video_errors'] = 0
         self.streaming = True
-        camera_state['streaming'] = True
+        self.stream_wanted = True
+        self.state['streaming'] = True
         
         # Start capture thread
         self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
         self.capture_thread.start()
+        status_sampler.notify()
         
         return True
     
-    def stop_stream(self):
-        """Stop video streaming - simplified like asicap, just call SDK"""
+    def stop_stream(self, pause=False):
+        """Stop video streaming - simplified like asicap, just call SDK
+        
+        pause=True stops it only for the moment (a photo, a restart or a recovery) and keeps stream_wanted.
+        """
+        if not pause:
+            self.stream_wanted = False
         self.streaming = False
-        camera_state['streaming'] = False
+        self.state['streaming'] = False
+        status_sampler.notify()
+        
+        # Wake stream clients blocked waiting for the next frame
+        if self.frame_ring:
+            self.frame_ring.interrupt()
         
         if self.capture_thread:
             self.capture_thread.join(timeout=2.0)
@@ -470,52 +2098,153 @@ class ASICamera:
             else:
                 print("[stop_stream] Video capture stopped successfully")
     
+    def wait_frame(self, after_seq=0, timeout=None):
+        """Block until a frame newer than after_seq is captured; return (seq, slot) with a reference held, or None"""
+        ring = self.frame_ring
+        if ring is None:
+            time.sleep(timeout or 0)
+            return None
+        return ring.wait(after_seq, timeout)
+    
+    def frame_image(self, slot):
+        """Copy a video frame slot into a PIL Image (RAW8 colour frames are demosaiced)"""
+        if slot.bayer is not None:
+            return Image.fromarray(demosaic_bilinear(slot.array, slot.bayer), 'RGB')
+        return Image.fromarray(slot.array.copy(), 'RGB' if slot.array.ndim == 3 else 'L')
+    
+    def average_frames(self, count):
+        """Average the next count video frames without stopping the stream; return a PIL Image or None
+        
+        Frames are summed into one float32 accumulator in place, so memory is one frame whatever
+        the count. RAW8 colour frames are averaged as Bayer mosaics and demosaiced once at the end.
+        """
+        ring = self.frame_ring
+        last_seq = ring.seq if ring else 0
+        frame_timeout = self.video_exposure() / 1000000.0 * 2 + 1.0
+        accumulator = None
+        bayer = None
+        
+        for _ in range(count):
+            frame = self.wait_frame(last_seq, timeout=frame_timeout)
+            if frame is None:
+                print("[average_frames] Stream stopped before enough frames were captured")
+                return None
+            last_seq, slot = frame
+            try:
+                if accumulator is None:
+                    accumulator = slot.array.astype(np.float32)
+                    bayer = slot.bayer
+                elif slot.array.shape != accumulator.shape:
+                    print("[average_frames] Frame size changed while averaging")
+                    return None
+                else:
+                    np.add(accumulator, slot.array, out=accumulator)
+            finally:
+                slot.release()
+        
+        accumulator *= 1.0 / count
+        averaged = np.rint(accumulator, out=accumulator).astype(np.uint8)
+        if bayer is not None:
+            return Image.fromarray(demosaic_bilinear(averaged, bayer), 'RGB')
+        return Image.fromarray(averaged, 'RGB' if averaged.ndim == 3 else 'L')
+    
+    def _prepare_frame_ring(self):
+        """Allocate the video frame ring, reusing it across stream restarts unless the frame size changed"""
+        bytes_per_pixel = 3 if self.video_format() == ASI_IMG_RGB24 else 1
+        buffer_size = self.state['width'] * self.state['height'] * bytes_per_pixel
+        ring = self.frame_ring
+        if ring is None or ring.size != buffer_size:
+            self.frame_ring = FrameRing(FRAME_RING_SLOTS, buffer_size, start_seq=ring.seq if ring else 0)
+            if ring:
+                ring.interrupt()
+    
     def _capture_loop(self):
         """Continuous capture loop for streaming"""
-        width = camera_state['width']
-        height = camera_state['height']
-        buffer_size = width * height * 3  # RGB24
-        buffer = (ctypes.c_ubyte * buffer_size)()
+        width = self.state['width']
+        height = self.state['height']
+        ring = self.frame_ring
+        buffer_size = ring.size
+        video_format = self.video_format()
+        if video_format == ASI_IMG_RGB24:
+            shape, bayer = (height, width, 3), None
+        else:
+            # RAW8: colour frames are demosaiced by the encoder, mono frames are already grayscale
+            shape, bayer = (height, width), (self.bayer_pattern if self.is_color_cam else None)
         consecutive_errors = 0
+        next_drop_check = time.monotonic() + DROPPED_FRAMES_POLL_INTERVAL
+        camera_label = str(self.index)
         
         while self.streaming and self.is_open:
+            # Every buffer may be held by readers - block until one is released
+            slot = ring.acquire_write(timeout=0.5)
+            if slot is None:
+                continue
+            
             # Calculate timeout based on video exposure time
             # SDK recommends: exposure*2+500ms
-            video_exposure_ms = camera_state['video_exposure'] / 1000.0  # Convert to ms
+            video_exposure_ms = self.video_exposure() / 1000.0  # Convert to ms
             timeout_ms = int(video_exposure_ms * 2 + 500)
             timeout_ms = max(100, min(timeout_ms, 5000))  # Clamp between 100ms and 5s (was 1s minimum)
             
-            drop_frames = ctypes.c_int(0)
+            read_started = time.perf_counter()
             result = asi_lib.ASIGetVideoData(
                 self.camera_id,
-                ctypes.byref(buffer),
+                ctypes.byref(slot.buffer),
                 buffer_size,
-                timeout_ms,
-                ctypes.byref(drop_frames)
+                timeout_ms
             )
             
             if result == ASI_SUCCESS:
+                metrics.observe('camera_stage_seconds', time.perf_counter() - read_started, stage='capture')
                 consecutive_errors = 0  # Reset error counter
-                # Convert to numpy array
-                img_array = np.frombuffer(buffer, dtype=np.uint8)
-                img_array = img_array.reshape((height, width, 3))
-                
-                # Convert to PIL Image
-                img = Image.fromarray(img_array, mode='RGB')
-                self.frame_buffer = img
-                camera_state['current_frame'] = img
-            elif result != 2:  # 2 = timeout, which is normal
-                consecutive_errors += 1
-                # Only print error if it persists
-                if consecutive_errors == 1 or consecutive_errors % 10 == 0:
-                    print(f"Error getting video data: {result} (consecutive: {consecutive_errors})")
+                # Publish the slot as a zero-copy shaped view - no per-frame allocation
+                timestamp = time.time()
+                seq = ring.publish(slot, shape, timestamp, bayer)
+                self.state['frame_seq'] = seq
+                self.state['frame_time'] = timestamp
+                self.capture_rate.tick()
+                metrics.inc('camera_frames_captured_total', camera=camera_label)
+                self.health['video_errors'] = 0
+            else:
+                ring.discard(slot)
+                # A timeout just means no frame was ready yet; a camera that stops delivering
+                # frames altogether is caught by the supervisor's stall check instead
+                if result != ASI_ERROR_TIMEOUT:
+                    count_asi_error(self, 'ASIGetVideoData', result)
+                    consecutive_errors += 1
+                    self.health['video_errors'] = consecutive_errors
+                    # Only print error if it persists
+                    if consecutive_errors == 1 or consecutive_errors % 10 == 0:
+                        print(f"Error getting video data: {result} (consecutive: {consecutive_errors})")
+                    # Failing calls return at once - don't spin while the supervisor decides what to do
+                    time.sleep(VIDEO_ERROR_RETRY_DELAY)
+                if self.health['fatal_error'] is not None:
+                    # The camera is gone - stop reading and let the supervisor reopen it
+                    print(f"[Capture] Camera lost ({ASI_ERROR_NAMES.get(result, result)}), capture loop stopping")
+                    break
             
-            # Minimal sleep - let camera exposure time control the actual frame rate
-            # If exposure is short, we'll get frames faster; if long, we'll wait longer
-            time.sleep(0.001)  # 1ms sleep - much shorter to allow FPS to vary with exposure
+            if time.monotonic() >= next_drop_check:
+                # The SDK counts frames it had to drop because they were not collected in time
+                next_drop_check = time.monotonic() + DROPPED_FRAMES_POLL_INTERVAL
+                dropped = ctypes.c_int(0)
+                if asi_lib.ASIGetDroppedFrames(self.camera_id, ctypes.byref(dropped)) == ASI_SUCCESS:
+                    if dropped.value > self.state['dropped_frames']:
+                        metrics.inc('camera_dropped_frames_total', dropped.value - self.state['dropped_frames'], camera=camera_label)
+                    self.state['dropped_frames'] = dropped.value
+            # No sleep needed - ASIGetVideoData blocks until the next frame, so exposure sets the frame rate
     
     def capture_snapshot(self):
-        """Capture a single snapshot"""
+        """Capture a single snapshot, counting failed exposures for the supervisor"""
+        # Serialized with supervisor recovery: a reset never interrupts an exposure
+        with self.exposure_lock:
+            img = self._capture_snapshot()
+        if img is None:
+            self.health['exposure_failures'] += 1
+        else:
+            self.health['exposure_failures'] = 0
+        return img
+    
+    def _capture_snapshot(self):
         if not self.is_open:
             print("[capture_snapshot] Camera not open")
             return None
@@ -523,7 +2252,7 @@ class ASICamera:
         # Ensure video capture is stopped (if it was running)
         if self.streaming:
             print("[capture_snapshot] Warning: Camera is streaming, stopping...")
-            self.stop_stream()
+            self.stop_stream(pause=True)
             time.sleep(0.5)
         
         # Simplified approach like asicap: just stop video if needed, then start exposure
@@ -532,34 +2261,33 @@ class ASICamera:
         # If streaming, stop it first
         if self.streaming:
             print("[capture_snapshot] Stopping stream before snapshot...")
-            self.stop_stream()
+            self.stop_stream(pause=True)
             time.sleep(0.1)  # Brief pause for SDK to process
         
         # Set exposure and gain (disable auto for photo mode)
-        exposure = camera_state['exposure']
-        gain_val = camera_state['gain']
+        exposure = self.state['exposure']
+        gain_val = self.state['gain']
         
         # Disable auto exposure and set manual values
-        asi_lib.ASISetControlValue(self.camera_id, ASI_EXPOSURE, exposure, ASI_FALSE)
-        asi_lib.ASISetControlValue(self.camera_id, ASI_GAIN, gain_val, ASI_FALSE)
+        self.set_control(ASI_EXPOSURE, exposure)
+        self.set_control(ASI_GAIN, gain_val)
         
         print(f"[capture_snapshot] Starting exposure: {exposure} μs, gain: {gain_val}")
         
         # Start exposure - SDK will return error if video mode is still active
+        started = time.monotonic()
         result = asi_lib.ASIStartExposure(self.camera_id, 0)  # 0 = not dark frame
         
         if result != ASI_SUCCESS:
-            error_names = {
-                14: "ASI_ERROR_VIDEO_MODE_ACTIVE",
-                15: "ASI_ERROR_EXPOSURE_IN_PROGRESS",
-            }
-            error_name = error_names.get(result, f"ERROR_{result}")
+            count_asi_error(self, 'ASIStartExposure', result)
+            error_name = ASI_ERROR_NAMES.get(result, f"ERROR_{result}")
             print(f"[capture_snapshot] Failed to start exposure: {result} ({error_name})")
             # If video mode is still active, try stopping again
             if result == 14:  # ASI_ERROR_VIDEO_MODE_ACTIVE
                 print("[capture_snapshot] Video mode still active, stopping again...")
                 asi_lib.ASIStopVideoCapture(self.camera_id)
                 time.sleep(0.2)
+                started = time.monotonic()
                 result = asi_lib.ASIStartExposure(self.camera_id, 0)
                 if result != ASI_SUCCESS:
                     print(f"[capture_snapshot] Still failed after retry: {result}")
@@ -568,30 +2296,16 @@ class ASICamera:
                 return None
         
         # Wait for exposure to complete
-        status = ctypes.c_int(0)
-        timeout = 0
-        max_timeout = (exposure // 1000) + 5000  # ms
-        
-        while timeout < max_timeout:
-            asi_lib.ASIGetExpStatus(self.camera_id, ctypes.byref(status))
-            if status.value == 2:  # ASI_EXP_SUCCESS
-                break
-            if status.value == 3:  # ASI_EXP_FAILED - don't wait, fail immediately
-                status_name = status_names.get(status.value, f"UNKNOWN_{status.value}")
-                print(f"[capture_snapshot] Exposure failed with status: {status.value} ({status_name}) at timeout: {timeout}ms")
-                return None
-            time.sleep(0.1)
-            timeout += 100
-        
-        if status.value != 2:
-            status_name = status_names.get(status.value, f"UNKNOWN_{status.value}")
-            print(f"[capture_snapshot] Exposure failed with status: {status.value} ({status_name}) after {timeout}ms")
+        status = self._wait_for_exposure(exposure, started)
+        if status != ASI_EXP_SUCCESS:
+            # Return the camera to idle so the next exposure does not wait on a FAILED state
+            asi_lib.ASIStopExposure(self.camera_id)
             return None
         
         # Get image data based on format
-        width = camera_state['width']
-        height = camera_state['height']
-        img_format = camera_state['image_format']
+        width = self.state['width']
+        height = self.state['height']
+        img_format = self.state['image_format']
         
         # Calculate buffer size based on format
         if img_format == ASI_IMG_RGB24:
@@ -607,29 +2321,23 @@ class ASICamera:
             print(f"[capture_snapshot] Unsupported image format: {img_format}")
             return None
 
+        readout_started = time.monotonic()
         result = asi_lib.ASIGetDataAfterExp(self.camera_id, ctypes.byref(buffer), buffer_size)
+        readout = time.monotonic() - readout_started
+        self.exposure_timing['readout_ms'] = round(readout * 1000.0, 1)
         
         if result != ASI_SUCCESS:
-            error_names = {
-                1: "ASI_ERROR_INVALID_INDEX",
-                2: "ASI_ERROR_INVALID_ID", 
-                3: "ASI_ERROR_INVALID_CONTROL_TYPE",
-                4: "ASI_ERROR_CAMERA_CLOSED",
-                5: "ASI_ERROR_CAMERA_REMOVED",
-                11: "ASI_ERROR_TIMEOUT",
-                13: "ASI_ERROR_BUFFER_TOO_SMALL",
-                16: "ASI_ERROR_GENERAL_ERROR"
-            }
-            error_name = error_names.get(result, f"UNKNOWN_ERROR_{result}")
+            count_asi_error(self, 'ASIGetDataAfterExp', result)
+            error_name = ASI_ERROR_NAMES.get(result, f"UNKNOWN_ERROR_{result}")
             print(f"[capture_snapshot] Failed to get image data: {result} ({error_name})")
             print(f"[capture_snapshot] Buffer size requested: {buffer_size}, format: {img_format}, width: {width}, height: {height}")
             # Check exposure status
             status_check = ctypes.c_int(0)
             asi_lib.ASIGetExpStatus(self.camera_id, ctypes.byref(status_check))
-            status_names = {0: "ASI_EXP_IDLE", 1: "ASI_EXP_WORKING", 2: "ASI_EXP_SUCCESS", 3: "ASI_EXP_FAILED"}
-            status_name = status_names.get(status_check.value, f"UNKNOWN_{status_check.value}")
+            status_name = EXP_STATUS_NAMES.get(status_check.value, f"UNKNOWN_{status_check.value}")
             print(f"[capture_snapshot] Exposure status when getting data: {status_check.value} ({status_name})")
             return None
+        metrics.observe('camera_stage_seconds', readout, stage='readout')
 
         # Convert to PIL Image based on format
         if img_format == ASI_IMG_RGB24:
@@ -641,127 +2349,1231 @@ class ASICamera:
             img_array = img_array.reshape((height, width))
             img = Image.fromarray(img_array, 'L')  # Grayscale
         elif img_format == ASI_IMG_RAW8:
-            # RAW8: Simple debayering (Bayer pattern to RGB)
-            # For now, convert to grayscale for display, but save as RAW data
+            # RAW8: demosaic colour sensors with the camera's Bayer pattern; mono sensors are grayscale
             img_array = np.frombuffer(buffer, dtype=np.uint8)
             img_array = img_array.reshape((height, width))
-            # Simple debayering: treat as grayscale for now
-            # TODO: Implement proper Bayer demosaicing
-            img = Image.fromarray(img_array, 'L')
+            if self.is_color_cam:
+                img = Image.fromarray(demosaic_bilinear(img_array, self.bayer_pattern), 'RGB')
+            else:
+                img = Image.fromarray(img_array, 'L')
         elif img_format == ASI_IMG_RAW16:
-            # RAW16: Convert byte buffer to uint16 array (little-endian)
-            img_array = np.frombuffer(buffer, dtype=np.uint8)
-            # Reshape to pairs and convert to uint16
-            img_array_pairs = img_array.reshape((height * width, 2))
-            img_array_16bit = img_array_pairs[:, 0].astype(np.uint16) | (img_array_pairs[:, 1].astype(np.uint16) << 8)
-            img_array_16bit = img_array_16bit.reshape((height, width))
-            # Scale to 8-bit for display (use upper 8 bits)
-            img_array_8bit = (img_array_16bit >> 8).astype(np.uint8)
-            img = Image.fromarray(img_array_8bit, 'L')
+            # RAW16: zero-copy little-endian 16-bit view of the SDK buffer, kept at full depth
+            # (colour sensors keep the raw Bayer mosaic; JPEG output is demosaiced and auto-stretched)
+            img_array = np.frombuffer(buffer, dtype='<u2').reshape((height, width))
+            img = Image.fromarray(img_array)
+            if self.is_color_cam:
+                img.info['bayer'] = self.bayer_pattern
         else:
             print(f"[capture_snapshot] Unsupported format: {img_format}")
             return None
-
+        
+        timing = self.exposure_timing
+        print(f"[capture_snapshot] Exposure done {timing['overrun_ms']} ms after expected end "
+              f"({timing['polls']} status polls), readout {timing['readout_ms']} ms")
         return img
+    
+    def _wait_for_exposure(self, exposure, started):
+        """Wait for a started exposure on a monotonic clock and return its final ASI_EXP_* status
+        
+        Sleeps until shortly before the expected end (checking for failure once per coarse step),
+        then polls ASIGetExpStatus finely so completion is noticed within a few milliseconds.
+        """
+        expected_end = started + exposure / 1000000.0
+        deadline = expected_end + EXPOSURE_TIMEOUT_MARGIN
+        status = ctypes.c_int(ASI_EXP_WORKING)
+        polls = 0
+        
+        while True:
+            asi_lib.ASIGetExpStatus(self.camera_id, ctypes.byref(status))
+            polls += 1
+            now = time.monotonic()
+            if status.value in (ASI_EXP_SUCCESS, ASI_EXP_FAILED) or now >= deadline:
+                break
+            if status.value == ASI_EXP_IDLE and now >= expected_end:
+                break  # Exposure was aborted
+            remaining = expected_end - EXPOSURE_POLL_LEAD - now
+            if remaining > 0:
+                time.sleep(min(remaining, EXPOSURE_COARSE_STEP))
+            else:
+                time.sleep(EXPOSURE_POLL_INTERVAL)
+        
+        elapsed_ms = (now - started) * 1000.0
+        self.exposure_timing = {
+            'exposure_ms': exposure / 1000.0,
+            'elapsed_ms': round(elapsed_ms, 1),
+            'overrun_ms': round((now - expected_end) * 1000.0, 1),
+            'polls': polls,
+            'readout_ms': None
+        }
+        if status.value == ASI_EXP_SUCCESS:
+            metrics.observe('camera_exposure_overrun_seconds', max(now - expected_end, 0.0))
+        else:
+            status_name = EXP_STATUS_NAMES.get(status.value, f"UNKNOWN_{status.value}")
+            print(f"[capture_snapshot] Exposure failed with status: {status.value} ({status_name}) after {elapsed_ms:.0f}ms")
+        return status.value
 
-def sequence_capture_loop():
-    """Background thread for sequence capture"""
-    import os
+# Settings: requests closer together than SETTINGS_DEBOUNCE (s) are merged into one transaction,
+# but a continuous slider drag is still applied at least every SETTINGS_MAX_DELAY
+SETTINGS_DEBOUNCE = 0.15
+SETTINGS_MAX_DELAY = 1.0
+SETTINGS_WAIT_TIMEOUT = 10.0  # How long a request waits for its transaction to be applied
+
+# Settings backed by an SDK control (validated against the camera's caps table), and the ones
+# that can only change while video capture is stopped
+SETTINGS_CONTROLS = {'gain': ASI_GAIN, 'gamma': ASI_GAMMA, 'exposure': ASI_EXPOSURE,
+                     'video_exposure': ASI_EXPOSURE, 'wb_r': ASI_WB_R, 'wb_b': ASI_WB_B}
+SETTINGS_LIVE_KEYS = ('gain', 'gamma', 'video_exposure', 'wb_auto', 'wb_r', 'wb_b')
+SETTINGS_RESTART_KEYS = ('video_format',)
+
+class SettingsTransaction:
+    """Merges bursts of settings changes and applies them to the camera as one transaction
+    
+    The first request of a burst waits until no new change has arrived for the debounce time,
+    then applies the merged changes (last value wins) while the others wait for that result.
+    Controls the SDK accepts during video capture are written live; the stream is restarted at
+    most once, only for format changes or if a live write is refused.
+    """
+    def __init__(self, camera, debounce=SETTINGS_DEBOUNCE, max_delay=SETTINGS_MAX_DELAY):
+        self.camera = camera
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.apply_lock = threading.Lock()  # Transactions never overlap
+        self.pending = {}
+        self.batch = None
+        self.last_change = 0.0
     
-    while sequence_state['active']:
+    def submit(self, changes, timeout=SETTINGS_WAIT_TIMEOUT):
+        """Merge changes (state key -> value) into the pending transaction and wait for it to be applied"""
+        with self.lock:
+            self.pending.update(changes)
+            self.last_change = time.monotonic()
+            batch = self.batch
+            leader = batch is None
+            if leader:
+                batch = self.batch = {'done': threading.Event(), 'result': None, 'requests': 0}
+            batch['requests'] += 1
+        
+        if not leader:
+            batch['done'].wait(timeout)
+            return batch['result']
+        
+        started = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                quiet_left = self.last_change + self.debounce - now
+                if quiet_left <= 0 or now - started >= self.max_delay:
+                    merged, self.pending, self.batch = self.pending, {}, None
+                    break
+            time.sleep(min(quiet_left, self.max_delay - (now - started)))
+        
         try:
-            if sequence_state['current_count'] >= sequence_state['total_count']:
-                sequence_state['active'] = False
-                print(f"[Sequence] Completed {sequence_state['current_count']}/{sequence_state['total_count']} photos")
-                break
-            
-            # Capture photo
-            was_streaming = camera.streaming
-            if was_streaming:
-                camera.stop_stream()
-                time.sleep(1.0)
-                
-                # Ensure camera is idle
-                status = ctypes.c_int(0)
-                asi_lib.ASIGetExpStatus(camera.camera_id, ctypes.byref(status))
-                if status.value != 0:
-                    asi_lib.ASIStopExposure(camera.camera_id)
-                    time.sleep(0.5)
-            
-            # Apply format if needed
-            photo_format = camera_state['image_format']
-            width = camera_state['width']
-            height = camera_state['height']
-            format_applied = False
-            
-            if photo_format != ASI_IMG_RGB24:
-                asi_lib.ASISetROIFormat(camera.camera_id, width, height, 1, photo_format)
-                format_applied = True
-            
-            # Capture
-            img = camera.capture_snapshot()
+            batch['result'] = self.apply(merged, batch['requests'])
+        finally:
+            batch['done'].set()
+        return batch['result']
+    
+    def apply(self, changes, requests=1):
+        """Apply merged changes to the state and camera; return what changed and whether the stream restarted"""
+        cam = self.camera
+        with self.apply_lock:
+            changed = sorted(key for key, value in changes.items() if cam.state.get(key) != value)
+            cam.state.update(changes)
+            result = {'changed': changed, 'requests': requests, 'restarted': False}
+            if not changed or not cam.is_open:
+                print(f"[Settings] Transaction of {requests} request(s): {', '.join(changed) or 'no changes'}"
+                      f"{'' if cam.is_open else ' (camera closed, applied on connect/stream start)'}")
+                return result
             
-            # Restore format if needed
-            if was_streaming and format_applied:
-                asi_lib.ASISetROIFormat(camera.camera_id, width, height, 1, ASI_IMG_RGB24)
-                time.sleep(0.3)
+            # Format changes need video capture stopped; a sequence overriding the format restores it itself.
+            # So do controls the caps table marks as not writable while streaming.
+            restart = cam.streaming and cam.stream_format is None and any(k in SETTINGS_RESTART_KEYS for k in changed)
+            live_controls = [SETTINGS_CONTROLS[k] for k in changed if k in SETTINGS_LIVE_KEYS and k in SETTINGS_CONTROLS]
+            if cam.streaming and not all(cam.control_live(control) for control in live_controls):
+                restart = True
+            if not restart and any(k in SETTINGS_LIVE_KEYS for k in changed):
+                failed = [name for name, result_code in self._write_controls(changed) if result_code != ASI_SUCCESS]
+                if failed and cam.streaming:
+                    print(f"[Settings] SDK refused {', '.join(failed)} during video capture, restarting stream")
+                    restart = True
             
-            if was_streaming:
+            if restart:
+                # start_stream writes every control from the state, so one restart applies them all
+                cam.stop_stream(pause=True)
+                result['restarted'] = cam.start_stream()
+            print(f"[Settings] Transaction of {requests} request(s): {', '.join(changed)}"
+                  f"{' (stream restarted)' if restart else ''}")
+            return result
+    
+    def _write_controls(self, changed):
+        """Write the changed live controls to the camera; return [(name, result)]"""
+        cam = self.camera
+        state = cam.state
+        results = []
+        if 'gain' in changed:
+            results.append(('gain', cam.set_control(ASI_GAIN, state['gain'], ASI_FALSE)))
+        if 'gamma' in changed:
+            results.append(('gamma', cam.set_control(ASI_GAMMA, state['gamma'], ASI_FALSE)))
+        if 'video_exposure' in changed and cam.streaming and cam.stream_exposure is None:
+            # Photos set their own exposure; the capture loop picks the new frame timeout up itself
+            results.append(('video_exposure', cam.set_control(ASI_EXPOSURE, state['video_exposure'], ASI_FALSE)))
+        if cam.is_color_cam and any(k in changed for k in ('wb_auto', 'wb_r', 'wb_b')):
+            if state.get('wb_auto', False):
+                results.append(('wb_r', cam.set_control(ASI_WB_R, 0, ASI_TRUE)))
+                results.append(('wb_b', cam.set_control(ASI_WB_B, 0, ASI_TRUE)))
+            else:
+                results.append(('wb_r', cam.set_control(ASI_WB_R, state['wb_r'], ASI_FALSE)))
+                results.append(('wb_b', cam.set_control(ASI_WB_B, state['wb_b'], ASI_FALSE)))
+        for name, result_code in results:
+            if result_code != ASI_SUCCESS:
+                print(f"[Settings] Failed to set {name}: {result_code}")
+        return results
+
+class DiskWriter:
+    """Bounded background queue that encodes and writes images to disk on worker threads
+
+    Capture threads hand frames over and move on; they only block (backpressure) when
+    `max_queue` frames are already waiting. Workers are started on first use so they are
+    never running when the encoder pool forks.
+    """
+    def __init__(self, name, workers=2, max_queue=4):
+        self.name = name
+        self.num_workers = workers
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.threads = []
+        self.stats = {'queued': 0, 'written': 0, 'failed': 0, 'backpressure_waits': 0,
+                      'last_write_ms': None, 'avg_write_ms': None, 'max_write_ms': None}
+    
+    def _start(self):
+        with self.lock:
+            if not self.threads:
+                self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.num_workers)]
+                for thread in self.threads:
+                    thread.start()
+    
+    def submit(self, img, path, fmt, label=None, **options):
+        """Queue an image to be written to path, blocking only while the queue is full"""
+        self._start()
+        with self.lock:
+            self.stats['queued'] += 1
+            if self.queue.full():
+                self.stats['backpressure_waits'] += 1
+                print(f"[{self.name}] Write queue full ({self.queue.maxsize}), waiting for the disk...")
+        self.queue.put((img, path, fmt, label, options))
+    
+    def _worker(self):
+        while True:
+            img, path, fmt, label, options = self.queue.get()
+            started = time.monotonic()
+            try:
+                encode_image(img, fmt, path=path, **options)
+                write_ms = (time.monotonic() - started) * 1000.0
+                with self.lock:
+                    stats = self.stats
+                    stats['written'] += 1
+                    stats['last_write_ms'] = round(write_ms, 1)
+                    stats['max_write_ms'] = round(max(stats['max_write_ms'] or 0.0, write_ms), 1)
+                    previous_avg = stats['avg_write_ms'] or write_ms
+                    stats['avg_write_ms'] = round(previous_avg + (write_ms - previous_avg) / stats['written'], 1)
+                print(f"[{self.name}] Saved {label or os.path.basename(path)} in {write_ms:.0f} ms")
+            except Exception as e:
+                with self.lock:
+                    self.stats['failed'] += 1
+                print(f"[{self.name}] Failed to write {path}: {e}")
+            finally:
+                self.queue.task_done()
+    
+    def flush(self):
+        """Block until every queued image has been written"""
+        self.queue.join()
+    
+    def status(self):
+        with self.lock:
+            return dict(self.stats, queue_depth=self.queue.qsize(), queue_size=self.queue.maxsize)
+
+def sequence_capture_loop(camera):
+    """Background thread for sequence capture - switches the camera into its capture mode once per run"""
+    import os
+    
+    use_video = camera.sequence['mode'] == 'video'
+    
+    # The sequence owns the camera for the whole run, so snapshots and photo series cannot stop
+    # and restart the stream underneath it (in video mode that would silently drop frames)
+    with camera.photo_lock:
+        photo_format = camera.state['image_format']
+        was_streaming = camera.streaming
+        switch_started = time.perf_counter()
+        
+        if use_video:
+            # Video mode: stream at the photo exposure/format and save frames as they arrive
+            print(f"[Sequence] Capturing from video mode at {camera.state['exposure']} μs")
+            camera.set_stream_override(camera.state['exposure'], photo_format)
+            if not camera.streaming:
                 camera.start_stream()
-            
-            if img:
-                # Generate filename
-                sequence_state['current_count'] += 1
-                count = sequence_state['current_count']
-                total = sequence_state['total_count']
+            last_seq = camera.frame_ring.seq if camera.frame_ring else 0
+        else:
+            # Exposure mode: stop the stream and apply the photo format once for the whole sequence
+            # (not while a recovery is resetting the camera)
+            with camera.recovery_lock:
+                camera.pause_stream()
+                if was_streaming:
+                    time.sleep(0.5)
+                    
+                    # Ensure camera is idle
+                    status = ctypes.c_int(0)
+                    asi_lib.ASIGetExpStatus(camera.camera_id, ctypes.byref(status))
+                    if status.value != ASI_EXP_IDLE:
+                        asi_lib.ASIStopExposure(camera.camera_id)
+                        time.sleep(0.5)
                 
-                date_formatter = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                gain = camera_state['gain']
-                exposure = camera_state['exposure'] / 1000000.0  # Convert to seconds
+                if photo_format != camera.video_format() and camera.is_open:
+                    camera.set_roi_format(photo_format)
+        metrics.observe('camera_mode_switch_seconds', time.perf_counter() - switch_started,
+                        path='sequence', to='video' if use_video else 'exposure')
+        
+        next_capture = time.monotonic()
+        
+        while camera.sequence['active']:
+            try:
+                if camera.sequence['current_count'] >= camera.sequence['total_count']:
+                    # Stay active until the camera is switched back and pending writes are done
+                    print(f"[Sequence] Completed {camera.sequence['current_count']}/{camera.sequence['total_count']} photos")
+                    break
                 
-                file_format = sequence_state['file_format'].lower()
-                if file_format == 'jpeg':
-                    file_format = 'jpg'
+                # Time-lapse mode: wait for the next slot (interval measured from the previous capture start);
+                # fast mode captures back to back, so the exposure time sets the cadence
+                interval = camera.sequence.get('interval', 0)
+                while camera.sequence['active'] and time.monotonic() < next_capture:
+                    time.sleep(min(0.1, next_capture - time.monotonic()))
+                if not camera.sequence['active']:
+                    break
+                next_capture = time.monotonic() + interval
                 
-                filename = f"{date_formatter}_seq{count:04d}of{total:04d}_gain{gain}_exp{exposure:.3f}s.{file_format}"
-                filepath = os.path.join(sequence_state['save_path'], filename)
+                # Capture
+                if use_video:
+                    if interval > 0 and camera.frame_ring:
+                        last_seq = camera.frame_ring.seq  # Take a frame exposed after the scheduled time
+                    frame = camera.wait_frame(last_seq, timeout=camera.state['exposure'] / 1000000.0 * 2 + 1.0)
+                    img = None
+                    if frame:
+                        last_seq, slot = frame
+                        try:
+                            img = camera.frame_image(slot)
+                        finally:
+                            slot.release()
+                else:
+                    img = camera.capture_snapshot()
                 
-                # Save image
-                if sequence_state['file_format'] == 'JPEG':
-                    img.save(filepath, 'JPEG', quality=100)
-                elif sequence_state['file_format'] == 'PNG':
-                    img.save(filepath, 'PNG')
-                elif sequence_state['file_format'] == 'TIFF':
-                    img.save(filepath, 'TIFF')
+                if img:
+                    # Generate filename
+                    camera.sequence['current_count'] += 1
+                    count = camera.sequence['current_count']
+                    total = camera.sequence['total_count']
+                    
+                    date_formatter = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+                    gain = camera.state['gain']
+                    exposure = camera.state['exposure'] / 1000000.0  # Convert to seconds
+                    
+                    file_format = camera.sequence['file_format'].lower()
+                    if file_format == 'jpeg':
+                        file_format = 'jpg'
+                    
+                    filename = f"{date_formatter}_seq{count:04d}of{total:04d}_gain{gain}_exp{exposure:.3f}s.{file_format}"
+                    filepath = os.path.join(camera.sequence['save_path'], filename)
+                    
+                    # Hand the image to the background writer so the next exposure can start right away
+                    label = f"photo {count}/{total}: {filename}"
+                    if camera.sequence['file_format'] == 'JPEG':
+                        camera.sequence_writer.submit(img, filepath, 'JPEG', label, quality=100)
+                    elif camera.sequence['file_format'] == 'PNG':
+                        camera.sequence_writer.submit(img, filepath, 'PNG', label)
+                    elif camera.sequence['file_format'] == 'TIFF':
+                        camera.sequence_writer.submit(img, filepath, 'TIFF', label)
+                    
+                    print(f"[Sequence] Queued photo {count}/{total} for saving")
+                else:
+                    print(f"[Sequence] Failed to capture photo {camera.sequence['current_count'] + 1}/{camera.sequence['total_count']}")
                 
-                print(f"[Sequence] Saved photo {count}/{total}: {filename}")
-            else:
-                print(f"[Sequence] Failed to capture photo {sequence_state['current_count'] + 1}/{sequence_state['total_count']}")
+            except Exception as e:
+                print(f"[Sequence] Error during capture: {e}")
+                import traceback
+                traceback.print_exc()
+                time.sleep(1.0)
+        
+        # Switch the camera back once: restore the stream settings, or resume the stream we stopped
+        if use_video:
+            camera.set_stream_override()
+            if not was_streaming:
+                camera.stop_stream()
+        elif camera.stream_wanted:
+            with metrics.timer('camera_mode_switch_seconds', path='sequence', to='video'):
+                camera.resume_stream()
+        else:
+            camera.resume_stream()
+    
+    print(f"[Sequence] Sequence capture stopped, waiting for pending writes...")
+    camera.sequence_writer.flush()
+    print(f"[Sequence] All photos written")
+    camera.sequence['active'] = False
+
+def photo_series(camera, count, label='Photo'):
+    """Stop the stream and apply the photo format once, yield (index, img) for count photos, then restore
+    
+    img is None when a shot fails. Closing the generator early (e.g. a client disconnect) ends the
+    series and restores the stream.
+    """
+    with camera.photo_lock:
+        try:
+            # Not while a recovery is resetting the camera
+            with metrics.timer('camera_mode_switch_seconds', path='photo', to='exposure'), camera.recovery_lock:
+                if camera.streaming:
+                    print(f"[{label}] Stopping stream for {count} photo(s)...")
+                    camera.pause_stream()
+                    time.sleep(0.5)
+                else:
+                    camera.pause_stream()
+                
+                photo_format = camera.state['image_format']
+                if photo_format != camera.video_format() and camera.is_open:
+                    camera.set_roi_format(photo_format)
             
-            # Wait between photos
-            interval = sequence_state.get('interval', 0)  # Get interval (0 = fast mode)
-            if interval > 0:
-                # Time-lapse mode: use fixed interval
-                wait_time = interval
-                print(f"[Sequence] Waiting {wait_time} seconds until next photo (time-lapse mode)")
+            for index in range(count):
+                img = camera.capture_snapshot()
+                if img is None:
+                    print(f"[{label}] Failed to capture photo {index + 1}/{count}")
+                yield index, img
+        finally:
+            # start_stream re-applies the video format
+            if camera.stream_wanted and not camera.streaming:
+                print(f"[{label}] Resuming stream...")
+                with metrics.timer('camera_mode_switch_seconds', path='photo', to='video'):
+                    camera.resume_stream()
             else:
-                # Fast mode: at least exposure time + some buffer
-                exposure_ms = camera_state['exposure'] / 1000.0
-                wait_time = max(exposure_ms / 1000.0 + 0.5, 1.0)  # At least 1 second between photos
-                print(f"[Sequence] Waiting {wait_time:.2f} seconds until next photo (fast mode)")
-            time.sleep(wait_time)
+                camera.resume_stream()
+
+# Exposure jobs: results are kept until they are this old (s) or the cache outgrows its byte budget
+EXPOSURE_JOB_MAX_AGE = 600.0
+EXPOSURE_JOB_CACHE_BYTES = 256 * 1024 * 1024
+EXPOSURE_JOB_MAX_PENDING = 32
+
+class ExposureJobQueue:
+    """Runs exposure jobs one at a time on a background thread and caches their encoded results
+    
+    HTTP requests only create jobs and poll them, so long exposures never hold a connection or
+    a server thread. Finished jobs are evicted oldest first by age and by total result size.
+    """
+    def __init__(self, camera, max_age=EXPOSURE_JOB_MAX_AGE, max_bytes=EXPOSURE_JOB_CACHE_BYTES,
+                 max_pending=EXPOSURE_JOB_MAX_PENDING):
+        self.camera = camera
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self.jobs = OrderedDict()  # id -> job dict, oldest first
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.thread = None
+    
+    def submit(self, count=1, fmt='JPEG', mimetype='image/jpeg', **options):
+        """Queue a job for count photos and return its status, or None if too many jobs are waiting"""
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'state': 'queued',
+            'count': count,
+            'captured': 0,
+            'failed': 0,
+            'format': fmt,
+            'mimetype': mimetype,
+            'options': options,
+            'exposure': self.camera.state['exposure'],
+            'created': time.time(),
+            'finished': None,
+            'shot_started': None,
+            'cancelled': False,
+            'error': None,
+            'results': [],
+            'result_bytes': 0
+        }
+        with self.lock:
+            self._evict()
+            if sum(1 for j in self.jobs.values() if j['state'] in ('queued', 'exposing')) >= self.max_pending:
+                return None
+            self.jobs[job['id']] = job
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._worker, daemon=True)
+                self.thread.start()
+        self.pending.put(job)
+        print(f"[Exposure Job] {job['id']}: queued {count} photo(s) at {job['exposure']} μs")
+        return self.status(job['id'])
+    
+    def get(self, job_id):
+        with self.lock:
+            self._evict()
+            return self.jobs.get(job_id)
+    
+    def status(self, job_id):
+        """Progress and state of a job as a JSON-friendly dict, or None if unknown/evicted"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        done = job['captured'] + job['failed']
+        progress = done / job['count']
+        if job['state'] == 'exposing' and job['shot_started'] is not None and done < job['count']:
+            # Fraction of the current shot's exposure elapsed
+            shot = min((time.monotonic() - job['shot_started']) / max(job['exposure'] / 1000000.0, 0.001), 1.0)
+            progress += shot / job['count']
+        return {
+            'id': job['id'],
+            'state': job['state'],
+            'progress': round(min(progress, 1.0), 3),
+            'count': job['count'],
+            'captured': job['captured'],
+            'failed': job['failed'],
+            'format': job['format'].lower(),
+            'exposure': job['exposure'],
+            'created': datetime.fromtimestamp(job['created']).isoformat(),
+            'finished': datetime.fromtimestamp(job['finished']).isoformat() if job['finished'] else None,
+            'error': job['error'],
+            'results': [camera_path(self.camera, f"/camera/exposures/{job['id']}/result?index={i}") for i, r in enumerate(job['results']) if r]
+        }
+    
+    def cancel(self, job_id):
+        """Cancel a queued or running job (a running job stops after its current photo)"""
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job['cancelled'] = True
+        return True
+    
+    def _evict(self):
+        """Drop expired finished jobs, then the oldest finished ones until results fit the byte budget (lock held)"""
+        now = time.time()
+        finished = [j for j in self.jobs.values() if j['finished'] is not None]
+        total_bytes = sum(j['result_bytes'] for j in finished)
+        for job in finished:
+            if now - job['finished'] > self.max_age or total_bytes > self.max_bytes:
+                total_bytes -= job['result_bytes']
+                del self.jobs[job['id']]
+    
+    def _worker(self):
+        while True:
+            job = self.pending.get()
+            if not job['cancelled']:
+                self._run(job)
+            with self.lock:
+                if job['cancelled'] and job['state'] in ('queued', 'exposing'):
+                    job['state'] = 'cancelled'
+                job['finished'] = time.time()
+                self._evict()
+    
+    def _run(self, job):
+        if not self.camera.state['connected'] or not self.camera.is_open:
+            job['state'] = 'failed'
+            job['error'] = 'Camera not connected'
+            return
+        
+        job['state'] = 'exposing'
+        job['shot_started'] = time.monotonic()
+        series = photo_series(self.camera, job['count'], label=f"Exposure Job {job['id']}")
+        try:
+            for index, img in series:
+                if img is None:
+                    job['failed'] += 1
+                    job['results'].append(None)
+                else:
+                    data = encode_image(img, job['format'], **job['options'])
+                    job['results'].append(data)
+                    job['captured'] += 1
+                    with self.lock:
+                        job['result_bytes'] += len(data)
+                job['shot_started'] = time.monotonic()
+                if job['cancelled']:
+                    break
+        except Exception as e:
+            print(f"[Exposure Job] {job['id']}: exception: {e}")
+            job['error'] = str(e)
+        finally:
+            series.close()
+        
+        if job['cancelled']:
+            return
+        if job['captured'] == 0:
+            job['state'] = 'failed'
+            job['error'] = job['error'] or 'Failed to capture - camera returned None'
+        else:
+            job['state'] = 'done'
+        print(f"[Exposure Job] {job['id']}: {job['state']} ({job['captured']}/{job['count']} photos)")
+
+# Meteor detection tuning (distances in downsampled pixels, brightness in 0-255 units)
+METEOR_DETECTION = os.environ.get('METEOR_DETECTION', '0') == '1'  # Start the detector with the service
+METEOR_LOG_FILE = os.environ.get('METEOR_LOG_FILE')  # Optional JSON-lines log of detections
+METEOR_DOWNSAMPLE = 4  # Block size summed into one detection pixel
+METEOR_BACKGROUND_ALPHA = 0.05  # Running background update rate per frame
+METEOR_WARMUP_FRAMES = 10  # Frames used to build the background before detecting
+METEOR_SIGMA = 5.0  # Threshold in units of the background noise
+METEOR_MIN_DELTA = 8.0  # Minimum brightness increase over the background
+METEOR_MAX_FRACTION = 0.02  # More changed pixels than this is a global change (clouds, lights, exposure)
+METEOR_MIN_PIXELS = 6
+METEOR_MIN_LENGTH = 8.0
+METEOR_MAX_WIDTH = 2.0  # Points farther than this from the fitted line are not part of the streak
+METEOR_MIN_INLIERS = 0.8  # Fraction of changed pixels that must lie on the streak
+METEOR_MIN_ELONGATION = 4.0  # Streak length / width
+METEOR_MERGE_GAP = 0.5  # Seconds - detections closer together than this are one meteor
+METEOR_MAX_EVENTS = 500
+METEOR_MAX_IMAGES = 20  # Newest events that keep a JPEG of their first frame
+
+class MeteorDetector:
+    """Finds meteor streaks in the live stream
+    
+    A background thread takes the newest captured frame (skipping frames when it falls behind, so it
+    always keeps up with the capture rate), sums it into METEOR_DOWNSAMPLE blocks, differences it
+    against a running background, thresholds at METEOR_SIGMA times the noise and fits a line through
+    the changed pixels. Frames where those pixels form a long thin streak become detections.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.enabled = False
+        self.thread = None
+        self.lock = threading.Lock()
+        self.events = []  # Newest last
+        self.open_event = None
+        self.next_id = 1
+        self.background = None
+        self.noise = None
+        self.warmup = 0
+        self.stats = {'frames_processed': 0, 'frames_skipped': 0, 'global_changes': 0,
+                      'processing_ms': None, 'fps': None}
+    
+    def start(self):
+        with self.lock:
+            self.enabled = True
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._detect_loop, daemon=True)
+                self.thread.start()
+        print("[Meteor] Detection enabled")
+    
+    def stop(self):
+        self.enabled = False
+        print("[Meteor] Detection disabled")
+    
+    def _detect_loop(self):
+        last_seq = 0
+        last_time = None
+        while True:
+            with self.lock:
+                if not self.enabled:
+                    self._close_event()
+                    self.thread = None
+                    return
+            frame = self.source.wait_frame(last_seq, timeout=0.5)
+            if frame is None:
+                with self.lock:
+                    self._close_event(quiet_only=True)
+                continue
+            seq, slot = frame
+            started = time.monotonic()
+            try:
+                if last_seq and seq > last_seq + 1:
+                    self.stats['frames_skipped'] += seq - last_seq - 1
+                last_seq = seq
+                streak = self._process(slot.array)
+                if streak:
+                    self._record(streak, slot)
+            except Exception as e:
+                print(f"[Meteor] Error processing frame {seq}: {e}")
+            finally:
+                slot.release()
+            
+            now = time.monotonic()
+            with self.lock:
+                self._close_event(quiet_only=True)
+                stats = self.stats
+                stats['frames_processed'] += 1
+                processing_ms = (now - started) * 1000.0
+                stats['processing_ms'] = round(processing_ms if stats['processing_ms'] is None
+                                               else stats['processing_ms'] * 0.9 + processing_ms * 0.1, 2)
+                if last_time is not None and now > last_time:
+                    fps = 1.0 / (now - last_time)
+                    stats['fps'] = round(fps if stats['fps'] is None else stats['fps'] * 0.9 + fps * 0.1, 1)
+                last_time = now
+    
+    def _downsample(self, array):
+        """Sum METEOR_DOWNSAMPLE x METEOR_DOWNSAMPLE blocks (all channels / Bayer colours) into float32 0-255"""
+        f = METEOR_DOWNSAMPLE
+        channels = 1 if array.ndim == 2 else array.shape[2]
+        height, width = (array.shape[0] // f) * f, (array.shape[1] // f) * f
+        blocks = array[:height, :width].reshape(height // f, f, width // f, f * channels)
+        summed = blocks.sum(axis=(1, 3), dtype=np.uint32).astype(np.float32)
+        summed *= 1.0 / (f * f * channels)
+        return summed
+    
+    def _process(self, array):
+        """Update the background with one frame and return a streak dict if the frame contains one"""
+        image = self._downsample(array)
+        if self.background is None or self.background.shape != image.shape:
+            # First frame, or the frame size changed (ROI/binning/format) - start a new background
+            self.background = image
+            self.noise = None
+            self.warmup = 0
+            return None
+        
+        diff = image - self.background
+        # Cheap noise estimate: mean absolute difference (about 0.8 sigma for Gaussian noise)
+        noise = float(np.abs(diff).mean()) * 1.25
+        self.noise = noise if self.noise is None else self.noise * 0.95 + noise * 0.05
+        
+        # Fold the frame into the running background in place
+        self.background *= 1.0 - METEOR_BACKGROUND_ALPHA
+        self.background += METEOR_BACKGROUND_ALPHA * image
+        
+        if self.warmup < METEOR_WARMUP_FRAMES:
+            self.warmup += 1
+            return None
+        
+        threshold = max(METEOR_SIGMA * self.noise, METEOR_MIN_DELTA)
+        mask = diff > threshold
+        changed = int(np.count_nonzero(mask))
+        if changed < METEOR_MIN_PIXELS:
+            return None
+        if changed > mask.size * METEOR_MAX_FRACTION:
+            self.stats['global_changes'] += 1
+            return None
+        
+        # Drop isolated pixels (noise, twinkling stars): keep pixels with at least one changed neighbour
+        padded = np.pad(mask, 1).astype(np.uint8)
+        neighbours = (padded[:-2, :-2] + padded[:-2, 1:-1] + padded[:-2, 2:] + padded[1:-1, :-2] +
+                      padded[1:-1, 2:] + padded[2:, :-2] + padded[2:, 1:-1] + padded[2:, 2:])
+        ys, xs = np.nonzero(mask & (neighbours > 0))
+        if len(xs) < METEOR_MIN_PIXELS:
+            return None
+        return self._fit_streak(xs, ys, diff[ys, xs])
+    
+    def _fit_streak(self, xs, ys, deltas):
+        """Fit a line through changed pixels; return the streak if they form one long thin line"""
+        points = np.stack([xs, ys], axis=1).astype(np.float32)
+        centroid = points.mean(axis=0)
+        offsets = points - centroid
+        _, vectors = np.linalg.eigh(offsets.T @ offsets)  # Eigenvalues ascending
+        along = offsets @ vectors[:, 1]
+        across = offsets @ vectors[:, 0]
+        inliers = np.abs(across) <= METEOR_MAX_WIDTH
+        if inliers.mean() < METEOR_MIN_INLIERS:
+            return None
+        length = float(np.ptp(along[inliers]))
+        width = float(np.ptp(across[inliers])) + 1.0
+        if length < METEOR_MIN_LENGTH or length / width < METEOR_MIN_ELONGATION:
+            return None
+        
+        f = METEOR_DOWNSAMPLE
+        x0, x1 = int(xs[inliers].min()) * f, (int(xs[inliers].max()) + 1) * f
+        y0, y1 = int(ys[inliers].min()) * f, (int(ys[inliers].max()) + 1) * f
+        angle = float(np.degrees(np.arctan2(vectors[1, 1], vectors[0, 1]))) % 180.0
+        return {
+            'bbox': {'x': x0, 'y': y0, 'width': x1 - x0, 'height': y1 - y0},
+            'length': round(length * f, 1),
+            'angle': round(angle, 1),
+            'peak': round(float(deltas[inliers].max()), 1),
+            'pixels': int(inliers.sum())
+        }
+    
+    def _record(self, streak, slot):
+        """Start a new meteor event or extend the one still in progress"""
+        now = time.time()
+        with self.lock:
+            event = self.open_event
+            if event is not None and now - event['last_seen'] <= METEOR_MERGE_GAP:
+                box, new = event['bbox'], streak['bbox']
+                x0, y0 = min(box['x'], new['x']), min(box['y'], new['y'])
+                x1 = max(box['x'] + box['width'], new['x'] + new['width'])
+                y1 = max(box['y'] + box['height'], new['y'] + new['height'])
+                event.update(bbox={'x': x0, 'y': y0, 'width': x1 - x0, 'height': y1 - y0},
+                             length=max(event['length'], streak['length']), peak=max(event['peak'], streak['peak']),
+                             frames=event['frames'] + 1, last_seen=now, end_seq=slot.seq)
+                return
+            self._close_event()
+            event = dict(streak, id=self.next_id, time=datetime.fromtimestamp(slot.timestamp or now).isoformat(),
+                         start_seq=slot.seq, end_seq=slot.seq, frames=1, last_seen=now, image=None)
+            self.next_id += 1
+            self.open_event = event
+        # Keep a picture of the first frame (detections are rare, so encoding here is cheap overall)
+        event['image'] = encode_jpeg(slot.array, 85, bayer=slot.bayer)
+    
+    def _close_event(self, quiet_only=False):
+        """Finish the open event (only once it has been quiet for METEOR_MERGE_GAP if quiet_only) - lock held"""
+        event = self.open_event
+        if event is None or (quiet_only and time.time() - event['last_seen'] <= METEOR_MERGE_GAP):
+            return
+        self.open_event = None
+        self.events.append(event)
+        del self.events[:-METEOR_MAX_EVENTS]
+        for old in self.events[:-METEOR_MAX_IMAGES]:
+            old['image'] = None
+        
+        record = self.describe(event)
+        box = event['bbox']
+        print(f"[Meteor] Detection #{event['id']} at {event['time']}: {event['length']:.0f} px streak, "
+              f"box ({box['x']}, {box['y']}) {box['width']} x {box['height']}, {event['frames']} frame(s)")
+        if METEOR_LOG_FILE:
+            import json
+            try:
+                with open(METEOR_LOG_FILE, 'a') as log:
+                    log.write(json.dumps(record) + '\n')
+            except OSError as e:
+                print(f"[Meteor] Failed to write {METEOR_LOG_FILE}: {e}")
+    
+    def describe(self, event):
+        """JSON-friendly copy of an event"""
+        record = {key: value for key, value in event.items() if key not in ('image', 'last_seen')}
+        record['image_url'] = camera_path(self.source, f"/camera/meteors/{event['id']}.jpg") if event['image'] else None
+        return record
+    
+    def get_event(self, event_id):
+        with self.lock:
+            return next((event for event in self.events if event['id'] == event_id), None)
+    
+    def status(self, limit=50):
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'running': self.thread is not None and self.source.streaming,
+                'noise': round(self.noise, 2) if self.noise is not None else None,
+                **self.stats,
+                'total_detections': len(self.events),
+                'detections': [self.describe(event) for event in reversed(self.events[-limit:])]
+            }
+
+# Stream recording: memory for frames buffered between the capture ring and the disk (at least
+# RECORD_MIN_BUFFERS frames), and the file write buffer
+RECORD_BUFFER_BYTES = 128 * 1024 * 1024
+RECORD_MIN_BUFFERS = 4
+RECORD_WRITE_BUFFER = 8 * 1024 * 1024
+RECORD_AVI_MAX_BYTES = 2000 * 1024 * 1024  # AVI 1.0 files must stay under 2 GB
+
+# SER colour IDs for the camera's Bayer patterns
+SER_COLOR_MONO = 0
+SER_COLOR_RGB = 100
+SER_BAYER_COLOR_IDS = {ASI_BAYER_RG: 8, ASI_BAYER_GR: 9, ASI_BAYER_GB: 10, ASI_BAYER_BG: 11}
+
+def dotnet_ticks(timestamp):
+    """Convert a Unix timestamp to .NET ticks (100 ns since 0001-01-01), as used by SER files"""
+    return int((timestamp + 62135596800) * 10000000)
+
+class SERWriter:
+    """Writes raw frames to a SER video file (header, frames, then a trailer of per-frame UTC times)"""
+    extension = 'ser'
+    
+    def __init__(self, path, shape, bayer, instrument='', **options):
+        self.file = open(path, 'wb', buffering=RECORD_WRITE_BUFFER)
+        self.timestamps = []
+        height, width = shape[:2]
+        if len(shape) == 3:
+            color_id = SER_COLOR_RGB
+        else:
+            color_id = SER_BAYER_COLOR_IDS.get(bayer, SER_COLOR_MONO) if bayer is not None else SER_COLOR_MONO
+        now = time.time()
+        local_offset = datetime.now().astimezone().utcoffset().total_seconds()
+        # FrameCount (offset 38) is patched when the file is closed
+        self.file.write(struct.pack('<14s7i40s40s40sqq', b'LUCAM-RECORDER', 0, color_id, 0, width, height, 8, 0,
+                                    b'', instrument.encode('utf-8')[:40], b'',
+                                    dotnet_ticks(now + local_offset), dotnet_ticks(now)))
+    
+    def write(self, data, timestamp):
+        self.file.write(data)
+        self.timestamps.append(timestamp)
+        return len(data)
+    
+    def close(self):
+        self.file.write(struct.pack(f'<{len(self.timestamps)}q', *map(dotnet_ticks, self.timestamps)))
+        self.file.seek(38)
+        self.file.write(struct.pack('<i', len(self.timestamps)))
+        self.file.close()
+
+class MJPEGAVIWriter:
+    """Writes frames as JPEGs into an AVI 1.0 (RIFF) file, with per-frame times in a .csv sidecar"""
+    extension = 'avi'
+    
+    def __init__(self, path, shape, bayer, quality=90, **options):
+        self.file = open(path, 'wb', buffering=RECORD_WRITE_BUFFER)
+        self.times = open(os.path.splitext(path)[0] + '.csv', 'w')
+        self.times.write('frame,timestamp_utc\n')
+        self.quality = quality
+        self.bayer = bayer
+        self.shape = shape
+        self.index = []  # (offset in movi, size)
+        self.first_time = None
+        self.last_time = None
+        self.height, self.width = shape[:2]
+        self.file.write(self._headers(0, 0, 0))
+        self.movi_start = self.file.tell()  # Offset of the 'movi' list type, which idx1 offsets count from
+        self.file.write(b'movi')
+    
+    def _headers(self, frames, us_per_frame, movi_size):
+        """RIFF/hdrl headers up to and including the movi LIST header"""
+        width, height = self.width, self.height
+        avih = struct.pack('<10I16x', us_per_frame, 0, 0, 0x10, frames, 0, 1, 0, width, height)
+        strh = struct.pack('<4s4sIHHIIIIIIIIhhhh', b'vids', b'MJPG', 0, 0, 0, 0,
+                           max(us_per_frame, 1), 1000000, 0, frames, 0, 0xFFFFFFFF, 0, 0, 0, width, height)
+        strf = struct.pack('<IiiHH4sIiiII', 40, width, height, 1, 24, b'MJPG', width * height * 3, 0, 0, 0, 0)
+        strl = b'strl' + b'strh' + struct.pack('<I', len(strh)) + strh + b'strf' + struct.pack('<I', len(strf)) + strf
+        hdrl = (b'hdrl' + b'avih' + struct.pack('<I', len(avih)) + avih +
+                b'LIST' + struct.pack('<I', len(strl)) + strl)
+        riff_size = 4 + 8 + len(hdrl) + 8 + movi_size + 8 + 16 * frames
+        return (b'RIFF' + struct.pack('<I', riff_size) + b'AVI ' + b'LIST' + struct.pack('<I', len(hdrl)) + hdrl +
+                b'LIST' + struct.pack('<I', movi_size))
+    
+    def write(self, data, timestamp):
+        jpeg = encode_jpeg(data.reshape(self.shape), self.quality, bayer=self.bayer)
+        padding = b'\0' if len(jpeg) % 2 else b''
+        if self.file.tell() + len(jpeg) + 8 + 16 * (len(self.index) + 1) > RECORD_AVI_MAX_BYTES:
+            raise IOError('AVI file reached its 2 GB limit')
+        self.index.append((self.file.tell() - self.movi_start, len(jpeg)))
+        self.file.write(b'00dc' + struct.pack('<I', len(jpeg)) + jpeg + padding)
+        self.times.write(f"{len(self.index)},{datetime.fromtimestamp(timestamp, timezone.utc).isoformat()}\n")
+        self.first_time = self.first_time or timestamp
+        self.last_time = timestamp
+        return len(jpeg) + len(padding) + 8
+    
+    def close(self):
+        frames = len(self.index)
+        movi_size = self.file.tell() - self.movi_start
+        self.file.write(b'idx1' + struct.pack('<I', 16 * frames))
+        for offset, size in self.index:
+            self.file.write(struct.pack('<4sIII', b'00dc', 0x10, offset, size))
+        duration = (self.last_time - self.first_time) if frames > 1 else 0
+        us_per_frame = int(duration * 1000000 / (frames - 1)) if frames > 1 else 33333
+        self.file.seek(0)
+        self.file.write(self._headers(frames, us_per_frame, movi_size))
+        self.file.close()
+        self.times.close()
+
+RECORDING_FORMATS = {'ser': SERWriter, 'avi': MJPEGAVIWriter}
+
+class StreamRecorder:
+    """Records every frame of the live stream to a video file
+    
+    A grabber thread copies each new frame from the capture ring into a pool of preallocated
+    buffers and a writer thread appends them to the file with large buffered sequential writes,
+    so storage stalls are absorbed by the pool instead of blocking capture. Frames that arrive
+    while the whole pool is waiting for the disk are counted as dropped.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.lock = threading.Lock()
+        self.active = False
+        self.state = None
+    
+    def start(self, path, fmt='ser', max_frames=None, **options):
+        """Start recording to path; returns an error message or None"""
+        if self.active:
+            return 'Recording already in progress'
+        # The first frame fixes the recording's size and format; wait for it without holding the
+        # lock so status() and stop() stay responsive during long exposures
+        frame = self.source.wait_frame(0, timeout=self.source.video_exposure() / 1000000.0 * 2 + 1.0)
+        if frame is None:
+            return 'No frames available - is the stream running?'
+        _, slot = frame
+        shape, bayer, frame_size = slot.array.shape, slot.bayer, slot.array.nbytes
+        slot.release()
+        
+        with self.lock:
+            if self.active:
+                return 'Recording already in progress'
+            try:
+                writer = RECORDING_FORMATS[fmt](path, shape, bayer, instrument=self.source.name or '', **options)
+            except OSError as e:
+                return f'Cannot create {path}: {e}'
             
+            # LIFO hands the most recently written buffer back out, so while the disk keeps up only a
+            # few buffers are ever touched and the rest of the pool is never paged in
+            free = queue.LifoQueue()
+            for _ in range(max(RECORD_MIN_BUFFERS, RECORD_BUFFER_BYTES // frame_size)):
+                free.put(np.empty(frame_size, dtype=np.uint8))
+            self.state = {
+                'path': path,
+                'format': fmt,
+                'shape': shape,
+                'bayer': bayer,
+                'writer': writer,
+                'free': free,
+                'filled': queue.Queue(),
+                'max_frames': max_frames,
+                'frames': 0,
+                'dropped': 0,
+                'bytes': 0,
+                'started': time.time(),
+                'first_time': None,
+                'last_time': None,
+                'error': None,
+                'stopping': False
+            }
+            self.active = True
+            state = self.state
+            state['grabber'] = threading.Thread(target=self._grab_loop, args=(state,), daemon=True)
+            state['writer_thread'] = threading.Thread(target=self._write_loop, args=(state,), daemon=True)
+            state['writer_thread'].start()
+            state['grabber'].start()
+        print(f"[Record] Recording {shape[1]} x {shape[0]} frames to {path} ({fmt.upper()})")
+        return None
+    
+    def stop(self):
+        """Stop recording, wait for buffered frames to reach the disk and return the final status"""
+        with self.lock:
+            state = self.state
+            if not self.active or state is None:
+                return None
+            state['stopping'] = True
+        state['grabber'].join()
+        state['writer_thread'].join()
+        with self.lock:
+            self.active = False
+        print(f"[Record] Stopped: {state['frames']} frames ({state['dropped']} dropped) in {state['path']}")
+        return self.status()
+    
+    def _grab_loop(self, state):
+        try:
+            self._grab_frames(state)
         except Exception as e:
-            print(f"[Sequence] Error during capture: {e}")
-            import traceback
-            traceback.print_exc()
-            time.sleep(1.0)
+            state['error'] = str(e)
+        finally:
+            # Always let the writer finish the file
+            state['filled'].put(None)
+            state['stopping'] = True
+        if state['error']:
+            print(f"[Record] Recording ended: {state['error']}")
+    
+    def _grab_frames(self, state):
+        last_seq = self.source.frame_ring.seq if self.source.frame_ring else 0
+        received = 0
+        while not state['stopping']:
+            if state['max_frames'] and received >= state['max_frames']:
+                break
+            frame = self.source.wait_frame(last_seq, timeout=0.5)
+            if frame is None:
+                if not self.source.streaming:
+                    state['error'] = 'Stream stopped'
+                    break
+                continue
+            seq, slot = frame
+            try:
+                if last_seq and seq > last_seq + 1:
+                    state['dropped'] += seq - last_seq - 1  # Frames overwritten before we got to them
+                last_seq = seq
+                if slot.array.shape != state['shape'] or slot.bayer != state['bayer']:
+                    state['error'] = 'Frame size or format changed'
+                    break
+                try:
+                    buffer = state['free'].get_nowait()
+                except queue.Empty:
+                    state['dropped'] += 1  # Every buffer is still waiting for the disk
+                    continue
+                np.copyto(buffer, slot.data)
+                state['filled'].put((buffer, slot.timestamp))
+                received += 1
+            finally:
+                slot.release()
+    
+    def _write_loop(self, state):
+        writer = state['writer']
+        try:
+            while True:
+                item = state['filled'].get()
+                if item is None:
+                    break
+                buffer, timestamp = item
+                try:
+                    if state['error'] is None or state['error'] == 'Stream stopped':
+                        state['bytes'] += writer.write(buffer, timestamp)
+                        state['frames'] += 1
+                        state['first_time'] = state['first_time'] or timestamp
+                        state['last_time'] = timestamp
+                except Exception as e:
+                    # Disk errors, but also encoder errors (MJPEG-AVI) - stop grabbing and finish the file
+                    state['error'] = str(e)
+                    state['stopping'] = True
+                    print(f"[Record] Write failed: {e}")
+                finally:
+                    state['free'].put(buffer)
+        finally:
+            # Always finalize the header/index so the frames written so far stay readable
+            try:
+                writer.close()
+            except Exception as e:
+                state['error'] = state['error'] or str(e)
+                print(f"[Record] Failed to finalize {state['path']}: {e}")
+            with self.lock:
+                self.active = False
+    
+    def status(self):
+        with self.lock:
+            state = self.state
+            if state is None:
+                return {'active': False}
+            duration = (state['last_time'] - state['first_time']) if state['frames'] > 1 else 0.0
+            return {
+                'active': self.active,
+                'path': state['path'],
+                'format': state['format'],
+                'width': state['shape'][1],
+                'height': state['shape'][0],
+                'frames': state['frames'],
+                'dropped': state['dropped'],
+                'bytes': state['bytes'],
+                'duration': round(duration, 3),
+                'fps': round((state['frames'] - 1) / duration, 2) if duration > 0 else None,
+                'buffered': state['filled'].qsize(),
+                'started': datetime.fromtimestamp(state['started']).isoformat(),
+                'error': state['error']
+            }
+
+# Camera registry: SDK camera index -> ASICamera. The /camera/... routes drive the default camera;
+# /cameras/<index>/... drive any camera. Each camera has its own state, frame ring and threads.
+DEFAULT_CAMERA_INDEX = 0
+cameras = {DEFAULT_CAMERA_INDEX: ASICamera(DEFAULT_CAMERA_INDEX)}
+cameras_lock = threading.Lock()
+
+def get_camera(camera_index=None):
+    """Camera addressed by a request (the default camera without an index); unknown indexes abort with 404"""
+    from flask import abort, make_response
+    cam = cameras.get(DEFAULT_CAMERA_INDEX if camera_index is None else camera_index)
+    if cam is None:
+        abort(make_response(jsonify({'error': f'Unknown camera {camera_index}'}), 404))
+    return cam
+
+def role_camera(role):
+    """Camera reported as weatherCam (the default camera) or meteorCam (the second camera, if there is one)"""
+    if role == 'meteorCam':
+        return cameras.get(DEFAULT_CAMERA_INDEX + 1, cameras[DEFAULT_CAMERA_INDEX])
+    return cameras[DEFAULT_CAMERA_INDEX]
+
+def connect_cameras():
+    """Open every connected camera, adding registry entries for new ones; return the number of open cameras"""
+    num_cameras = asi_lib.ASIGetNumOfConnectedCameras() if asi_lib is not None else 0
+    for index in range(max(num_cameras, 1)):
+        with cameras_lock:
+            if index not in cameras:
+                cameras[index] = ASICamera(index)
+            cam = cameras[index]
+        if not cam.is_open and not cam.connect():
+            print(f"[Cameras] Failed to connect camera {index}: {cam.state['error']}")
+    return sum(1 for cam in cameras.values() if cam.is_open)
+
+# Status telemetry: sample every STATUS_SAMPLE_INTERVAL (s), read sensor temperatures every
+# STATUS_TEMPERATURE_INTERVAL (one SDK call per camera), and send an SSE comment when idle this long
+STATUS_SAMPLE_INTERVAL = 1.0
+STATUS_TEMPERATURE_INTERVAL = 10.0
+STATUS_EVENTS_KEEPALIVE = 15.0
+
+class TelemetrySampler:
+    """Background thread that keeps the /status document cached and publishes it when it changes
+    
+    Cameras call notify() when they connect, disconnect or start/stop streaming, so those changes
+    reach /status/events subscribers right away; everything else (frame time, FPS, temperature,
+    faults) is picked up by the periodic sample.
+    """
+    def __init__(self, interval=STATUS_SAMPLE_INTERVAL, temperature_interval=STATUS_TEMPERATURE_INTERVAL):
+        self.interval = interval
+        self.temperature_interval = temperature_interval
+        self.updates = FrameBus()  # seq -> status document
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.temperatures = {}  # camera index -> (monotonic read time, °C)
+    
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, daemon=True)
+                self.thread.start()
+    
+    def notify(self):
+        """Sample now instead of at the next interval"""
+        self.wake.set()
+    
+    def latest(self):
+        """The cached status document (sampled on the spot before the first sample exists)"""
+        self.start()
+        if self.updates.item is None:
+            self.sample()
+        return self.updates.item
+    
+    def wait(self, after_seq=0, timeout=None):
+        """Block until the status changes after after_seq; return (seq, status) or None on timeout"""
+        self.start()
+        return self.updates.wait(after_seq, timeout)
+    
+    def _temperature(self, cam):
+        """Sensor temperature in °C, read from ASI_TEMPERATURE at most every temperature_interval"""
+        if not cam.is_open:
+            self.temperatures.pop(cam.index, None)
+            return None
+        now = time.monotonic()
+        cached = self.temperatures.get(cam.index)
+        if cached is None or now - cached[0] >= self.temperature_interval:
+            value = ctypes.c_long(0)
+            auto = ctypes.c_int(0)
+            result = asi_lib.ASIGetControlValue(cam.camera_id, ASI_TEMPERATURE, ctypes.byref(value), ctypes.byref(auto))
+            if result != ASI_SUCCESS:
+                count_asi_error(cam, 'ASIGetControlValue', result)
+            cached = self.temperatures[cam.index] = (now, value.value / 10.0 if result == ASI_SUCCESS else None)
+        return cached[1]
     
-    print(f"[Sequence] Sequence capture stopped")
-    sequence_state['active'] = False
+    def _camera_status(self, cam):
+        state = cam.state
+        return {
+            'connected': state['connected'],
+            'streaming': state['streaming'],
+            # Capture time of the newest video frame
+            'lastSnapshot': datetime.fromtimestamp(state['frame_time']).isoformat() if state['frame_time'] else None,
+            'fault': state['error'],
+            'fps': round(cam.capture_rate.rate(), 1) if state['streaming'] else 0.0,
+            'temperature': self._temperature(cam),
+            'droppedFrames': state['dropped_frames'],
+            # Timing of the newest snapshot exposure (overrun past the expected end, status polls, readout)
+            'lastExposure': cam.exposure_timing or None
+        }
+    
+    def sample(self):
+        """Build the status document and publish it if anything changed"""
+        # weatherCam is the default camera; meteorCam is the second camera (the same one on a single-camera Pi)
+        status = {
+            'sensors': {
+                'temperature': None,  # This controller doesn't have environment sensors
+                'humidity': None,     # This controller doesn't have environment sensors
+                'weatherCam': self._camera_status(role_camera('weatherCam')),
+                'meteorCam': self._camera_status(role_camera('meteorCam'))
+            }
+            # No 'roof', 'safety', or 'alerts' - this controller doesn't handle those
+        }
+        with self.lock:
+            if status != self.updates.item:
+                self.updates.publish(self.updates.seq + 1, status)
+        return status
+    
+    def _loop(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"[Status] Telemetry sample failed: {e}")
+
+status_sampler = TelemetrySampler()
 
-# Global camera instance
-camera = ASICamera()
+def camera_route(rule, **options):
+    """Register a /camera/... route for the default camera and as /cameras/<index>/... for every camera"""
+    def decorator(view):
+        app.add_url_rule(rule, view.__name__, view, **options)
+        app.add_url_rule('/cameras/<int:camera_index>' + rule[len('/camera'):], view.__name__ + '_by_index', view, **options)
+        return view
+    return decorator
+
+def camera_path(camera, path):
+    """URL of a /camera/... endpoint for this camera (the /cameras/<index>/... form unless it is the default camera)"""
+    if camera.index == DEFAULT_CAMERA_INDEX:
+        return path
+    return f"/cameras/{camera.index}" + path[len('/camera'):]
 
 # API Routes
 @app.route('/status', methods=['GET'])
@@ -769,146 +3581,284 @@ def get_status():
     """Get camera status - ONLY return camera data, nothing else"""
     # This controller ONLY handles cameras
     # Other controllers will handle roof, environment sensors, etc.
-    return jsonify({
-        'sensors': {
-            'temperature': None,  # This controller doesn't have environment sensors
-            'humidity': None,     # This controller doesn't have environment sensors
-            'weatherCam': {
-                'connected': camera_state['connected'],
-                'streaming': camera_state['streaming'],
-                'lastSnapshot': datetime.now().isoformat() if camera_state['current_frame'] else None,
-                'fault': camera_state['error']
-            },
-            'meteorCam': {
-                'connected': camera_state['connected'],
-                'streaming': camera_state['streaming'],
-                'lastSnapshot': datetime.now().isoformat() if camera_state['current_frame'] else None,
-                'fault': camera_state['error']
-            }
-        }
-        # No 'roof', 'safety', or 'alerts' - this controller doesn't handle those
-    })
+    # Served from the telemetry sampler's cache, so polling never touches the cameras
+    return jsonify(status_sampler.latest())
 
-@app.route('/camera/connect', methods=['POST'])
-def connect_camera():
+@app.route('/status/events', methods=['GET'])
+def status_events():
+    """Server-Sent Events stream of the /status document, sent whenever it changes"""
+    from flask import request
+    import json
+    
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_seq = 0
+    if last_seq > status_sampler.updates.seq:
+        last_seq = 0  # An id from before a service restart
+    
+    def generate():
+        seq = last_seq
+        # Reconnect delay for EventSource clients (ms)
+        yield f"retry: {int(STATUS_SAMPLE_INTERVAL * 1000)}\n\n"
+        while True:
+            update = status_sampler.wait(seq, timeout=STATUS_EVENTS_KEEPALIVE)
+            if update is None:
+                # Comment line so proxies and clients see the connection is alive
+                yield ": keepalive\n\n"
+                continue
+            seq, status = update
+            yield f"id: {seq}\nevent: status\ndata: {json.dumps(status)}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/cameras', methods=['GET'])
+def list_cameras():
+    """List the cameras in the registry (use the index in /cameras/<index>/... routes)"""
+    return jsonify({'cameras': [{
+        'index': index,
+        'name': cam.name,
+        'connected': cam.state['connected'],
+        'streaming': cam.state['streaming'],
+        'color': cam.is_color_cam,
+        'max_width': cam.state['max_width'],
+        'max_height': cam.state['max_height'],
+        'error': cam.state['error']
+    } for index, cam in sorted(cameras.items())]})
+
+@app.route('/cameras/connect', methods=['POST'])
+def connect_all_cameras():
+    """Open every connected camera"""
+    connected = connect_cameras()
+    return jsonify({'success': connected > 0, 'connected': connected, 'cameras': len(cameras)})
+
+def collect_frame_rates():
+    """Refresh the frame-rate gauges from each camera's capture and client rate meters"""
+    for name in ('camera_capture_fps', 'camera_stream_clients', 'camera_client_fps'):
+        metrics.clear(name)
+    for index, cam in sorted(cameras.items()):
+        metrics.set('camera_capture_fps', round(cam.capture_rate.rate(), 2), camera=index)
+        clients = list(cam.stream_clients.items())
+        metrics.set('camera_stream_clients', len(clients), camera=index)
+        for client_id, client in clients:
+            metrics.set('camera_client_fps', round(client['rate'].rate(), 2), camera=index, client=client_id,
+                        profile=client['profile'], remote=client['remote'])
+
+metrics.add_collector(collect_frame_rates)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Pipeline metrics in Prometheus text format"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@camera_route('/camera/supervisor', methods=['GET'])
+def get_supervisor(camera_index=None):
+    """Fault recovery supervisor state: health counters, current fault and past recoveries"""
+    cam = get_camera(camera_index)
+    return jsonify(cam.supervisor.status())
+
+@camera_route('/camera/connect', methods=['POST'])
+def connect_camera(camera_index=None):
     """Connect to camera"""
-    if camera.connect():
+    cam = get_camera(camera_index)
+    if cam.connect():
         return jsonify({'success': True, 'message': 'Camera connected'})
-    return jsonify({'success': False, 'message': camera_state['error']}), 500
+    return jsonify({'success': False, 'message': cam.state['error']}), 500
 
-@app.route('/camera/disconnect', methods=['POST'])
-def disconnect_camera():
+@camera_route('/camera/disconnect', methods=['POST'])
+def disconnect_camera(camera_index=None):
     """Disconnect camera"""
-    camera.disconnect()
+    cam = get_camera(camera_index)
+    cam.disconnect()
     return jsonify({'success': True, 'message': 'Camera disconnected'})
 
-@app.route('/camera/stream/start', methods=['POST'])
-def start_stream():
+@camera_route('/camera/stream/start', methods=['POST'])
+def start_stream(camera_index=None):
     """Start video stream"""
-    if camera.start_stream():
+    cam = get_camera(camera_index)
+    if cam.start_stream():
         return jsonify({'success': True, 'message': 'Stream started'})
-    return jsonify({'success': False, 'message': camera_state['error']}), 500
+    return jsonify({'success': False, 'message': cam.state['error']}), 500
 
-@app.route('/camera/stream/stop', methods=['POST'])
-def stop_stream():
+@camera_route('/camera/stream/stop', methods=['POST'])
+def stop_stream(camera_index=None):
     """Stop video stream"""
-    camera.stop_stream()
+    cam = get_camera(camera_index)
+    cam.stop_stream()
     return jsonify({'success': True, 'message': 'Stream stopped'})
 
-@app.route('/camera/snapshot', methods=['GET'])
-def snapshot():
-    """Get a snapshot - automatically stops/resumes stream if needed"""
-    print(f"[Snapshot] Request. Streaming: {camera_state['streaming']}")
+@camera_route('/camera/roi', methods=['GET'])
+def get_roi(camera_index=None):
+    """Get the current ROI and binning"""
+    cam = get_camera(camera_index)
+    return jsonify({
+        'x': cam.state['start_x'],
+        'y': cam.state['start_y'],
+        'width': cam.state['width'],
+        'height': cam.state['height'],
+        'bin': cam.state['bin'],
+        'max_width': cam.state['max_width'],
+        'max_height': cam.state['max_height'],
+        'supported_bins': cam.state['supported_bins']
+    })
+
+@camera_route('/camera/roi', methods=['POST'])
+def set_roi(camera_index=None):
+    """Set a sub-frame ROI and/or hardware binning (an empty body restores full frame, bin 1)
+    
+    Body: {"bin": 2, "width": 640, "height": 480, "x": 100, "y": 50} - sizes and positions
+    in binned pixels; omit width/height for the full binned sensor and x/y to center.
+    """
+    cam = get_camera(camera_index)
+    from flask import request
+    data = request.get_json(silent=True) or {}
+    print(f"[ROI] Request received: {data}")
+    
+    try:
+        bin_value = int(data.get('bin', 1))
+        width = int(data['width']) if data.get('width') is not None else None
+        height = int(data['height']) if data.get('height') is not None else None
+        start_x = int(data['x']) if data.get('x') is not None else None
+        start_y = int(data['y']) if data.get('y') is not None else None
+    except (ValueError, TypeError):
+        return jsonify({'error': 'bin, width, height, x and y must be integers'}), 400
+    
+    error = cam.set_roi(width, height, bin_value, start_x, start_y)
+    if error:
+        return jsonify({'error': error}), 400
+    return get_roi(camera_index)
+
+@camera_route('/camera/snapshot', methods=['GET'])
+def snapshot(camera_index=None):
+    """Get a snapshot - automatically stops/resumes stream if needed
+    
+    Returns JPEG by default; ?format=png or ?format=tiff returns the full bit depth (16-bit for RAW16).
+    ?average=N instead averages the next N frames of the running stream, which keeps streaming.
+    """
+    cam = get_camera(camera_index)
+    from flask import request
+    print(f"[Snapshot] Request. Streaming: {cam.state['streaming']}")
+    
+    output_formats = {'jpeg': ('JPEG', 'image/jpeg', {'quality': 85}), 'png': ('PNG', 'image/png', {}),
+                      'tiff': ('TIFF', 'image/tiff', {})}
+    output_format = request.args.get('format', 'jpeg').lower()
+    if output_format not in output_formats:
+        return jsonify({'error': 'format must be jpeg, png or tiff'}), 400
+    
+    # Let a recovery in progress bring the camera back first
+    cam.wait_for_recovery(PHOTO_LOCK_TIMEOUT)
     
     # Check if camera is connected
-    if not camera_state['connected'] or not camera.is_open:
+    if not cam.state['connected'] or not cam.is_open:
         error_msg = "Camera not connected"
         print(f"[Snapshot] Error: {error_msg}")
         return jsonify({'error': error_msg}), 500
     
-    # Remember if we were streaming
-    was_streaming = camera.streaming
+    if 'average' in request.args:
+        return averaged_snapshot(cam, request.args['average'], output_formats[output_format])
     
+    # The stop -> expose -> restart switch must not interleave with a photo series or a sequence
+    if not cam.photo_lock.acquire(timeout=PHOTO_LOCK_TIMEOUT):
+        return jsonify({'error': 'Camera busy with another photo session or a sequence'}), 409
     try:
-        # MUST stop video capture before exposure mode
-        if was_streaming:
-            print("[Snapshot] Stopping stream for capture...")
-            camera.stop_stream()
-            time.sleep(0.5)
-        
-        # Apply image format for photo capture (video stream always uses RGB24)
-        photo_format = camera_state['image_format']
-        width = camera_state['width']
-        height = camera_state['height']
-        format_applied = False
-        
-        if photo_format != ASI_IMG_RGB24:
-            # Apply format for photo capture
-            result = asi_lib.ASISetROIFormat(camera.camera_id, width, height, 1, photo_format)
-            if result != ASI_SUCCESS:
-                error_names = {
-                    1: "ASI_ERROR_INVALID_INDEX",
-                    2: "ASI_ERROR_INVALID_ID", 
-                    3: "ASI_ERROR_INVALID_CONTROL_TYPE",
-                    4: "ASI_ERROR_CAMERA_CLOSED",
-                    5: "ASI_ERROR_CAMERA_REMOVED",
-                    9: "ASI_ERROR_INVALID_IMGTYPE",
-                    10: "ASI_ERROR_OUTOF_BOUNDARY",
-                    14: "ASI_ERROR_VIDEO_MODE_ACTIVE",
-                    15: "ASI_ERROR_EXPOSURE_IN_PROGRESS",
-                    16: "ASI_ERROR_GENERAL_ERROR"
-                }
-                error_name = error_names.get(result, f"UNKNOWN_ERROR_{result}")
-                error_msg = f"Failed to set ROI format: {result} ({error_name})"
-                print(f"[Snapshot] Error: {error_msg}")
-                # Try to restore stream if it was running
-                if was_streaming:
-                    try:
-                        camera.start_stream()
-                    except:
-                        pass
-                return jsonify({'error': error_msg}), 500
-            format_applied = True
-            print(f"[Snapshot] Applied image format {photo_format} for photo capture")
-            # Wait for format to be applied
-            time.sleep(0.3)
+        return exposure_snapshot(cam, output_formats[output_format])
+    finally:
+        cam.photo_lock.release()
+
+def parse_stream_profile(args):
+    """Read the scale/quality stream profile from query args; return (scale, quality, error message)"""
+    try:
+        scale = float(args.get('scale', 1.0))
+        quality = int(args.get('quality', STREAM_JPEG_QUALITY))
+    except ValueError:
+        return None, None, 'scale and quality must be numbers'
+    if not 0.05 <= scale <= 1.0:
+        return None, None, 'scale must be between 0.05 and 1'
+    if not 1 <= quality <= 100:
+        return None, None, 'quality must be between 1 and 100'
+    return scale, quality, None
+
+# Longest a snapshot waits for another photo session or a sequence to finish (seconds)
+PHOTO_LOCK_TIMEOUT = 30.0
+
+def exposure_snapshot(camera, output_format):
+    """Single exposure-mode snapshot: stop the stream, switch to the photo format, expose, then restore
+    
+    Call with camera.photo_lock held.
+    """
+    switch_started = time.perf_counter()
+    
+    try:
+        # The stop and format switch must not run alongside a recovery's reset
+        with camera.recovery_lock:
+            if not camera.is_open:
+                return jsonify({'error': 'Camera not connected'}), 500
+            # Remember if we were streaming (wanted, even if a failed recovery left it stopped)
+            was_streaming = camera.pause_stream()
             
-            # Ensure camera is idle after format change
-            status = ctypes.c_int(0)
-            asi_lib.ASIGetExpStatus(camera.camera_id, ctypes.byref(status))
-            if status.value != 0:
-                print(f"[Snapshot] Camera not idle after format change (status: {status.value}), waiting...")
-                timeout = 0
-                while status.value != 0 and timeout < 3000:  # Wait up to 3 seconds
-                    time.sleep(0.1)
-                    asi_lib.ASIGetExpStatus(camera.camera_id, ctypes.byref(status))
-                    timeout += 100
+            # MUST stop video capture before exposure mode
+            if was_streaming:
+                print("[Snapshot] Stopping stream for capture...")
+                time.sleep(0.5)
+            
+            # Apply image format for photo capture (if it differs from the stream's video format)
+            photo_format = camera.state['image_format']
+            format_applied = False
+            
+            if photo_format != camera.state['video_format']:
+                # Apply format for photo capture
+                result = camera.set_roi_format(photo_format)
+                if result != ASI_SUCCESS:
+                    count_asi_error(camera, 'ASISetROIFormat', result)
+                    error_name = ASI_ERROR_NAMES.get(result, f"UNKNOWN_ERROR_{result}")
+                    error_msg = f"Failed to set ROI format: {result} ({error_name})"
+                    print(f"[Snapshot] Error: {error_msg}")
+                    return jsonify({'error': error_msg}), 500
+                format_applied = True
+                print(f"[Snapshot] Applied image format {photo_format} for photo capture")
+                # Wait for format to be applied
+                time.sleep(0.3)
+            
+                # Ensure camera is idle after format change
+                status = ctypes.c_int(0)
+                asi_lib.ASIGetExpStatus(camera.camera_id, ctypes.byref(status))
                 if status.value != 0:
-                    print(f"[Snapshot] Warning: Camera still not idle after format change, forcing stop...")
-                    asi_lib.ASIStopExposure(camera.camera_id)
-                    time.sleep(0.5)
+                    print(f"[Snapshot] Camera not idle after format change (status: {status.value}), waiting...")
+                    timeout = 0
+                    while status.value != 0 and timeout < 3000:  # Wait up to 3 seconds
+                        time.sleep(0.1)
+                        asi_lib.ASIGetExpStatus(camera.camera_id, ctypes.byref(status))
+                        timeout += 100
+                    if status.value != 0:
+                        print(f"[Snapshot] Warning: Camera still not idle after format change, forcing stop...")
+                        asi_lib.ASIStopExposure(camera.camera_id)
+                        time.sleep(0.5)
         
-        print(f"[Snapshot] Capturing with exposure: {camera_state['exposure']} μs ({camera_state['exposure']/1000000:.3f} s), format: {photo_format}")
+        metrics.observe('camera_mode_switch_seconds', time.perf_counter() - switch_started, path='snapshot', to='exposure')
+        print(f"[Snapshot] Capturing with exposure: {camera.state['exposure']} μs ({camera.state['exposure']/1000000:.3f} s), format: {photo_format}")
         img = camera.capture_snapshot()
         
         # Restore RGB24 format if needed before resuming stream
         if was_streaming:
-            if format_applied:
-                # Restore RGB24 for video streaming
-                asi_lib.ASISetROIFormat(camera.camera_id, width, height, 1, ASI_IMG_RGB24)
-                print("[Snapshot] Restored RGB24 format for video streaming")
+            switch_started = time.perf_counter()
+            with camera.recovery_lock:
+                if format_applied and camera.is_open:
+                    # Restore the stream format for video streaming
+                    camera.set_roi_format(camera.state['video_format'])
+                    print("[Snapshot] Restored video format for video streaming")
+                    time.sleep(0.3)
+                
+                print("[Snapshot] Resuming stream...")
                 time.sleep(0.3)
-            
-            print("[Snapshot] Resuming stream...")
-            time.sleep(0.3)
-            camera.start_stream()
+                camera.resume_stream()
+            metrics.observe('camera_mode_switch_seconds', time.perf_counter() - switch_started, path='snapshot', to='video')
         
         if img:
-            img_io = io.BytesIO()
-            img.save(img_io, 'JPEG', quality=85)
-            img_io.seek(0)
+            fmt, mimetype, options = output_format
+            img_io = io.BytesIO(encode_image(img, fmt, **options))
             print(f"[Snapshot] Success!")
-            return send_file(img_io, mimetype='image/jpeg')
+            return send_file(img_io, mimetype=mimetype)
         else:
             error_msg = 'Failed to capture snapshot - camera returned None'
             print(f"[Snapshot] Error: {error_msg}")
@@ -919,242 +3869,195 @@ def snapshot():
         error_details = traceback.format_exc()
         print(f"[Snapshot] Exception: {e}")
         print(f"[Snapshot] Traceback:\n{error_details}")
-        if was_streaming and not camera.streaming:
+        return jsonify({'error': f'Exception: {str(e)}'}), 500
+    finally:
+        # Resume the stream on every early return or error path (a no-op once resumed above)
+        if camera.stream_paused:
             try:
-                camera.start_stream()
+                camera.resume_stream()
             except:
                 pass
-        return jsonify({'error': f'Exception: {str(e)}'}), 500
 
-@app.route('/camera/stream', methods=['GET'])
-def video_stream():
-    """MJPEG video stream"""
+# Most stream frames one averaged snapshot may combine
+SNAPSHOT_MAX_AVERAGE = 100
+
+def averaged_snapshot(camera, average, output_format):
+    """Snapshot averaged from the next frames of the live stream (the stream is never interrupted)"""
+    try:
+        count = int(average)
+    except ValueError:
+        return jsonify({'error': 'average must be an integer'}), 400
+    if not 1 <= count <= SNAPSHOT_MAX_AVERAGE:
+        return jsonify({'error': f'average must be between 1 and {SNAPSHOT_MAX_AVERAGE}'}), 400
+    if not camera.streaming:
+        return jsonify({'error': 'Averaged snapshots need the live stream running'}), 409
+    
+    print(f"[Snapshot] Averaging {count} stream frames...")
+    img = camera.average_frames(count)
+    if img is None:
+        return jsonify({'error': 'Stream stopped before enough frames were captured'}), 500
+    
+    fmt, mimetype, options = output_format
+    response = send_file(io.BytesIO(encode_image(img, fmt, **options)), mimetype=mimetype)
+    response.headers['X-Frames-Averaged'] = str(count)
+    return response
+
+@camera_route('/camera/stream', methods=['GET'])
+def video_stream(camera_index=None):
+    """MJPEG video stream
+    
+    Optional query parameters select a stream profile: scale (0.05-1, downscale factor),
+    quality (1-100, JPEG quality) and fps (maximum frames per second for this client).
+    Profiles are snapped to a small shared set (see stream_profile_key), and clients with the
+    same profile share one encoded stream.
+    """
+    cam = get_camera(camera_index)
+    from flask import request
+    
+    scale, quality, error = parse_stream_profile(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        fps = float(request.args['fps']) if 'fps' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'fps must be a number'}), 400
+    if fps is not None and fps <= 0:
+        return jsonify({'error': 'fps must be > 0'}), 400
+    
+    broadcaster = cam.stream_broadcaster(scale, quality)
+    min_interval = 1.0 / fps if fps else 0.0
+    client_id = uuid.uuid4().hex[:8]
+    client = {'profile': f"{scale:g}x q{quality}", 'remote': request.remote_addr, 'rate': RateMeter()}
+    camera_label = str(cam.index)
+    
     def generate():
-        while camera_state['streaming']:
-            frame = camera.frame_buffer
-            if frame:
-                img_io = io.BytesIO()
-                frame.save(img_io, 'JPEG', quality=75)
-                img_io.seek(0)
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + img_io.read() + b'\r\n')
-                
-                # Minimal sleep to prevent CPU overload, but let camera capture rate control FPS
-                # The actual FPS will be determined by the camera's exposure time and capture speed
-                time.sleep(0.005)  # 5ms sleep - much shorter than before to allow higher FPS
-            else:
-                # No frame available, short sleep to avoid busy waiting
-                time.sleep(0.01)
+        last_seq = 0
+        next_send = 0.0
+        cam.stream_clients[client_id] = client
+        try:
+            while cam.state['streaming']:
+                if min_interval:
+                    # FPS cap: skip the frames that arrive before this client's next slot
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                # Block until the capture loop publishes a newer frame (woken early when the stream stops)
+                latest = broadcaster.wait(last_seq, timeout=1.0)
+                if latest:
+                    # Frames encoded while this client was busy are skipped, not queued
+                    last_seq, jpeg = latest
+                    next_send = time.monotonic() + min_interval
+                    # The server writes the chunk to the socket before asking for the next one
+                    sent = time.perf_counter()
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+                    metrics.observe('camera_stage_seconds', time.perf_counter() - sent, stage='send')
+                    metrics.inc('camera_frames_delivered_total', camera=camera_label)
+                    client['rate'].tick()
+        finally:
+            cam.stream_clients.pop(client_id, None)
     
     return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/camera/settings', methods=['POST'])
-def update_settings():
+# Longest a /camera/frame.jpg long-poll may wait for a newer frame (seconds)
+FRAME_LONG_POLL_MAX = 30.0
+
+@camera_route('/camera/frame.jpg', methods=['GET'])
+def latest_frame(camera_index=None):
+    """Latest encoded stream frame as a JPEG, without touching the camera
+    
+    Takes the same scale/quality profile as /camera/stream. The ETag tracks the frame sequence
+    number (If-None-Match answers 304), and ?after=<seq> long-polls until a newer frame is
+    encoded (up to ?timeout seconds, default 10; 304 if none arrives).
+    """
+    cam = get_camera(camera_index)
+    from flask import request
+    
+    scale, quality, error = parse_stream_profile(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        after = int(request.args['after']) if 'after' in request.args else None
+        timeout = min(float(request.args.get('timeout', 10.0)), FRAME_LONG_POLL_MAX)
+    except ValueError:
+        return jsonify({'error': 'after must be an integer and timeout a number'}), 400
+    
+    if not cam.state['streaming']:
+        return jsonify({'error': 'Stream not running'}), 503
+    
+    broadcaster = cam.stream_broadcaster(scale, quality)
+    if after is not None and after > cam.state['frame_seq']:
+        after = None  # A sequence number from before a service restart - send the newest frame now
+    if after is not None:
+        latest = broadcaster.wait(after, timeout=max(timeout, 0.0))
+    else:
+        # A profile nobody is watching has to encode its first frame
+        latest = broadcaster.get_latest() or broadcaster.wait(0, timeout=2.0)
+    
+    if latest is None:
+        if after is not None:
+            return Response(status=304, headers={'X-Frame-Seq': str(broadcaster.encoded.seq)})
+        return jsonify({'error': 'No frame available yet'}), 503
+    
+    seq, jpeg = latest
+    etag = f"frame-{seq}-{broadcaster.scale:g}-{broadcaster.quality}"
+    headers = {'X-Frame-Seq': str(seq), 'Cache-Control': 'no-cache'}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        response = Response(jpeg, mimetype='image/jpeg', headers=headers)
+    response.set_etag(etag)
+    return response
+
+@camera_route('/camera/controls', methods=['GET'])
+def get_controls(camera_index=None):
+    """Control capabilities (range, default, auto, writable, writable while streaming) read at connect"""
+    cam = get_camera(camera_index)
+    if not cam.is_open:
+        return jsonify({'error': 'Camera not connected'}), 500
+    return jsonify({
+        'controls': sorted(cam.controls.values(), key=lambda caps: caps['id']),
+        'readback': CONTROL_READBACK
+    })
+
+@camera_route('/camera/settings', methods=['POST'])
+def update_settings(camera_index=None):
     """Update camera settings"""
+    cam = get_camera(camera_index)
     from flask import request
     data = request.get_json()
     print(f"[Settings] Request received: {data}")
     
-    updated = []
+    if data is None:
+        return jsonify({'error': 'No JSON data received'}), 400
+    
+    # Collect the whole request as one set of changes; the camera is only touched once they are applied
+    changes = {}
     
     if 'gain' in data:
-        gain = int(data['gain'])
-        camera_state['gain'] = gain
-        
-        # Remember if streaming
-        was_streaming = camera_state['streaming']
-        print(f"[Settings] Current streaming state: {was_streaming}")
-        
-        if camera.is_open:
-            # Try to set gain directly if streaming (may work without restart on some SDKs)
-            result = asi_lib.ASISetControlValue(camera.camera_id, ASI_GAIN, gain, ASI_FALSE)
-            
-            # Verify it was set
-            actual_gain = ctypes.c_long(0)
-            auto_gain = ctypes.c_int(0)
-            asi_lib.ASIGetControlValue(camera.camera_id, ASI_GAIN, ctypes.byref(actual_gain), ctypes.byref(auto_gain))
-            
-            print(f"[Settings] Set gain to {gain} (result: {result}, actual: {actual_gain.value}, auto: {auto_gain.value})")
-            
-            # If streaming and gain didn't take effect, restart stream
-            if was_streaming:
-                # Check if gain actually changed
-                if actual_gain.value != gain:
-                    print(f"[Settings] Gain not applied during streaming, restarting stream...")
-                    camera.stop_stream()
-                    time.sleep(0.5)
-                    result = asi_lib.ASISetControlValue(camera.camera_id, ASI_GAIN, gain, ASI_FALSE)
-                    time.sleep(0.2)
-                    success = camera.start_stream()
-                    print(f"[Settings] Stream restart result: {success}, State: {camera_state['streaming']}")
-                else:
-                    print(f"[Settings] Gain updated successfully without stream restart")
-            
-            updated.append(f"gain={gain}")
+        changes['gain'] = int(data['gain'])
     
     if 'gamma' in data:
-        gamma = int(data['gamma'])
-        # Clamp gamma to valid range (1-100)
-        gamma = max(1, min(100, gamma))
-        camera_state['gamma'] = gamma
-        print(f"[Settings] Setting gamma: {gamma}")
-        
-        if camera.is_open:
-            result_gamma = asi_lib.ASISetControlValue(camera.camera_id, ASI_GAMMA, gamma, ASI_FALSE)
-            
-            # Verify it was set
-            actual_gamma = ctypes.c_long(0)
-            auto_gamma = ctypes.c_int(0)
-            asi_lib.ASIGetControlValue(camera.camera_id, ASI_GAMMA, ctypes.byref(actual_gamma), ctypes.byref(auto_gamma))
-            
-            print(f"[Settings] Set gamma to {gamma} (result: {result_gamma}, actual: {actual_gamma.value})")
-            
-            # If streaming, restart to apply gamma
-            was_streaming = camera_state['streaming']
-            if was_streaming:
-                print(f"[Settings] Restarting stream to apply gamma...")
-                camera.stop_stream()
-                time.sleep(0.5)
-                success = camera.start_stream()
-                print(f"[Settings] Stream restart result: {success}, State: {camera_state['streaming']}")
-            
-            updated.append(f"gamma={gamma}")
+        changes['gamma'] = int(data['gamma'])
     
     if 'photo_exposure' in data:
-        exposure_us = int(data['photo_exposure'])
-        camera_state['exposure'] = exposure_us
-        print(f"[Settings] Set photo exposure: {exposure_us} μs = {exposure_us/1000000:.3f} s")
-        updated.append(f"photo_exposure={exposure_us}us")
+        changes['exposure'] = int(data['photo_exposure'])
+        print(f"[Settings] Photo exposure: {changes['exposure']} μs = {changes['exposure']/1000000:.3f} s")
     
     if 'video_exposure' in data:
-        video_exposure_us = int(data['video_exposure'])
-        camera_state['video_exposure'] = video_exposure_us
-        
-        # Remember if streaming
-        was_streaming = camera_state['streaming']
-        print(f"[Settings] Setting video exposure: {video_exposure_us} μs ({video_exposure_us/1000:.1f} ms)")
-        
-        if camera.is_open:
-            # Video exposure requires stream restart to take effect (manual exposure mode)
-            if was_streaming:
-                print(f"[Settings] Stopping stream to apply video exposure...")
-                camera.stop_stream()
-                time.sleep(0.5)
-            
-            # Set ASI_EXPOSURE directly (manual exposure mode for video)
-            # Set ASI_EXPOSURE directly as we are in manual exposure mode
-            # Note: ASI_AUTO_MAX_EXP is not needed in manual mode
-            result_exp = asi_lib.ASISetControlValue(camera.camera_id, ASI_EXPOSURE, video_exposure_us, ASI_FALSE)
-            
-            # Verify ASI_EXPOSURE was set
-            actual_exp = ctypes.c_long(0)
-            auto_exp = ctypes.c_int(0)
-            asi_lib.ASIGetControlValue(camera.camera_id, ASI_EXPOSURE, ctypes.byref(actual_exp), ctypes.byref(auto_exp))
-            
-            print(f"[Settings] Set ASI_EXPOSURE to {video_exposure_us} μs (result: {result_exp}, actual: {actual_exp.value} μs, auto: {auto_exp.value})")
-            
-            # Restart stream if it was active
-            if was_streaming:
-                print(f"[Settings] Restarting stream with new video exposure...")
-                time.sleep(0.5)
-                success = camera.start_stream()
-                print(f"[Settings] Stream restart result: {success}, State: {camera_state['streaming']}")
-            
-            updated.append(f"video_exposure={video_exposure_us}us")
+        changes['video_exposure'] = int(data['video_exposure'])
     
     if 'wb_auto' in data:
-        wb_auto = bool(data['wb_auto'])
-        camera_state['wb_auto'] = wb_auto
-        print(f"[Settings] Setting white balance auto: {wb_auto}")
-        
-        if camera.is_open:
-            was_streaming = camera_state['streaming']
-            if was_streaming:
-                print(f"[Settings] Stopping stream to apply white balance mode...")
-                camera.stop_stream()
-                time.sleep(0.5)
-            
+        changes['wb_auto'] = bool(data['wb_auto'])
+    
+    # Manual white balance values only apply while auto white balance is off
+    wb_auto = changes.get('wb_auto', cam.state.get('wb_auto', False))
+    for key in ('wb_r', 'wb_b'):
+        if key in data:
             if wb_auto:
-                # Enable auto white balance
-                result_wb_r = asi_lib.ASISetControlValue(camera.camera_id, ASI_WB_R, 0, ASI_TRUE)
-                result_wb_b = asi_lib.ASISetControlValue(camera.camera_id, ASI_WB_B, 0, ASI_TRUE)
-                print(f"[Settings] Enabled auto white balance (R result: {result_wb_r}, B result: {result_wb_b})")
+                print(f"[Settings] Ignoring {key} change: auto white balance is enabled")
             else:
-                # Disable auto and set manual values
-                wb_r = camera_state.get('wb_r', 50)
-                wb_b = camera_state.get('wb_b', 50)
-                result_wb_r = asi_lib.ASISetControlValue(camera.camera_id, ASI_WB_R, wb_r, ASI_FALSE)
-                result_wb_b = asi_lib.ASISetControlValue(camera.camera_id, ASI_WB_B, wb_b, ASI_FALSE)
-                print(f"[Settings] Disabled auto white balance, set manual R: {wb_r}, B: {wb_b}")
-            
-            # Restart stream if it was active
-            if was_streaming:
-                print(f"[Settings] Restarting stream with new white balance mode...")
-                time.sleep(0.5)
-                success = camera.start_stream()
-                print(f"[Settings] Stream restart result: {success}, State: {camera_state['streaming']}")
-            
-            updated.append(f"wb_auto={wb_auto}")
-    
-    if 'wb_r' in data:
-        # Only set manual values if auto is disabled
-        if not camera_state.get('wb_auto', False):
-            wb_r = int(data['wb_r'])
-            camera_state['wb_r'] = wb_r
-            print(f"[Settings] Setting white balance R: {wb_r}")
-            
-            if camera.is_open:
-                result_wb_r = asi_lib.ASISetControlValue(camera.camera_id, ASI_WB_R, wb_r, ASI_FALSE)
-                
-                # Verify it was set
-                actual_wb_r = ctypes.c_long(0)
-                auto_wb_r = ctypes.c_int(0)
-                asi_lib.ASIGetControlValue(camera.camera_id, ASI_WB_R, ctypes.byref(actual_wb_r), ctypes.byref(auto_wb_r))
-                
-                print(f"[Settings] Set white balance R to {wb_r} (result: {result_wb_r}, actual: {actual_wb_r.value})")
-                
-                # If streaming, restart to apply white balance
-                was_streaming = camera_state['streaming']
-                if was_streaming:
-                    print(f"[Settings] Restarting stream to apply white balance R...")
-                    camera.stop_stream()
-                    time.sleep(0.5)
-                    success = camera.start_stream()
-                    print(f"[Settings] Stream restart result: {success}, State: {camera_state['streaming']}")
-                
-                updated.append(f"wb_r={wb_r}")
-        else:
-            print(f"[Settings] Ignoring wb_r change: auto white balance is enabled")
-    
-    if 'wb_b' in data:
-        # Only set manual values if auto is disabled
-        if not camera_state.get('wb_auto', False):
-            wb_b = int(data['wb_b'])
-            camera_state['wb_b'] = wb_b
-            print(f"[Settings] Setting white balance B: {wb_b}")
-            
-            if camera.is_open:
-                result_wb_b = asi_lib.ASISetControlValue(camera.camera_id, ASI_WB_B, wb_b, ASI_FALSE)
-                
-                # Verify it was set
-                actual_wb_b = ctypes.c_long(0)
-                auto_wb_b = ctypes.c_int(0)
-                asi_lib.ASIGetControlValue(camera.camera_id, ASI_WB_B, ctypes.byref(actual_wb_b), ctypes.byref(auto_wb_b))
-                
-                print(f"[Settings] Set white balance B to {wb_b} (result: {result_wb_b}, actual: {actual_wb_b.value})")
-                
-                # If streaming, restart to apply white balance
-                was_streaming = camera_state['streaming']
-                if was_streaming:
-                    print(f"[Settings] Restarting stream to apply white balance B...")
-                    camera.stop_stream()
-                    time.sleep(0.5)
-                    success = camera.start_stream()
-                    print(f"[Settings] Stream restart result: {success}, State: {camera_state['streaming']}")
-                
-                updated.append(f"wb_b={wb_b}")
-        else:
-            print(f"[Settings] Ignoring wb_b change: auto white balance is enabled")
+                changes[key] = int(data[key])
     
     if 'image_format' in data:
         format_map = {
@@ -1165,34 +4068,53 @@ def update_settings():
         }
         format_str = data['image_format']
         if format_str in format_map:
-            new_format = format_map[format_str]
-            camera_state['image_format'] = new_format
-            print(f"[Settings] Set image format to {format_str} ({new_format})")
-            print(f"[Settings] Note: Image format only affects photo capture, video stream always uses RGB24")
-            updated.append(f"image_format={format_str}")
-            # Note: Image format is only applied when capturing photos, not for video streaming
-            # Video stream always uses RGB24 for real-time performance
+            # Image format only affects photo capture, the video stream uses video_format
+            changes['image_format'] = format_map[format_str]
         else:
             print(f"[Settings] Invalid image format: {format_str}")
     
+    if 'video_format' in data:
+        # Stream format: RAW8 sends a third of the RGB24 bytes over USB and is demosaiced on the Pi
+        video_format_map = {'RGB24': ASI_IMG_RGB24, 'RAW8': ASI_IMG_RAW8}
+        format_str = data['video_format']
+        if format_str in video_format_map:
+            changes['video_format'] = video_format_map[format_str]
+        else:
+            print(f"[Settings] Invalid video format: {format_str}")
+    
+    # Validate against the caps table read at connect - no hardware round trip
+    for key, control in SETTINGS_CONTROLS.items():
+        if key in changes:
+            value = cam.clamp_control(control, changes[key])
+            if value != changes[key]:
+                caps = cam.controls[control]
+                print(f"[Settings] {key}={changes[key]} out of range {caps['min']}..{caps['max']}, using {value}")
+                changes[key] = value
+    
+    # Requests arriving close together (slider drags) are merged and applied once
+    transaction = cam.settings.submit(changes) or {'changed': [], 'requests': 0, 'restarted': False}
+    
     # Get current format name
     format_names = {ASI_IMG_RGB24: 'RGB24', ASI_IMG_RAW8: 'RAW8', ASI_IMG_RAW16: 'RAW16', ASI_IMG_Y8: 'Y8'}
-    current_format_name = format_names.get(camera_state['image_format'], 'RGB24')
+    current_format_name = format_names.get(cam.state['image_format'], 'RGB24')
+    video_format_name = format_names.get(cam.state['video_format'], 'RGB24')
     
-    print(f"[Settings] Updated: {', '.join(updated) if updated else 'nothing'}")
-    print(f"[Settings] State now - Gain: {camera_state['gain']}, Photo Exposure: {camera_state['exposure']} μs, Video Exposure: {camera_state['video_exposure']} μs, WB R: {camera_state.get('wb_r', 'N/A')}, WB B: {camera_state.get('wb_b', 'N/A')}, Format: {current_format_name}")
+    print(f"[Settings] State now - Gain: {cam.state['gain']}, Photo Exposure: {cam.state['exposure']} μs, Video Exposure: {cam.state['video_exposure']} μs, WB R: {cam.state.get('wb_r', 'N/A')}, WB B: {cam.state.get('wb_b', 'N/A')}, Format: {current_format_name}")
     
     return jsonify({
         'success': True,
-        'gain': camera_state['gain'],
-        'exposure': camera_state['exposure'],
-        'video_exposure': camera_state['video_exposure'],
-        'image_format': current_format_name
+        'gain': cam.state['gain'],
+        'exposure': cam.state['exposure'],
+        'video_exposure': cam.state['video_exposure'],
+        'image_format': current_format_name,
+        'video_format': video_format_name,
+        'restarted': transaction['restarted']
     })
 
-@app.route('/camera/sequence/start', methods=['POST'])
-def start_sequence():
+@camera_route('/camera/sequence/start', methods=['POST'])
+def start_sequence(camera_index=None):
     """Start sequence capture"""
+    cam = get_camera(camera_index)
     from flask import request
     import os
     
@@ -1203,7 +4125,7 @@ def start_sequence():
         print("[Sequence Start] Error: No JSON data received")
         return jsonify({'error': 'No JSON data received'}), 400
     
-    if sequence_state['active']:
+    if cam.sequence['active']:
         print("[Sequence Start] Error: Sequence already in progress")
         return jsonify({'error': 'Sequence capture already in progress'}), 400
     
@@ -1226,6 +4148,7 @@ def start_sequence():
     
     file_format = data.get('file_format', 'JPEG')
     interval = float(data.get('interval', 0))  # Interval in seconds (0 = fast mode)
+    capture_mode = data.get('mode', 'exposure')  # 'exposure', 'video' or 'auto' (video capture is opt-in)
     
     # Validate interval
     if interval < 0:
@@ -1256,23 +4179,35 @@ def start_sequence():
     if file_format not in ['JPEG', 'PNG', 'TIFF']:
         return jsonify({'error': 'File format must be JPEG, PNG, or TIFF'}), 400
     
+    # Validate capture mode - video mode needs a format the stream can carry (RGB24 or RAW8)
+    if capture_mode not in ['auto', 'video', 'exposure']:
+        return jsonify({'error': 'Mode must be auto, video or exposure'}), 400
+    video_capable = cam.state['image_format'] in (ASI_IMG_RGB24, ASI_IMG_RAW8)
+    if capture_mode == 'video' and not video_capable:
+        return jsonify({'error': 'Video mode sequences require the RGB24 or RAW8 image format'}), 400
+    if capture_mode == 'auto':
+        short_exposure = cam.state['exposure'] <= SEQUENCE_VIDEO_MAX_EXPOSURE
+        capture_mode = 'video' if video_capable and short_exposure else 'exposure'
+    
     # Check if camera is connected
-    if not camera_state['connected'] or not camera.is_open:
+    if not cam.state['connected'] or not cam.is_open:
         return jsonify({'error': 'Camera not connected'}), 500
     
     # Initialize sequence state
-    sequence_state['active'] = True
-    sequence_state['save_path'] = save_path
-    sequence_state['total_count'] = count
-    sequence_state['current_count'] = 0
-    sequence_state['file_format'] = file_format
-    sequence_state['interval'] = interval
+    cam.sequence['active'] = True
+    cam.sequence['save_path'] = save_path
+    cam.sequence['total_count'] = count
+    cam.sequence['current_count'] = 0
+    cam.sequence['file_format'] = file_format
+    cam.sequence['interval'] = interval
+    cam.sequence['mode'] = capture_mode
     
     # Start sequence capture thread
-    sequence_state['thread'] = threading.Thread(target=sequence_capture_loop, daemon=True)
-    sequence_state['thread'].start()
+    cam.sequence['thread'] = threading.Thread(target=sequence_capture_loop, args=(cam,), daemon=True)
+    cam.sequence['thread'].start()
     
     mode_str = f"time-lapse (interval: {interval}s)" if interval > 0 else "fast mode"
+    mode_str += f", {capture_mode} mode"
     print(f"[Sequence] Started: {count} photos to {save_path}, format: {file_format}, {mode_str}")
     
     return jsonify({
@@ -1281,47 +4216,62 @@ def start_sequence():
         'save_path': save_path,
         'count': count,
         'file_format': file_format,
-        'interval': interval
+        'interval': interval,
+        'mode': capture_mode
     })
 
-@app.route('/camera/sequence/stop', methods=['POST'])
-def stop_sequence():
+@camera_route('/camera/sequence/stop', methods=['POST'])
+def stop_sequence(camera_index=None):
     """Stop sequence capture"""
-    if not sequence_state['active']:
+    cam = get_camera(camera_index)
+    if not cam.sequence['active']:
         return jsonify({'error': 'No sequence capture in progress'}), 400
     
-    sequence_state['active'] = False
+    cam.sequence['active'] = False
     
     # Wait for thread to finish
-    if sequence_state['thread']:
-        sequence_state['thread'].join(timeout=5.0)
+    if cam.sequence['thread']:
+        cam.sequence['thread'].join(timeout=5.0)
     
-    print(f"[Sequence] Stopped: {sequence_state['current_count']}/{sequence_state['total_count']} photos captured")
+    print(f"[Sequence] Stopped: {cam.sequence['current_count']}/{cam.sequence['total_count']} photos captured")
     
     return jsonify({
         'success': True,
         'message': 'Sequence capture stopped',
-        'captured': sequence_state['current_count'],
-        'total': sequence_state['total_count']
+        'captured': cam.sequence['current_count'],
+        'total': cam.sequence['total_count']
     })
 
-@app.route('/camera/sequence/status', methods=['GET'])
-def sequence_status():
+@camera_route('/camera/sequence/status', methods=['GET'])
+def sequence_status(camera_index=None):
     """Get sequence capture status"""
+    cam = get_camera(camera_index)
     return jsonify({
-        'active': sequence_state['active'],
-        'current_count': sequence_state['current_count'],
-        'total_count': sequence_state['total_count'],
-        'save_path': sequence_state['save_path'],
-        'file_format': sequence_state['file_format'],
-        'interval': sequence_state.get('interval', 0)
+        'active': cam.sequence['active'],
+        'current_count': cam.sequence['current_count'],
+        'total_count': cam.sequence['total_count'],
+        'save_path': cam.sequence['save_path'],
+        'file_format': cam.sequence['file_format'],
+        'interval': cam.sequence.get('interval', 0),
+        'mode': cam.sequence['mode'],
+        'writer': cam.sequence_writer.status()
     })
 
-@app.route('/camera/sequence/capture', methods=['POST'])
-def capture_sequence():
-    """Capture a sequence of photos - simple: stop stream, take N photos, resume stream"""
+# Boundary between photos in multipart /camera/sequence/capture responses
+SEQUENCE_MULTIPART_BOUNDARY = 'photo-frame'
+
+@camera_route('/camera/sequence/capture', methods=['POST'])
+def capture_sequence(camera_index=None):
+    """Capture a sequence of photos, streaming each one to the client as soon as it is taken
+    
+    Clients sending "Accept: multipart/mixed" (or ?stream=multipart) get one binary JPEG part per
+    photo with X-Frame-* metadata headers; otherwise the legacy {"success", "photos": [base64...],
+    "count"} JSON document is streamed photo by photo. Memory use is one photo whatever the count.
+    """
+    cam = get_camera(camera_index)
     from flask import request
     import base64
+    import json
     
     data = request.get_json()
     
@@ -1333,100 +4283,536 @@ def capture_sequence():
         return jsonify({'error': 'Count must be between 1 and 100'}), 400
     
     # Check if camera is connected
-    if not camera_state['connected'] or not camera.is_open:
+    if not cam.state['connected'] or not cam.is_open:
         return jsonify({'error': 'Camera not connected'}), 500
     
-    # Remember if we were streaming
-    was_streaming = camera.streaming
+    multipart = request.args.get('stream') == 'multipart' or 'multipart/mixed' in request.headers.get('Accept', '')
+    print(f"[Sequence Capture] Capturing {count} photos ({'multipart' if multipart else 'JSON'} stream)...")
+    
+    def capture_photos():
+        """Yield (index, JPEG bytes or None, metadata) - the camera is switched once for the whole series"""
+        captured = 0
+        for index, img in photo_series(cam, count, label='Sequence Capture'):
+            metadata = {
+                'index': index + 1,
+                'count': count,
+                'exposure': cam.state['exposure'],
+                'gain': cam.state['gain'],
+                'timestamp': datetime.now().isoformat()
+            }
+            if img is None:
+                yield index, None, metadata
+                continue
+            captured += 1
+            yield index, encode_jpeg(img, 100), metadata
+        print(f"[Sequence Capture] Successfully captured {captured}/{count} photos")
     
+    def generate_multipart():
+        boundary = SEQUENCE_MULTIPART_BOUNDARY
+        captured = 0
+        for index, img_bytes, metadata in capture_photos():
+            headers = (f"X-Frame-Index: {metadata['index']}\r\n"
+                       f"X-Frame-Count: {metadata['count']}\r\n"
+                       f"X-Exposure-Us: {metadata['exposure']}\r\n"
+                       f"X-Gain: {metadata['gain']}\r\n"
+                       f"X-Timestamp: {metadata['timestamp']}\r\n")
+            if img_bytes is None:
+                body = json.dumps({'index': metadata['index'], 'error': 'Failed to capture photo'}).encode()
+                content_type = 'application/json'
+            else:
+                body = img_bytes
+                content_type = 'image/jpeg'
+                captured += 1
+            yield (f"--{boundary}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                   f"{headers}\r\n").encode() + body + b'\r\n'
+        # Final part: summary, then the closing boundary
+        summary = json.dumps({'success': True, 'count': captured}).encode()
+        yield (f"--{boundary}\r\nContent-Type: application/json\r\nContent-Length: {len(summary)}\r\n\r\n").encode()
+        yield summary + f"\r\n--{boundary}--\r\n".encode()
+    
+    def generate_json():
+        captured = 0
+        yield b'{"success": true, "photos": ['
+        for index, img_bytes, metadata in capture_photos():
+            separator = b', ' if index else b''
+            if img_bytes is None:
+                yield separator + b'null'
+            else:
+                captured += 1
+                yield separator + b'"' + base64.b64encode(img_bytes) + b'"'
+        yield f'], "count": {captured}}}'.encode()
+    
+    if multipart:
+        return Response(generate_multipart(),
+                        mimetype=f'multipart/mixed; boundary={SEQUENCE_MULTIPART_BOUNDARY}',
+                        headers={'X-Frame-Count': str(count)})
+    return Response(generate_json(), mimetype='application/json')
+
+@camera_route('/camera/record/start', methods=['POST'])
+def start_recording(camera_index=None):
+    """Record the live stream to a video file on the Pi
+    
+    Body: {"save_path": "/home/pi/videos", "format": "ser"|"avi", "filename": optional,
+    "max_frames": optional, "quality": JPEG quality for AVI (default 90)}. SER stores the raw
+    stream frames (RGB24, RAW8 Bayer or mono) with per-frame UTC timestamps.
+    """
+    cam = get_camera(camera_index)
+    from flask import request
+    data = request.get_json(silent=True) or {}
+    print(f"[Record] Start request: {data}")
+    
+    fmt = str(data.get('format', 'ser')).lower()
+    if fmt not in RECORDING_FORMATS:
+        return jsonify({'error': 'format must be ser or avi'}), 400
     try:
-        # Stop stream if running
-        if was_streaming:
-            print(f"[Sequence Capture] Stopping stream for {count} photos...")
-            camera.stop_stream()
-            time.sleep(0.5)
-        
-        # Apply image format if needed
-        photo_format = camera_state['image_format']
-        width = camera_state['width']
-        height = camera_state['height']
-        format_applied = False
-        
-        if photo_format != ASI_IMG_RGB24:
-            asi_lib.ASISetROIFormat(camera.camera_id, width, height, 1, photo_format)
-            format_applied = True
-        
-        # Capture all photos
-        photos = []
-        print(f"[Sequence Capture] Capturing {count} photos...")
-        
-        for i in range(count):
-            print(f"[Sequence Capture] Photo {i+1}/{count}...")
-            img = camera.capture_snapshot()
+        max_frames = int(data['max_frames']) if data.get('max_frames') is not None else None
+        quality = int(data.get('quality', 90))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'max_frames and quality must be integers'}), 400
+    if max_frames is not None and max_frames < 1:
+        return jsonify({'error': 'max_frames must be >= 1'}), 400
+    if not 1 <= quality <= 100:
+        return jsonify({'error': 'quality must be between 1 and 100'}), 400
+    
+    save_path = os.path.expanduser(str(data.get('save_path') or '').strip())
+    if not save_path or not os.path.isdir(save_path):
+        return jsonify({'error': f'Save path does not exist on server: {save_path}'}), 400
+    if not os.access(save_path, os.W_OK):
+        return jsonify({'error': f'No write permission for path: {save_path}'}), 400
+    
+    if not cam.streaming:
+        return jsonify({'error': 'Recording needs the live stream running'}), 409
+    
+    filename = data.get('filename') or f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_gain{cam.state['gain']}_exp{cam.state['video_exposure'] / 1000000.0:.3f}s"
+    filename = os.path.basename(filename)
+    if not filename.lower().endswith('.' + fmt):
+        filename += '.' + fmt
+    
+    error = cam.recorder.start(os.path.join(save_path, filename), fmt, max_frames, quality=quality)
+    if error:
+        return jsonify({'error': error}), 409
+    return jsonify(dict(cam.recorder.status(), success=True))
+
+@camera_route('/camera/record/stop', methods=['POST'])
+def stop_recording(camera_index=None):
+    """Stop recording and finish the file"""
+    cam = get_camera(camera_index)
+    status = cam.recorder.stop()
+    if status is None:
+        return jsonify({'error': 'No recording in progress'}), 400
+    return jsonify(dict(status, success=True))
+
+@camera_route('/camera/record/status', methods=['GET'])
+def recording_status(camera_index=None):
+    """Progress of the current (or last) recording"""
+    cam = get_camera(camera_index)
+    return jsonify(cam.recorder.status())
+
+@camera_route('/camera/exposures', methods=['POST'])
+def create_exposure_job(camera_index=None):
+    """Queue an exposure job and return immediately - poll its status and fetch the result when done
+    
+    Body (all optional): {"count": 1, "format": "jpeg"|"png"|"tiff"}. Uses the current photo settings.
+    """
+    cam = get_camera(camera_index)
+    from flask import request
+    data = request.get_json(silent=True) or {}
+    
+    output_formats = {'jpeg': ('JPEG', 'image/jpeg', {'quality': 100}), 'png': ('PNG', 'image/png', {}),
+                      'tiff': ('TIFF', 'image/tiff', {})}
+    output_format = str(data.get('format', 'jpeg')).lower()
+    if output_format not in output_formats:
+        return jsonify({'error': 'format must be jpeg, png or tiff'}), 400
+    try:
+        count = int(data.get('count', 1))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'count must be an integer'}), 400
+    if count < 1 or count > 100:
+        return jsonify({'error': 'Count must be between 1 and 100'}), 400
+    
+    if not cam.state['connected'] or not cam.is_open:
+        return jsonify({'error': 'Camera not connected'}), 500
+    
+    fmt, mimetype, options = output_formats[output_format]
+    status = cam.exposure_jobs.submit(count, fmt, mimetype, **options)
+    if status is None:
+        return jsonify({'error': 'Too many exposure jobs waiting, try again later'}), 429
+    return jsonify(status), 202
+
+@camera_route('/camera/exposures', methods=['GET'])
+def list_exposure_jobs(camera_index=None):
+    """List the jobs that are still queued, running or cached"""
+    cam = get_camera(camera_index)
+    with cam.exposure_jobs.lock:
+        job_ids = list(cam.exposure_jobs.jobs)
+    return jsonify({'jobs': [status for status in map(cam.exposure_jobs.status, job_ids) if status]})
+
+@camera_route('/camera/exposures/<job_id>', methods=['GET'])
+def get_exposure_job(job_id, camera_index=None):
+    """Get the state and progress of an exposure job"""
+    cam = get_camera(camera_index)
+    status = cam.exposure_jobs.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown or expired exposure job'}), 404
+    return jsonify(status)
+
+@camera_route('/camera/exposures/<job_id>', methods=['DELETE'])
+def cancel_exposure_job(job_id, camera_index=None):
+    """Cancel an exposure job (a running job stops after its current photo)"""
+    cam = get_camera(camera_index)
+    if not cam.exposure_jobs.cancel(job_id):
+        return jsonify({'error': 'Unknown or expired exposure job'}), 404
+    return jsonify(cam.exposure_jobs.status(job_id))
+
+@camera_route('/camera/exposures/<job_id>/result', methods=['GET'])
+def get_exposure_result(job_id, camera_index=None):
+    """Download a photo from a finished exposure job (?index=N for multi-photo jobs)"""
+    cam = get_camera(camera_index)
+    from flask import request
+    job = cam.exposure_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired exposure job'}), 404
+    try:
+        index = int(request.args.get('index', 0))
+    except ValueError:
+        return jsonify({'error': 'index must be an integer'}), 400
+    
+    results = job['results']
+    if 0 <= index < len(results) and results[index] is not None:
+        return send_file(io.BytesIO(results[index]), mimetype=job['mimetype'])
+    if job['state'] in ('queued', 'exposing') and index < job['count']:
+        return jsonify({'error': 'Photo not ready yet', 'state': job['state']}), 409
+    return jsonify({'error': f"No photo {index} in job ({job['state']})"}), 404
+
+@camera_route('/camera/meteors', methods=['GET'])
+def get_meteors(camera_index=None):
+    """Meteor detector status and the newest detections (?limit=N, default 50)"""
+    cam = get_camera(camera_index)
+    from flask import request
+    try:
+        limit = max(int(request.args.get('limit', 50)), 0)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify(cam.meteor_detector.status(limit))
+
+@camera_route('/camera/meteors/detection', methods=['POST'])
+def set_meteor_detection(camera_index=None):
+    """Enable or disable meteor detection on the live stream: {"enabled": true}"""
+    cam = get_camera(camera_index)
+    from flask import request
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('enabled'), bool):
+        return jsonify({'error': 'enabled must be true or false'}), 400
+    if data['enabled']:
+        cam.meteor_detector.start()
+    else:
+        cam.meteor_detector.stop()
+    return jsonify(cam.meteor_detector.status(limit=0))
+
+@camera_route('/camera/meteors/<int:event_id>.jpg', methods=['GET'])
+def get_meteor_image(event_id, camera_index=None):
+    """First frame of a meteor detection (kept for the newest detections only)"""
+    cam = get_camera(camera_index)
+    event = cam.meteor_detector.get_event(event_id)
+    if event is None or event['image'] is None:
+        return jsonify({'error': 'No image for this detection'}), 404
+    return send_file(io.BytesIO(event['image']), mimetype='image/jpeg')
+
+@app.route('/debug/simulator/fault', methods=['POST'])
+def inject_simulator_fault():
+    """Inject a fault into the simulated camera backend (load testing only)"""
+    from flask import request
+    
+    if not isinstance(asi_lib, SimulatedASILibrary):
+        return jsonify({'error': 'Simulated camera backend is not active'}), 404
+    
+    data = request.get_json() or {}
+    fault = data.get('fault')
+    try:
+        count = int(data.get('count', 1))
+        asi_lib.inject_fault(fault, count)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    print(f"[Simulator] Injected fault: {fault} x{count}")
+    return jsonify({'success': True, 'fault': fault, 'count': count})
+
+# Asyncio streaming front end: serves the MJPEG stream and frame endpoints from one event loop on
+# its own port (0 disables it), while Flask keeps serving the control endpoints
+ASYNC_STREAM_PORT = int(os.environ.get('ASYNC_STREAM_PORT', 8081))
+ASYNC_STREAM_WRITE_TIMEOUT = 30.0  # Drop a viewer whose socket has not taken a frame for this long (s)
+ASYNC_STREAM_MAX_HEADER = 16384  # Largest request head accepted (bytes)
+
+class StreamFanout:
+    """Relays one stream profile's encoded frames into the event loop for any number of viewers
+    
+    A single bridge thread per profile waits on the camera's MJPEGBroadcaster and hands each new
+    frame to the loop; viewers await the next sequence number and always take the newest frame,
+    so a viewer whose socket is slow skips frames instead of buffering them.
+    """
+    def __init__(self, loop, camera, scale, quality, on_idle=None):
+        self.loop = loop
+        self.camera = camera
+        self.scale = scale
+        self.quality = quality
+        self.on_idle = on_idle  # Called on the loop with this fanout when its bridge stops for lack of viewers
+        self.seq = 0
+        self.jpeg = None
+        self.changed = asyncio.Event()
+        self.thread = None
+        self.last_demand = time.monotonic()
+    
+    def _publish(self, seq, jpeg):
+        """Runs on the event loop: make a frame the latest and wake every waiting viewer"""
+        if seq <= self.seq:
+            return
+        self.seq = seq
+        self.jpeg = jpeg
+        self.changed.set()
+        self.changed = asyncio.Event()
+    
+    def _ensure_bridge(self):
+        self.last_demand = time.monotonic()
+        if self.thread is None or not self.thread.is_alive():
+            broadcaster = self.camera.stream_broadcaster(self.scale, self.quality)
+            self.thread = threading.Thread(target=self._bridge, args=(broadcaster,), daemon=True)
+            self.thread.start()
+    
+    def _bridge(self, broadcaster):
+        seq = self.seq
+        while time.monotonic() - self.last_demand < BROADCASTER_IDLE_TIMEOUT:
+            latest = broadcaster.wait(seq, timeout=1.0)
+            if latest:
+                seq, jpeg = latest
+                self.loop.call_soon_threadsafe(self._publish, seq, jpeg)
+        if self.on_idle:
+            self.loop.call_soon_threadsafe(self.on_idle, self)
+    
+    async def wait(self, after_seq=0, timeout=None):
+        """Wait for a frame newer than after_seq; return (seq, jpeg) or None on timeout"""
+        deadline = None if timeout is None else self.loop.time() + timeout
+        while self.seq <= after_seq or self.jpeg is None:
+            self._ensure_bridge()
+            remaining = 1.0 if deadline is None else min(deadline - self.loop.time(), 1.0)
+            if remaining <= 0:
+                return None
+            try:
+                await asyncio.wait_for(self.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        self._ensure_bridge()
+        return self.seq, self.jpeg
+
+class AsyncStreamServer:
+    """Minimal HTTP/1.1 server for /camera/stream and /camera/frame.jpg (and /cameras/<index>/...)
+    
+    Each viewer is a coroutine rather than an OS thread; frames are written without blocking the
+    loop, and drain() backpressure on a slow connection only delays that viewer.
+    """
+    ROUTE = re.compile(r'^/(?:camera|cameras/(\d+))/(stream|frame\.jpg)$')
+    
+    def __init__(self, port=ASYNC_STREAM_PORT, host='0.0.0.0'):
+        self.port = port
+        self.host = host
+        self.loop = None
+        self.fanouts = {}  # (camera index, scale, quality) -> StreamFanout
+        self.thread = None
+    
+    def start(self):
+        """Run the event loop on a background thread"""
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True)
+        self.thread.start()
+    
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self._handle, self.host, self.port, limit=ASYNC_STREAM_MAX_HEADER)
+        print(f"[Async Stream] Serving /camera/stream and /camera/frame.jpg on port {self.port}")
+        async with server:
+            await server.serve_forever()
+    
+    def _fanout(self, cam, scale, quality):
+        # Same snapped profile as ASICamera.stream_broadcaster, so equivalent requests share a fanout
+        key = (cam.index,) + stream_profile_key(scale, quality)
+        fanout = self.fanouts.get(key)
+        if fanout is None:
+            fanout = self.fanouts[key] = StreamFanout(self.loop, cam, key[1], key[2], on_idle=self._drop_fanout)
+        return fanout
+    
+    def _drop_fanout(self, fanout):
+        """Forget a fanout whose bridge stopped for lack of viewers, unless a viewer has asked for it since"""
+        key = (fanout.camera.index, fanout.scale, fanout.quality)
+        if self.fanouts.get(key) is fanout and time.monotonic() - fanout.last_demand >= BROADCASTER_IDLE_TIMEOUT:
+            del self.fanouts[key]
+    
+    async def _respond(self, writer, status, body=b'', content_type='application/json', headers=None):
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}",
+                "Access-Control-Allow-Origin: *",
+                "Connection: close"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+    
+    async def _error(self, writer, status, message):
+        import json
+        await self._respond(writer, status, json.dumps({'error': message}).encode())
+    
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10.0)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                return
+            lines = head.decode('latin-1').split('\r\n')
+            parts = lines[0].split(' ')
+            if len(parts) != 3:
+                await self._error(writer, 400, 'Malformed request line')
+                return
+            method, target, _ = parts
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
             
-            if img:
-                # Convert to JPEG bytes
-                img_io = io.BytesIO()
-                img.save(img_io, 'JPEG', quality=100)
-                img_io.seek(0)
-                img_bytes = img_io.read()
-                # Encode as base64 for JSON
-                img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-                photos.append(img_base64)
-                
-                # Wait between photos (at least exposure time)
-                exposure_s = camera_state['exposure'] / 1000000.0
-                wait_time = max(exposure_s + 0.3, 0.5)
-                if i < count - 1:  # Don't wait after last photo
-                    time.sleep(wait_time)
+            url = urlsplit(target)
+            match = self.ROUTE.match(url.path)
+            if match is None:
+                await self._error(writer, 404, 'Not found - this port only serves the stream and frame endpoints')
+                return
+            if method != 'GET':
+                await self._error(writer, 405, 'Method not allowed')
+                return
+            cam = cameras.get(int(match.group(1)) if match.group(1) else DEFAULT_CAMERA_INDEX)
+            if cam is None:
+                await self._error(writer, 404, f"Camera {match.group(1)} not found")
+                return
+            
+            args = {name: values[0] for name, values in parse_qs(url.query).items()}
+            if match.group(2) == 'stream':
+                await self._stream(writer, cam, args)
             else:
-                print(f"[Sequence Capture] Failed to capture photo {i+1}")
-                photos.append(None)
-        
-        # Restore format if needed
-        if was_streaming and format_applied:
-            asi_lib.ASISetROIFormat(camera.camera_id, width, height, 1, ASI_IMG_RGB24)
-            time.sleep(0.3)
-        
-        # Resume stream if it was running
-        if was_streaming:
-            print("[Sequence Capture] Resuming stream...")
-            time.sleep(0.5)
-            camera.start_stream()
+                await self._frame(writer, cam, args, headers)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass  # Viewer went away or stopped reading
+        except Exception as e:
+            print(f"[Async Stream] Error serving request: {e}")
+        finally:
+            writer.close()
+    
+    async def _stream(self, writer, cam, args):
+        """MJPEG stream with the same scale/quality/fps parameters as the Flask route"""
+        scale, quality, error = parse_stream_profile(args)
+        if error is None:
+            try:
+                fps = float(args['fps']) if 'fps' in args else None
+                if fps is not None and fps <= 0:
+                    error = 'fps must be > 0'
+            except ValueError:
+                error = 'fps must be a number'
+        if error:
+            await self._error(writer, 400, error)
+            return
         
-        print(f"[Sequence Capture] Successfully captured {len([p for p in photos if p])}/{count} photos")
+        fanout = self._fanout(cam, scale, quality)
+        min_interval = 1.0 / fps if fps else 0.0
+        client_id = uuid.uuid4().hex[:8]
+        peer = writer.get_extra_info('peername')
+        client = {'profile': f"{scale:g}x q{quality}", 'remote': peer[0] if peer else None, 'rate': RateMeter()}
+        camera_label = str(cam.index)
         
-        return jsonify({
-            'success': True,
-            'count': len([p for p in photos if p]),
-            'photos': photos
-        })
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: multipart/x-mixed-replace; boundary=frame\r\n'
+                     b'Cache-Control: no-cache\r\n'
+                     b'Access-Control-Allow-Origin: *\r\n'
+                     b'Connection: close\r\n\r\n')
+        cam.stream_clients[client_id] = client
+        try:
+            last_seq = 0
+            next_send = 0.0
+            while cam.state['streaming']:
+                if min_interval:
+                    # FPS cap: skip the frames that arrive before this viewer's next slot
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                latest = await fanout.wait(last_seq, timeout=1.0)
+                if latest is None:
+                    continue
+                # Frames published while this viewer was still writing are skipped, not queued
+                last_seq, jpeg = latest
+                next_send = time.monotonic() + min_interval
+                sent = time.perf_counter()
+                writer.write(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+                await asyncio.wait_for(writer.drain(), ASYNC_STREAM_WRITE_TIMEOUT)
+                metrics.observe('camera_stage_seconds', time.perf_counter() - sent, stage='send')
+                metrics.inc('camera_frames_delivered_total', camera=camera_label)
+                client['rate'].tick()
+        finally:
+            cam.stream_clients.pop(client_id, None)
+    
+    async def _frame(self, writer, cam, args, headers):
+        """Latest encoded frame with ETag/If-None-Match and ?after= long-polling, as /camera/frame.jpg"""
+        scale, quality, error = parse_stream_profile(args)
+        if error:
+            await self._error(writer, 400, error)
+            return
+        try:
+            after = int(args['after']) if 'after' in args else None
+            timeout = min(float(args.get('timeout', 10.0)), FRAME_LONG_POLL_MAX)
+        except ValueError:
+            await self._error(writer, 400, 'after must be an integer and timeout a number')
+            return
+        if not cam.state['streaming']:
+            await self._error(writer, 503, 'Stream not running')
+            return
         
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"[Sequence Capture] Exception: {e}")
-        print(f"[Sequence Capture] Traceback:\n{error_details}")
+        fanout = self._fanout(cam, scale, quality)
+        if after is not None and after > cam.state['frame_seq']:
+            after = None  # A sequence number from before a service restart - send the newest frame now
+        if after is not None:
+            latest = await fanout.wait(after, timeout=max(timeout, 0.0))
+        else:
+            # A profile nobody is watching has to encode its first frame
+            latest = await fanout.wait(0, timeout=2.0)
         
-        # Try to resume stream if it was running
-        if was_streaming and not camera.streaming:
-            try:
-                camera.start_stream()
-            except:
-                pass
+        if latest is None:
+            if after is not None:
+                await self._respond(writer, 304, headers={'X-Frame-Seq': fanout.seq})
+                return
+            await self._error(writer, 503, 'No frame available yet')
+            return
         
-        return jsonify({'error': f'Exception: {str(e)}'}), 500
+        seq, jpeg = latest
+        etag = f"frame-{seq}-{fanout.scale:g}-{fanout.quality}"
+        response_headers = {'X-Frame-Seq': seq, 'Cache-Control': 'no-cache', 'ETag': f'"{etag}"'}
+        if_none_match = [tag.strip().removeprefix('W/').strip('"') for tag in headers.get('if-none-match', '').split(',')]
+        if etag in if_none_match or '*' in if_none_match:
+            await self._respond(writer, 304, headers=response_headers)
+        else:
+            await self._respond(writer, 200, jpeg, 'image/jpeg', response_headers)
 
 if __name__ == '__main__':
     print("Starting ASI Camera Service...")
-    print("Attempting to connect to camera...")
+    start_encoder_pool()
+    print("Attempting to connect to cameras...")
     
-    if camera.connect():
-        print("Camera connected successfully!")
+    connected = connect_cameras()
+    if connected:
+        print(f"{connected} camera(s) connected successfully!")
     else:
-        print(f"Failed to connect to camera: {camera_state['error']}")
+        print(f"Failed to connect to camera: {get_camera().state['error']}")
         print("Service will start anyway, you can try connecting via API")
     
+    if METEOR_DETECTION:
+        role_camera('meteorCam').meteor_detector.start()
+    
+    status_sampler.start()
+    
+    if ASYNC_STREAM_PORT:
+        AsyncStreamServer(ASYNC_STREAM_PORT).start()
+    
     print("Starting HTTP server on port 8080...")
     app.run(host='0.0.0.0', port=8080, debug=False, threaded=True)
 